@@ -0,0 +1,23 @@
+# ASGI deployment profile:
+#
+#   gunicorn -c gunicorn_asgi.py store.asgi:application
+#
+# The AJAX endpoints (get_subcategories, filter_listings, search_suggestions)
+# are async views, so under ASGI a slow database round trip doesn't hold a
+# worker thread. Sync views still run in a thread per request.
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = 'uvicorn_worker.UvicornWorker'
+# One event loop per core, each serves many requests at once
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+keepalive = 5
+graceful_timeout = 30
+timeout = 60
+# Load the app before forking, store.asgi freezes startup objects for the GC
+preload_app = True
+
+# Connections are opened per request thread under ASGI. Keep CONN_MAX_AGE at 0
+# (the default of DATABASE_URL) and put a pooler such as PgBouncer in front of
+# Postgres instead of persistent connections.
@@ -1,6 +1,9 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Category, SubCategory, Listing, ListingImage
+from .models import (
+    User, Category, City, SubCategory, Listing, ListingImage, ListingStatusEvent, ArchivedListing, ArchivedListingImage,
+)
+from . import lifecycle
 
 
 @admin.register(User)
@@ -24,6 +27,15 @@ class CategoryAdmin(admin.ModelAdmin):
 class SubCategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'category', 'slug', 'created_at')
     list_filter = ('category',)
+    list_select_related = ('category',)
+    prepopulated_fields = {'slug': ('name',)}
+
+
+@admin.register(City)
+class CityAdmin(admin.ModelAdmin):
+    list_display = ('name', 'region', 'latitude', 'longitude')
+    list_filter = ('region',)
+    search_fields = ('name', 'name_am', 'slug')
     prepopulated_fields = {'slug': ('name',)}
 
 
@@ -34,7 +46,72 @@ class ListingImageInline(admin.TabularInline):
 
 @admin.register(Listing)
 class ListingAdmin(admin.ModelAdmin):
-    list_display = ('title', 'seller', 'category', 'price', 'condition', 'status', 'view_count', 'created_at')
-    list_filter = ('category', 'condition', 'status', 'created_at')
+    list_display = ('title', 'seller', 'category', 'price', 'condition', 'city', 'status', 'view_count', 'created_at')
+    list_filter = ('category', 'condition', 'status', 'city', 'created_at')
+    list_select_related = ('seller', 'category', 'city')
     search_fields = ('title', 'description')
-    inlines = [ListingImageInline]
\ No newline at end of file
+    inlines = [ListingImageInline]
+    actions = ['mark_available', 'mark_sold', 'mark_removed']
+
+    def move_to(self, request, queryset, status):
+        moved = lifecycle.transition(queryset, status, actor=request.user, source='admin')
+        skipped = queryset.count() - len(moved)
+        self.message_user(request, f"Marked {len(moved)} listing(s) {status}.", messages.SUCCESS)
+        if skipped:
+            self.message_user(request, f"Skipped {skipped} that can't be marked {status}.", messages.WARNING)
+
+    @admin.action(description='Mark selected listings available')
+    def mark_available(self, request, queryset):
+        self.move_to(request, queryset, 'available')
+
+    @admin.action(description='Mark selected listings sold')
+    def mark_sold(self, request, queryset):
+        self.move_to(request, queryset, 'sold')
+
+    @admin.action(description='Mark selected listings removed')
+    def mark_removed(self, request, queryset):
+        self.move_to(request, queryset, 'removed')
+
+
+@admin.register(ListingStatusEvent)
+class ListingStatusEventAdmin(admin.ModelAdmin):
+    """Read only, the log is append-only"""
+    # By id: the events of archived listings outlive their Listing row, a
+    # join would drop them and the related object would fail to load
+    list_display = ('listing_id', 'from_status', 'to_status', 'actor', 'source', 'created_at')
+    list_filter = ('to_status', 'source', 'created_at')
+    list_select_related = ('actor',)
+    search_fields = ('=listing_id',)
+    raw_id_fields = ('actor',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class ArchivedListingImageInline(admin.TabularInline):
+    model = ArchivedListingImage
+    extra = 0
+    can_delete = False
+    readonly_fields = ('public_id', 'is_primary', 'created_at', 'purged_at')
+
+
+@admin.register(ArchivedListing)
+class ArchivedListingAdmin(admin.ModelAdmin):
+    """Read only, written by expire_listings"""
+    list_display = ('title', 'seller', 'category', 'price', 'status', 'updated_at', 'archived_at')
+    list_filter = ('status', 'category', 'archived_at')
+    list_select_related = ('seller', 'category')
+    search_fields = ('title',)
+    inlines = [ArchivedListingImageInline]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
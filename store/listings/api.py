@@ -0,0 +1,76 @@
+import hashlib
+
+from django.utils.http import quote_etag
+
+from .models import Listing
+
+API_VERSION = 1
+# Record field: the columns it needs
+LISTING_FIELDS = {
+    'id': ('id',),
+    'title': ('title',),
+    'price': ('price',),
+    'condition': ('condition',),
+    'thumbnail_url': ('thumbnail_url',),
+    'category_id': ('category_id',),
+    'created_at': ('created_at',),
+}
+# Keyset cursors read the sort columns, so they are always loaded
+SORT_COLUMNS = ('id', 'price', 'created_at')
+DEFAULT_LIMIT = 24
+MAX_LIMIT = 100
+
+
+def parse_fields(value):
+    """The requested record fields, in LISTING_FIELDS order. All of them by default."""
+    if not value:
+        return tuple(LISTING_FIELDS)
+    requested = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = requested - set(LISTING_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(field for field in LISTING_FIELDS if field in requested)
+
+
+def parse_limit(value):
+    if not value:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError('limit must be a number')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def listing_queryset(fields):
+    """Available listings loading only the columns the fields need"""
+    columns = set(SORT_COLUMNS)
+    for field in fields:
+        columns.update(LISTING_FIELDS[field])
+    return Listing.objects.available().only(*columns)
+
+
+def records(listings, fields):
+    """Compact dicts of `fields` for each listing"""
+    results = []
+    for listing in listings:
+        record = {}
+        for field in fields:
+            if field == 'created_at':
+                record[field] = listing.created_at.isoformat()
+            else:
+                record[field] = getattr(listing, field)
+        if record.get('thumbnail_url') == '':
+            record['thumbnail_url'] = None
+        results.append(record)
+    return results
+
+
+def result_etag(request, versions):
+    """
+    ETag of a result set, from the query string and the version tokens of
+    the data behind it. Computed without running the query.
+    """
+    signature = '&'.join(f'{key}={value}' for key, value in sorted(request.GET.lists()))
+    digest = hashlib.md5(f"{API_VERSION}|{'|'.join(versions)}|{signature}".encode('utf-8')).hexdigest()
+    return quote_etag(digest)
@@ -0,0 +1,234 @@
+import asyncio
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Listing
+from .taxonomy import get_taxonomy
+
+ENDPOINTS = (
+    'home', 'listings_view', 'filter_listings', 'search_suggestions', 'listing_detail', 'get_subcategories',
+)
+XHR = {'X-Requested-With': 'XMLHttpRequest'}
+SORTS = ['newest', 'oldest', 'price_low', 'price_high']
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class RequestMix:
+    """
+    Seeded, repeatable requests for each benchmarked endpoint, spread over
+    the taxonomy, filter combinations and listings the way visitors do.
+    """
+
+    def __init__(self, seed=42, sample_size=500):
+        self.rng = random.Random(seed)
+        taxonomy = get_taxonomy()
+        self.categories = [category for category in taxonomy.categories if category.subcategories]
+        if not self.categories:
+            raise ValueError('No categories to benchmark, run seed_marketplace first')
+        self.words = sorted({
+            word.lower() for node in taxonomy.subcategories for word in node.name.split() if len(word) > 3
+        })
+        ids = list(Listing.objects.available().values_list('pk', flat=True).order_by('?')[:sample_size])
+        if not ids:
+            raise ValueError('No available listings to benchmark, run seed_marketplace first')
+        self.listing_ids = sorted(ids)
+
+    def filters(self):
+        rng = self.rng
+        params = {}
+        if rng.random() < 0.6:
+            category = rng.choice(self.categories)
+            params['category'] = category.id
+            if rng.random() < 0.5:
+                params['subcategory'] = rng.choice(category.subcategories).id
+        if rng.random() < 0.2:
+            params['condition'] = rng.choice(['new', 'used'])
+        if rng.random() < 0.2:
+            low = rng.choice([0, 100, 1000, 10000])
+            params.update(min_price=low, max_price=low * 10 or 500)
+        if rng.random() < 0.15:
+            params['search'] = rng.choice(self.words)
+        else:
+            params['sort_by'] = rng.choice(SORTS)
+        return params
+
+    def request(self, endpoint):
+        """`(path, params, headers)` for one request to `endpoint`"""
+        rng = self.rng
+        if endpoint == 'home':
+            return reverse('home'), {}, {}
+        if endpoint == 'listings_view':
+            return reverse('listings'), self.filters(), {}
+        if endpoint == 'filter_listings':
+            return reverse('filter_listings'), self.filters(), XHR
+        if endpoint == 'search_suggestions':
+            word = rng.choice(self.words)
+            return reverse('search_suggestions'), {'q': word[:rng.randint(2, len(word))]}, XHR
+        if endpoint == 'listing_detail':
+            return reverse('listing_detail', args=[rng.choice(self.listing_ids)]), {}, {}
+        if endpoint == 'get_subcategories':
+            return reverse('get_subcategories'), {'category_id': rng.choice(self.categories).id}, XHR
+        raise ValueError(f'Unknown endpoint {endpoint!r}')
+
+
+def timed(client, request):
+    path, params, headers = request
+    started = time.perf_counter()
+    response = client.get(path, params, headers=headers)
+    return (time.perf_counter() - started) * 1000, response.status_code
+
+
+def profiled(client, request):
+    """Queries and peak allocated KiB of one request"""
+    path, params, headers = request
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    with CaptureQueriesContext(connection) as ctx:
+        client.get(path, params, headers=headers)
+    peak = tracemalloc.get_traced_memory()[1]
+    return len(ctx.captured_queries), (peak - before) / 1024
+
+
+def run_endpoint(client, mix, endpoint, requests, warmup, profile_samples):
+    for _ in range(warmup):
+        timed(client, mix.request(endpoint))
+
+    latencies, errors = [], 0
+    for _ in range(requests):
+        latency, status = timed(client, mix.request(endpoint))
+        latencies.append(latency)
+        errors += status != 200
+
+    # Separate pass, tracing and query capture would skew the timings
+    queries, allocations = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(profile_samples):
+            count, kib = profiled(client, mix.request(endpoint))
+            queries.append(count)
+            allocations.append(kib)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'requests': requests,
+        'errors': errors,
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(max(latencies), 3),
+        'queries_mean': round(sum(queries) / len(queries), 2) if queries else None,
+        'queries_max': max(queries) if queries else None,
+        'alloc_kib_p50': round(percentile(allocations, 50), 1) if allocations else None,
+        'alloc_kib_max': round(max(allocations), 1) if allocations else None,
+    }
+
+
+def summarize_load(results, elapsed, concurrency):
+    latencies = [latency for latency, _ in results]
+    return {
+        'concurrency': concurrency,
+        'requests': len(results),
+        'errors': sum(1 for _, status in results if status != 200),
+        'throughput_rps': round(len(results) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+    }
+
+
+def run_wsgi_load(requests, concurrency):
+    """Send `requests` through the WSGI handler from `concurrency` threads"""
+    local = threading.local()
+
+    def send(request):
+        if not hasattr(local, 'client'):
+            local.client = Client()
+        return timed(local.client, request)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, requests))
+    return summarize_load(results, time.perf_counter() - started, concurrency)
+
+
+async def run_asgi_load(requests, concurrency):
+    """Send `requests` through the ASGI handler, `concurrency` at a time"""
+    client = AsyncClient()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def send(request):
+        path, params, headers = request
+        async with slots:
+            started = time.perf_counter()
+            response = await client.get(path, params, headers=headers)
+            return (time.perf_counter() - started) * 1000, response.status_code
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(send(request) for request in requests))
+    return summarize_load(results, time.perf_counter() - started, concurrency)
+
+
+def simulated_latency(seconds):
+    """Execute wrapper adding a network round trip to every query"""
+    def wrapper(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+    return wrapper
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        'revision': git_revision(),
+        'database': connection.vendor,
+        'listings': Listing.objects.count(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'platform': sys.platform,
+    }
+
+
+def compare(baseline, current, tolerance):
+    """Regressions of `current` against `baseline`, as readable strings"""
+    regressions = []
+    for endpoint, result in current['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(endpoint)
+        if before is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'alloc_kib_p50'):
+            old, new = before.get(metric), result.get(metric)
+            if old and new and new > old * (1 + tolerance / 100):
+                regressions.append(f'{endpoint} {metric}: {old} -> {new}')
+        old, new = before.get('queries_max'), result.get('queries_max')
+        if old is not None and new is not None and new > old:
+            regressions.append(f'{endpoint} queries_max: {old} -> {new}')
+    return regressions
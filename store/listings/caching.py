@@ -0,0 +1,164 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import parse_http_date_safe, quote_etag
+
+from .taxonomy import TAXONOMY_VERSION_KEY, new_version
+
+LISTINGS_VERSION_KEY = 'listings:version'
+# Responses differ by language and by whether the visitor is signed in
+VARY_ON = ('Cookie', 'Accept-Language')
+
+
+def listing_version_key(listing_id):
+    return f'listing:{listing_id}:version'
+
+
+def get_versions(*keys):
+    """Current version tokens for these keys, in one cache round trip"""
+    found = cache.get_many(keys)
+    missing = {key: new_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+async def aget_versions(*keys):
+    """get_versions() for async views"""
+    found = await cache.aget_many(keys)
+    missing = {key: new_version() for key in keys if key not in found}
+    if missing:
+        await cache.aset_many(missing, None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def invalidate_listing(listing_id):
+    """Expire cached pages showing any listing, and those of this one"""
+    cache.set_many({
+        LISTINGS_VERSION_KEY: new_version(),
+        listing_version_key(listing_id): new_version(),
+    }, None)
+
+
+def invalidate_listings(listing_ids=()):
+    """
+    Expire cached pages showing any listing, and those of `listing_ids`, in
+    one cache round trip, after bulk writes that skip the signals
+    """
+    versions = {listing_version_key(listing_id): new_version() for listing_id in listing_ids}
+    versions[LISTINGS_VERSION_KEY] = new_version()
+    cache.set_many(versions, None)
+
+
+def listings_versions(request, *args, **kwargs):
+    return [LISTINGS_VERSION_KEY]
+
+
+def cacheable(request):
+    return (
+        request.method == 'GET'
+        and not request.user.is_authenticated
+        # Pending flash messages are rendered into the page
+        and not len(messages.get_messages(request))
+    )
+
+
+def page_key(request, versions):
+    url = hashlib.md5(request.build_absolute_uri().encode('utf-8')).hexdigest()
+    return f"page:{request.LANGUAGE_CODE}:{':'.join(versions)}:{url}"
+
+
+def cache_anonymous_page(version_keys=listings_versions, on_hit=None):
+    """
+    Cache a view's full response for anonymous visitors. The key includes the
+    language and the version tokens of `version_keys(request, *args, **kwargs)`
+    (plus the taxonomy's), so bumping a version expires every page built from
+    it. `on_hit` runs for requests served from the cache.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not cacheable(request):
+                response = view(request, *args, **kwargs)
+                patch_vary_headers(response, VARY_ON)
+                return response
+
+            keys = version_keys(request, *args, **kwargs) + [TAXONOMY_VERSION_KEY]
+            key = page_key(request, get_versions(*keys))
+            response = cache.get(key)
+            if response is not None:
+                if on_hit is not None:
+                    on_hit(request, *args, **kwargs)
+                return response
+
+            response = view(request, *args, **kwargs)
+            patch_vary_headers(response, VARY_ON)
+            if (
+                response.status_code == 200
+                and not response.streaming
+                and not response.cookies
+                and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+            ):
+                cache.set(key, response, getattr(settings, 'PAGE_CACHE_TIMEOUT', 60))
+            return response
+        return wrapper
+    return decorator
+
+
+def page_etag(request, versions):
+    """
+    ETag of a page from the version tokens it was built from, the language
+    and the visitor. It also turns over every PAGE_CACHE_TIMEOUT seconds, so
+    figures that don't bump a version (view counts) are never staler than a
+    cached page.
+    """
+    timeout = getattr(settings, 'PAGE_CACHE_TIMEOUT', 60)
+    window = int(time.time() // timeout) if timeout else 0
+    user = request.user.pk if request.user.is_authenticated else 'anonymous'
+    signature = f"{request.LANGUAGE_CODE}:{user}:{window}:{':'.join(versions)}"
+    return quote_etag(hashlib.md5(signature.encode('utf-8')).hexdigest())
+
+
+def conditional_page(version_keys=listings_versions, on_not_modified=None):
+    """
+    Answer conditional GETs with 304 Not Modified. The ETag comes from the
+    version tokens of `version_keys(request, *args, **kwargs)` and the
+    taxonomy's, like cache_anonymous_page's keys, so a matching If-None-Match
+    is answered without running the view; `on_not_modified` runs for those.
+    A Last-Modified header set by the view is honoured after it has run.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+                return view(request, *args, **kwargs)
+
+            keys = version_keys(request, *args, **kwargs) + [TAXONOMY_VERSION_KEY]
+            etag = page_etag(request, get_versions(*keys))
+            response = get_conditional_response(request, etag=etag)
+            if response is not None:
+                if on_not_modified is not None:
+                    on_not_modified(request, *args, **kwargs)
+            else:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response['ETag'] = etag
+            # Browsers keep the page but check it is current before showing it
+            patch_cache_control(response, no_cache=True, private=request.user.is_authenticated)
+            patch_vary_headers(response, VARY_ON)
+            if response.status_code == 200:
+                last_modified = parse_http_date_safe(response.get('Last-Modified'))
+                response = get_conditional_response(
+                    request, etag=etag, last_modified=last_modified, response=response,
+                )
+            return response
+        return wrapper
+    return decorator
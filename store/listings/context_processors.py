@@ -0,0 +1,10 @@
+from .taxonomy import get_taxonomy
+
+
+def taxonomy(request):
+    """Expose the cached category tree to every template"""
+    tree = get_taxonomy()
+    return {
+        'taxonomy': tree,
+        'categories': tree.categories,
+    }
@@ -0,0 +1,111 @@
+import datetime
+from collections import defaultdict
+
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Listing, SellerDailyStats
+
+COUNTERS = ('views', 'listings_created', 'listings_sold', 'listings_removed', 'seconds_to_sell')
+# Statuses whose transitions are counted, and into which column
+STATUS_COUNTERS = {'sold': 'listings_sold', 'removed': 'listings_removed'}
+DASHBOARD_DAYS = 30
+
+
+def increment(deltas):
+    """
+    Add `{(seller id, date): {counter: n}}` to the daily rows. Rows are
+    created in one INSERT, then updated with one `counter = counter + n`
+    statement per day and distinct set of increments.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if any(delta.values())}
+    if not deltas:
+        return
+    SellerDailyStats.objects.bulk_create(
+        [SellerDailyStats(seller_id=seller_id, date=date) for seller_id, date in deltas],
+        ignore_conflicts=True,
+    )
+    groups = defaultdict(list)
+    for (seller_id, date), delta in deltas.items():
+        groups[date, tuple(sorted(delta.items()))].append(seller_id)
+    for (date, delta), seller_ids in groups.items():
+        SellerDailyStats.objects.filter(date=date, seller_id__in=seller_ids).update(
+            **{counter: F(counter) + n for counter, n in delta}
+        )
+
+
+def record_views(counts):
+    """Credit flushed `{listing id: views}` to the listings' sellers, today"""
+    today = timezone.localdate()
+    deltas = defaultdict(lambda: defaultdict(int))
+    sellers = Listing.objects.filter(pk__in=list(counts)).values_list('pk', 'seller_id').order_by()
+    for listing_id, seller_id in sellers:
+        deltas[seller_id, today]['views'] += counts[listing_id]
+    increment(deltas)
+
+
+def status_deltas(listings, status, when):
+    """Counter increments for `listings` moving to `status` at `when`"""
+    deltas = defaultdict(lambda: defaultdict(int))
+    counter = STATUS_COUNTERS.get(status)
+    if counter is None:
+        return deltas
+    date = timezone.localdate(when)
+    for listing in listings:
+        delta = deltas[listing.seller_id, date]
+        delta[counter] += 1
+        if status == 'sold':
+            delta['seconds_to_sell'] += max(0, int((when - listing.created_at).total_seconds()))
+    return deltas
+
+
+def record_status_change(listing, status, when=None):
+    increment(status_deltas([listing], status, when or timezone.now()))
+
+
+def record_created(listings):
+    today = timezone.localdate()
+    deltas = defaultdict(lambda: defaultdict(int))
+    for listing in listings:
+        deltas[listing.seller_id, today]['listings_created'] += 1
+    increment(deltas)
+
+
+def seller_dashboard(seller, days=DASHBOARD_DAYS):
+    """
+    Totals and a per-day series for the last `days` days, from the seller's
+    daily rows only: one query for the window, one for the all-time totals.
+    """
+    today = timezone.localdate()
+    start = today - datetime.timedelta(days=days - 1)
+    rows = {
+        row['date']: row
+        for row in SellerDailyStats.objects.filter(seller=seller, date__gte=start).values('date', *COUNTERS)
+    }
+    totals = SellerDailyStats.objects.filter(seller=seller).aggregate(
+        **{counter: Sum(counter) for counter in COUNTERS}
+    )
+    totals = {counter: value or 0 for counter, value in totals.items()}
+
+    series = []
+    for offset in range(days):
+        date = start + datetime.timedelta(days=offset)
+        row = rows.get(date, {})
+        series.append({'date': date, 'views': row.get('views', 0), 'sold': row.get('listings_sold', 0)})
+    peak = max([day['views'] for day in series] + [1])
+    for day in series:
+        day['height'] = round(100 * day['views'] / peak)
+
+    window_views = sum(day['views'] for day in series)
+    return {
+        'totals': totals,
+        'views_last_days': window_views,
+        'views_per_day': round(window_views / days, 1),
+        'sold_last_days': sum(day['sold'] for day in series),
+        'days_to_sell': (
+            round(totals['seconds_to_sell'] / totals['listings_sold'] / 86400, 1)
+            if totals['listings_sold'] else None
+        ),
+        'series': series,
+        'days': days,
+    }
@@ -0,0 +1,166 @@
+import hashlib
+import json
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .caching import LISTINGS_VERSION_KEY, get_versions
+from .locations import location_condition
+from .models import Listing
+from .search import get_search_backend
+from .taxonomy import get_taxonomy
+
+# Sorting and paging don't change the counts
+FACET_FIELDS = ('search', 'category', 'subcategory', 'condition', 'min_price', 'max_price', 'city', 'radius')
+# (lower bound, upper bound), None for an open end
+DEFAULT_PRICE_BUCKETS = [(None, 1000), (1000, 5000), (5000, 20000), (20000, 100000), (100000, None)]
+
+
+def price_buckets():
+    buckets = []
+    for low, high in getattr(settings, 'LISTING_PRICE_BUCKETS', DEFAULT_PRICE_BUCKETS):
+        if low is None:
+            label = f'Under ${high:,}'
+        elif high is None:
+            label = f'${low:,}+'
+        else:
+            label = f'${low:,} – ${high:,}'
+        buckets.append({'key': f"{low or ''}-{high or ''}", 'label': label, 'min': low, 'max': high})
+    return buckets
+
+
+def normalize_filters(cleaned_data):
+    """The filters that change facet counts, in a stable, comparable form"""
+    filters = {}
+    for field in FACET_FIELDS:
+        value = cleaned_data.get(field)
+        if value in (None, ''):
+            continue
+        if field == 'search':
+            value = ' '.join(value.lower().split())
+        elif isinstance(value, Decimal):
+            value = format(value.normalize(), 'f')
+        filters[field] = value
+    return filters
+
+
+def filter_conditions(filters):
+    """One Q per facet dimension for the active filters (search excluded)"""
+    conditions = {}
+    if 'category' in filters:
+        conditions['category'] = Q(category=filters['category'])
+    if 'subcategory' in filters:
+        conditions['subcategory'] = Q(subcategory=filters['subcategory'])
+    if 'condition' in filters:
+        conditions['condition'] = Q(condition=filters['condition'])
+    price = Q()
+    if 'min_price' in filters:
+        price &= Q(price__gte=Decimal(filters['min_price']))
+    if 'max_price' in filters:
+        price &= Q(price__lte=Decimal(filters['max_price']))
+    if price:
+        conditions['price'] = price
+    if 'city' in filters:
+        # No location facet, every count is limited to the area
+        conditions['location'] = location_condition(filters['city'], filters.get('radius'))
+    return conditions
+
+
+def except_dimension(conditions, *dimensions):
+    """Every active filter but those of `dimensions`, so a facet lists its alternatives"""
+    q = Q()
+    for dimension, condition in conditions.items():
+        if dimension not in dimensions:
+            q &= condition
+    return q
+
+
+def facet_query(filters, taxonomy):
+    """
+    The queryset and the conditional Count() aggregates that compute every
+    facet in one pass. Each facet ignores its own filter: category counts
+    apply the condition and price filters but not the category one.
+    """
+    listings = Listing.objects.available()
+    if 'search' in filters:
+        listings = get_search_backend().search(listings, filters['search'])
+    conditions = filter_conditions(filters)
+
+    aggregates = {'total': Count('pk', filter=except_dimension(conditions))}
+    others = except_dimension(conditions, 'category', 'subcategory')
+    for category in taxonomy.categories:
+        aggregates[f'category_{category.id}'] = Count('pk', filter=Q(category=category.id) & others)
+
+    # Subcategories are only shown for the selected category
+    if 'category' in filters:
+        subcategories = taxonomy.subcategories_for(filters['category'])
+    else:
+        subcategories = taxonomy.subcategories
+    others = except_dimension(conditions, 'subcategory')
+    for subcategory in subcategories:
+        aggregates[f'subcategory_{subcategory.id}'] = Count('pk', filter=Q(subcategory=subcategory.id) & others)
+
+    others = except_dimension(conditions, 'condition')
+    for value, _ in Listing.CONDITION_CHOICES:
+        aggregates[f'condition_{value}'] = Count('pk', filter=Q(condition=value) & others)
+
+    others = except_dimension(conditions, 'price')
+    for i, bucket in enumerate(price_buckets()):
+        bounds = Q()
+        if bucket['min'] is not None:
+            bounds &= Q(price__gte=bucket['min'])
+        if bucket['max'] is not None:
+            bounds &= Q(price__lt=bucket['max'])
+        aggregates[f'price_{i}'] = Count('pk', filter=bounds & others)
+
+    return listings.order_by(), aggregates, subcategories
+
+
+def build_facets(counts, taxonomy, subcategories):
+    return {
+        'total': counts['total'],
+        'categories': [
+            {'id': category.id, 'name': category.name, 'count': counts[f'category_{category.id}']}
+            for category in taxonomy.categories
+        ],
+        'subcategories': [
+            {'id': subcategory.id, 'name': subcategory.name, 'count': counts[f'subcategory_{subcategory.id}']}
+            for subcategory in subcategories
+        ],
+        'conditions': [
+            {'value': value, 'label': label, 'count': counts[f'condition_{value}']}
+            for value, label in Listing.CONDITION_CHOICES
+        ],
+        'price_buckets': [
+            {**bucket, 'count': counts[f'price_{i}']} for i, bucket in enumerate(price_buckets())
+        ],
+    }
+
+
+def facets_key(filters, taxonomy):
+    signature = json.dumps(filters, sort_keys=True, separators=(',', ':'))
+    digest = hashlib.md5(signature.encode('utf-8')).hexdigest()
+    listings_version, = get_versions(LISTINGS_VERSION_KEY)
+    return f"facets:{listings_version}:{taxonomy.version}:{digest}"
+
+
+def facet_counts(cleaned_data):
+    """
+    Facet counts for a validated ListingSearchForm, cached per filter
+    signature until the listings or the taxonomy change
+    """
+    filters = normalize_filters(cleaned_data)
+    taxonomy = get_taxonomy()
+    key = facets_key(filters, taxonomy)
+    facets = cache.get(key)
+    if facets is None:
+        listings, aggregates, subcategories = facet_query(filters, taxonomy)
+        facets = build_facets(listings.aggregate(**aggregates), taxonomy, subcategories)
+        cache.set(key, facets, getattr(settings, 'FACET_CACHE_TIMEOUT', 60))
+    return facets
+
+
+afacet_counts = sync_to_async(facet_counts)
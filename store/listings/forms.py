@@ -1,7 +1,8 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from .models import User, Listing, ListingImage, Category, SubCategory
-from cloudinary.forms import CloudinaryFileField 
+from .taxonomy import get_taxonomy
+from .uploads import stage
 
 
 class SellerSignUpForm(UserCreationForm):
@@ -26,7 +27,7 @@ class SellerSignUpForm(UserCreationForm):
         return user
 
 
-from django.forms import inlineformset_factory
+from django.forms import BaseInlineFormSet, inlineformset_factory
 
 class ListingForm(forms.ModelForm):
     class Meta:
@@ -41,47 +42,106 @@ class ListingForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields['subcategory'].queryset = SubCategory.objects.none()
+        # Render the options from the cached taxonomy, the querysets only validate
+        self.fields['category'].widget.choices = [('', '---------')] + get_taxonomy().category_choices()
 
         if 'category' in self.data:
             try:
                 category_id = int(self.data.get('category'))
-                self.fields['subcategory'].queryset = SubCategory.objects.filter(category_id=category_id)
+                self.fields['subcategory'].queryset = SubCategory.objects.filter(category_id=category_id).select_related('category')
                 self.fields['subcategory'].widget.attrs.pop('disabled', None)
             except (ValueError, TypeError):
                 pass
         elif self.instance.pk:
-            self.fields['subcategory'].queryset = self.instance.category.subcategories.all()
+            self.fields['subcategory'].queryset = SubCategory.objects.filter(
+                category_id=self.instance.category_id
+            ).select_related('category')
             self.fields['subcategory'].widget.attrs.pop('disabled', None)
 
+
+class ListingImportForm(forms.ModelForm):
+    """
+    ListingForm's rules for one row of a bulk import. Category and
+    subcategory may be ids or slugs and are checked against the cached
+    taxonomy, so validating a row runs no queries.
+    """
+    category = forms.CharField()
+    subcategory = forms.CharField()
+
+    class Meta:
+        model = Listing
+        fields = [field for field in ListingForm.Meta.fields if field not in ('category', 'subcategory')]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if 'category' not in cleaned_data or 'subcategory' not in cleaned_data:
+            return cleaned_data
+        taxonomy = get_taxonomy()
+        category = taxonomy.find_category(cleaned_data['category'])
+        if category is None:
+            self.add_error('category', 'Unknown category.')
+            return cleaned_data
+        subcategory = taxonomy.find_subcategory(category, cleaned_data['subcategory'])
+        if subcategory is None:
+            self.add_error('subcategory', f'Not a subcategory of {category.name}.')
+            return cleaned_data
+        self.instance.category_id = category.id
+        self.instance.subcategory_id = subcategory.id
+        return cleaned_data
+
+
 class ListingImageForm(forms.ModelForm):
-    image = CloudinaryFileField(
-        options={
-            'folder': 'listings',
-            'transformation': {
-                'quality': 'auto:good',
-                'fetch_format': 'auto',
-                'width': 800,
-                'height': 600,
-                'crop': 'limit'
-            }
-        }
-    )
+    # Files are staged locally and uploaded to Cloudinary in the background
+    image = forms.ImageField(required=False)
     
     class Meta:
         model = ListingImage
-        fields = ['image', 'is_primary']
+        fields = ['is_primary']
         widgets = {
             'is_primary': forms.CheckboxInput(attrs={
                 'class': 'is-primary-checkbox'
             })
         }
 
+    def clean(self):
+        cleaned_data = super().clean()
+        if not self.instance.pk and not cleaned_data.get('image'):
+            self.add_error('image', 'Please choose a photo to upload.')
+        return cleaned_data
+
+    def save(self, commit=True):
+        upload = self.cleaned_data.get('image')
+        if upload:
+            self.instance.staged_file = stage(upload)
+            self.instance.status = 'pending'
+            self.instance.attempts = 0
+            self.instance.error = ''
+        return super().save(commit)
+
+class BaseListingImageFormSet(BaseInlineFormSet):
+    def clean(self):
+        super().clean()
+        # Only the first photo ticked as primary stays primary
+        primary = False
+        for form in self.forms:
+            if not form.has_changed() and not form.instance.pk:
+                continue
+            if self.can_delete and self._should_delete_form(form):
+                continue
+            if form.cleaned_data.get('is_primary'):
+                if primary:
+                    form.cleaned_data['is_primary'] = False
+                    form.instance.is_primary = False
+                primary = True
+
+
 # Updated FormSet
 ListingImageFormSet = inlineformset_factory(
     Listing,
     ListingImage,
     form=ListingImageForm,
-    fields=('image', 'is_primary'),
+    formset=BaseListingImageFormSet,
+    fields=('is_primary',),
     extra=1,
     can_delete=True,
     widgets={
@@ -91,14 +151,38 @@ ListingImageFormSet = inlineformset_factory(
     }
 )
 
+def category_choices():
+    return [('', 'Any')] + get_taxonomy().category_choices()
+
+
+def subcategory_choices():
+    return [('', 'Any')] + get_taxonomy().subcategory_choices()
+
+
+def city_choices():
+    return [('', 'Anywhere')] + get_taxonomy().city_choices()
+
+
 class ListingSearchForm(forms.Form):
     search = forms.CharField(max_length=200, required=False)
-    category = forms.ModelChoiceField(queryset=Category.objects.all(), required=False)
-    subcategory = forms.ModelChoiceField(queryset=SubCategory.objects.all(), required=False)
+    # Choices come from the cached taxonomy, cleaned values are ids
+    category = forms.TypedChoiceField(choices=category_choices, coerce=int, empty_value=None, required=False)
+    subcategory = forms.TypedChoiceField(choices=subcategory_choices, coerce=int, empty_value=None, required=False)
     condition = forms.ChoiceField(choices=[('', 'Any')] + Listing.CONDITION_CHOICES, required=False)
     min_price = forms.DecimalField(max_digits=10, decimal_places=2, required=False)
     max_price = forms.DecimalField(max_digits=10, decimal_places=2, required=False)
+    city = forms.TypedChoiceField(choices=city_choices, coerce=int, empty_value=None, required=False)
+    # Kilometres around the city, empty for the city itself
+    radius = forms.TypedChoiceField(choices=[
+        ('', 'Only this city'),
+        (10, 'Within 10 km'),
+        (25, 'Within 25 km'),
+        (50, 'Within 50 km'),
+        (100, 'Within 100 km'),
+        (250, 'Within 250 km'),
+    ], coerce=int, empty_value=None, required=False)
     sort_by = forms.ChoiceField(choices=[
+        ('relevance', 'Best Match'),
         ('newest', 'Newest First'),
         ('oldest', 'Oldest First'),
         ('price_low', 'Price: Low to High'),
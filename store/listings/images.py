@@ -0,0 +1,98 @@
+import threading
+from collections import OrderedDict
+
+import cloudinary
+from django.conf import settings
+from django.core.cache import cache
+
+# One canonical transformation per place an image is shown
+VARIANTS = {
+    'thumb': {'width': 150, 'height': 150, 'crop': 'fill'},
+    'card': {'width': 400, 'height': 300, 'crop': 'fill'},
+    'medium': {'width': 600, 'height': 400, 'crop': 'limit'},
+    'hero': {'width': 1000, 'height': 1000, 'crop': 'limit'},
+}
+COMMON_OPTIONS = {'quality': 'auto:good', 'fetch_format': 'auto', 'secure': True}
+# Pixel densities rendered into srcset
+DENSITIES = (1, 2)
+
+SHARED_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+class VariantURLCache:
+    """Thread-safe LRU of built URLs keyed by (public_id, variant)"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._urls = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            urls = self._urls.get(key)
+            if urls is not None:
+                self._urls.move_to_end(key)
+            return urls
+
+    def set(self, key, urls):
+        with self._lock:
+            self._urls[key] = urls
+            self._urls.move_to_end(key)
+            while len(self._urls) > self.maxsize:
+                self._urls.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._urls.clear()
+
+
+local_urls = VariantURLCache(getattr(settings, 'IMAGE_URL_CACHE_SIZE', 4096))
+
+
+def build_urls(public_id, variant):
+    """URLs for each density of a variant, built offline by the Cloudinary SDK"""
+    options = {**COMMON_OPTIONS, **VARIANTS[variant]}
+    return tuple(
+        cloudinary.CloudinaryImage(public_id).build_url(dpr=f'{density}.0', **options)
+        for density in DENSITIES
+    )
+
+
+def shared_key(public_id, variant):
+    return f'image-url:{variant}:{public_id}'
+
+
+def variant_urls(public_ids, variant):
+    """
+    `{public_id: (1x url, 2x url)}` for a batch of images. Looks in the process
+    LRU, then the shared cache in one round trip, and builds whatever is left.
+    """
+    if variant not in VARIANTS:
+        raise ValueError(f'Unknown image variant {variant!r}')
+    found, missing = {}, []
+    for public_id in set(public_ids):
+        urls = local_urls.get((public_id, variant))
+        if urls is None:
+            missing.append(public_id)
+        else:
+            found[public_id] = urls
+    if missing:
+        shared = cache.get_many([shared_key(public_id, variant) for public_id in missing])
+        built = {}
+        for public_id in missing:
+            urls = shared.get(shared_key(public_id, variant))
+            if urls is None:
+                urls = built[shared_key(public_id, variant)] = build_urls(public_id, variant)
+            found[public_id] = tuple(urls)
+            local_urls.set((public_id, variant), tuple(urls))
+        if built:
+            cache.set_many(built, SHARED_CACHE_TIMEOUT)
+    return found
+
+
+def variant_url(public_id, variant):
+    return variant_urls([public_id], variant)[public_id][0]
+
+
+def srcset(urls):
+    return ', '.join(f'{url} {density}x' for url, density in zip(urls, DENSITIES))
@@ -0,0 +1,188 @@
+import csv
+import io
+import json
+import os
+import re
+import time
+from itertools import islice
+
+from django.core.files import File
+from django.db import transaction
+
+from . import dashboard, recommendations
+from .caching import invalidate_listings
+from .forms import ListingImportForm
+from .locations import city_id_for
+from .models import Listing, ListingImage
+from .search import get_search_backend
+from .stats import listings_created
+from .uploads import is_url, queue, stage
+
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+IMAGE_SEPARATOR = re.compile(r'[|\s]+')
+# Errors kept per import, the rest are only counted
+MAX_ERRORS = 1000
+
+
+def detect_format(filename):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Can't tell the format of {filename}, use a .csv or .jsonl file")
+    return FORMATS[extension]
+
+
+def read_rows(stream, format):
+    """
+    `(line number, row)` for each record of a CSV or JSON Lines text stream,
+    read lazily. Rows that aren't JSON objects come back as None.
+    """
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None
+
+
+def text_stream(binary):
+    """A text view of an uploaded or opened binary file, read as it's consumed"""
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
+
+def image_sources(row):
+    images = row.get('images') or []
+    if isinstance(images, str):
+        images = IMAGE_SEPARATOR.split(images.strip())
+    return [str(image).strip() for image in images if str(image).strip()]
+
+
+class ImportReport:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.processed = 0
+        self.created = 0
+        self.failed = 0
+        self.images = 0
+        self.errors = []
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    def add_error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'processed': self.processed,
+            'created': self.created,
+            'failed': self.failed,
+            'images': self.images,
+            'elapsed': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+
+class ListingImporter:
+    """
+    Creates listings for `seller` from an iterable of `(line, row)` pairs,
+    `chunk_size` rows at a time: each chunk is validated with
+    ListingImportForm, then written with bulk_create in one transaction,
+    and its photos are queued for upload once it commits. Only one chunk is
+    held in memory.
+
+    Images are http(s) URLs, or with `images_dir` also paths below it, which
+    are copied to the staging area first.
+    """
+
+    def __init__(self, seller, chunk_size=500, images_dir=None):
+        self.seller = seller
+        self.chunk_size = chunk_size
+        self.images_dir = os.path.realpath(images_dir) if images_dir else None
+
+    def run(self, rows, report=None):
+        """Import every row, yielding the report after each chunk"""
+        report = report or ImportReport()
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            self.import_chunk(chunk, report)
+            yield report
+
+    def validate(self, line, row):
+        """`(listing, image sources)` for a valid row, or `(None, errors)`"""
+        if row is None:
+            return None, {'__all__': ['Not a JSON object.']}
+        form = ListingImportForm(row)
+        if not form.is_valid():
+            return None, {field: list(messages) for field, messages in form.errors.items()}
+        sources = image_sources(row)
+        for source in sources:
+            if not is_url(source) and self.local_path(source) is None:
+                return None, {'images': [f'{source} is not an http(s) URL or a file in the images directory.']}
+        listing = form.instance
+        listing.seller = self.seller
+        listing.city_id = city_id_for(listing.location)
+        return listing, sources
+
+    def local_path(self, source):
+        if self.images_dir is None:
+            return None
+        path = os.path.realpath(os.path.join(self.images_dir, source))
+        if not path.startswith(self.images_dir + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    def build_image(self, listing, source, position):
+        image = ListingImage(listing=listing, is_primary=position == 0, status='pending')
+        if is_url(source):
+            image.source_url = source
+        else:
+            with open(self.local_path(source), 'rb') as f:
+                image.staged_file = stage(File(f, name=source))
+        return image
+
+    def import_chunk(self, chunk, report):
+        valid = []
+        for line, row in chunk:
+            report.processed += 1
+            listing, result = self.validate(line, row)
+            if listing is None:
+                report.add_error(line, result)
+            else:
+                valid.append((listing, result))
+        if not valid:
+            return
+
+        with transaction.atomic():
+            listings = Listing.objects.bulk_create([listing for listing, _ in valid])
+            images = ListingImage.objects.bulk_create([
+                self.build_image(listing, source, position)
+                for listing, sources in valid
+                for position, source in enumerate(sources)
+            ])
+            # bulk_create skips post_save: index, count, recommend, expire pages and upload explicitly
+            get_search_backend().update_many(listings)
+            listings_created(listings)
+            dashboard.record_created(listings)
+            listing_ids = [listing.pk for listing in listings]
+            transaction.on_commit(lambda: recommendations.refresh_listings(listing_ids), robust=True)
+            transaction.on_commit(invalidate_listings)
+            queue.enqueue(image.pk for image in images)
+        report.created += len(listings)
+        report.images += len(images)
@@ -0,0 +1,232 @@
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger(__name__)
+
+# The recorder of the request being handled. Context variables follow the
+# request into the threads ASGI runs sync views in.
+current_recorder = contextvars.ContextVar('current_recorder', default=None)
+
+IN_LIST = re.compile(r'\bIN \((?:%s, )*%s\)')
+NUMBER = re.compile(r'\b\d+\b')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def fingerprint(sql):
+    """SQL with parameter lists and inlined numbers collapsed, to spot N+1s"""
+    return NUMBER.sub('N', IN_LIST.sub('IN (...)', sql))
+
+
+class RequestRecorder:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.fingerprints = Counter()
+
+    def duplicates(self):
+        return {sql: count for sql, count in self.fingerprints.items() if count > 1}
+
+    def metrics(self, url_name):
+        return {
+            'url_name': url_name,
+            'queries': self.queries,
+            'duplicate_queries': sum(count - 1 for count in self.duplicates().values()),
+            'sql_ms': round(self.sql_time * 1000, 2),
+            'template_ms': round(self.template_time * 1000, 2),
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 2),
+        }
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.sql_time += time.perf_counter() - started
+        recorder.queries += 1
+        recorder.fingerprints[fingerprint(sql)] += 1
+
+
+def install(connection, **kwargs):
+    """
+    Add record_query to a connection's execute wrappers for good. This is the
+    hook connection.execute_wrapper() uses, installed once per connection
+    instead of per request, so it also sees queries made by ASGI's worker
+    threads.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class EndpointStats:
+    """Per-process totals of request metrics, by URL name"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def add(self, metrics):
+        with self._lock:
+            stats = self._stats.setdefault(metrics['url_name'], {
+                'requests': 0, 'queries': 0, 'queries_max': 0, 'sql_ms': 0.0, 'sql_ms_max': 0.0,
+                'duplicate_queries_max': 0, 'over_budget': 0,
+            })
+            stats['requests'] += 1
+            stats['queries'] += metrics['queries']
+            stats['queries_max'] = max(stats['queries_max'], metrics['queries'])
+            stats['sql_ms'] += metrics['sql_ms']
+            stats['sql_ms_max'] = max(stats['sql_ms_max'], metrics['sql_ms'])
+            stats['duplicate_queries_max'] = max(stats['duplicate_queries_max'], metrics['duplicate_queries'])
+            stats['over_budget'] += bool(metrics.get('over_budget'))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: {
+                    **stats,
+                    'queries_mean': round(stats['queries'] / stats['requests'], 2),
+                    'sql_ms_mean': round(stats['sql_ms'] / stats['requests'], 2),
+                }
+                for name, stats in self._stats.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+stats = EndpointStats()
+
+
+def get_budget(url_name):
+    """`{'queries': n, 'sql_ms': ms}` limits for a URL name, or None"""
+    budget = getattr(settings, 'QUERY_BUDGETS', {}).get(url_name)
+    if isinstance(budget, int):
+        return {'queries': budget}
+    return budget
+
+
+def check_budget(metrics):
+    budget = get_budget(metrics['url_name'])
+    if not budget:
+        return
+    over = [
+        f"{metrics[key]} {key} > {limit}"
+        for key, limit in budget.items()
+        if metrics.get(key, 0) > limit
+    ]
+    if not over:
+        return
+    metrics['over_budget'] = True
+    message = f"{metrics['url_name']} is over its query budget: {', '.join(over)}"
+    if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+        raise QueryBudgetExceeded(message)
+    logger.warning(message, extra={'request_metrics': metrics})
+
+
+def server_timing(metrics):
+    return (
+        f'db;dur={metrics["sql_ms"]};desc="{metrics["queries"]} queries, '
+        f'{metrics["duplicate_queries"]} duplicates", '
+        f'tpl;dur={metrics["template_ms"]}, '
+        f'app;dur={metrics["total_ms"]}'
+    )
+
+
+def start():
+    for connection in connections.all():
+        install(connection)
+    recorder = RequestRecorder()
+    return recorder, current_recorder.set(recorder)
+
+
+def finish(request, response, recorder):
+    match = request.resolver_match
+    metrics = recorder.metrics(match.url_name if match and match.url_name else None)
+    response['Server-Timing'] = server_timing(metrics)
+    try:
+        check_budget(metrics)
+    finally:
+        stats.add(metrics)
+        logger.info(
+            '%s %s %s queries=%d duplicates=%d sql=%.1fms templates=%.1fms total=%.1fms',
+            request.method, request.path, metrics['url_name'], metrics['queries'],
+            metrics['duplicate_queries'], metrics['sql_ms'], metrics['template_ms'], metrics['total_ms'],
+            extra={'request_metrics': metrics},
+        )
+    if metrics['duplicate_queries']:
+        logger.debug('Repeated queries on %s: %s', request.path, recorder.duplicates())
+    return response
+
+
+@sync_and_async_middleware
+def query_metrics_middleware(get_response):
+    """
+    Records queries, SQL time, repeated query shapes and template time for
+    each request. They're sent as a Server-Timing header, logged, totalled
+    per URL name and checked against settings.QUERY_BUDGETS.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            recorder, token = start()
+            try:
+                response = await get_response(request)
+            finally:
+                current_recorder.reset(token)
+            return finish(request, response, recorder)
+    else:
+        def middleware(request):
+            recorder, token = start()
+            try:
+                response = get_response(request)
+            finally:
+                current_recorder.reset(token)
+            return finish(request, response, recorder)
+    return middleware
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        recorder = current_recorder.get()
+        if recorder is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            recorder.template_time += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """The Django template engine, adding render time to the request's metrics"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
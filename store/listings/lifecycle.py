@@ -0,0 +1,101 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from . import dashboard, recommendations, stats
+from .caching import invalidate_listings
+from .models import Listing, ListingStatusEvent
+
+# The statuses a listing may move to from each status
+TRANSITIONS = {
+    'available': {'sold', 'removed'},
+    'sold': {'available', 'removed'},
+    'removed': {'available'},
+}
+# Columns read per moved listing, for the log and the counters
+FIELDS = ('id', 'status', 'seller_id', 'category_id', 'subcategory_id', 'price', 'created_at')
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+def can_transition(from_status, to_status):
+    return to_status in TRANSITIONS.get(from_status, ())
+
+
+def sources_of(status):
+    """The statuses listings can move to `status` from"""
+    if status not in TRANSITIONS:
+        raise InvalidTransition(f'{status!r} is not a listing status.')
+    return sorted(source for source, targets in TRANSITIONS.items() if status in targets)
+
+
+def transition(listings, status, actor=None, seller=None, source='', batch_size=500):
+    """
+    Move `listings`, a queryset or ids, to `status`. Those that can't go
+    there from where they are are left alone. Each batch is locked, moved
+    with one `UPDATE ... WHERE status IN (...)` and logged with one
+    bulk_create, then its counters, recommendations and cached pages are
+    updated once. `seller` restricts the move to their listings.
+
+    Returns the ids of the listings moved.
+    """
+    sources = sources_of(status)
+    if not isinstance(listings, QuerySet):
+        listings = Listing.objects.filter(pk__in=list(listings))
+    candidates = listings.filter(status__in=sources).order_by('pk')
+    if seller is not None:
+        candidates = candidates.filter(seller=seller)
+
+    moved, last = [], 0
+    while True:
+        with transaction.atomic():
+            rows = list(candidates.filter(pk__gt=last).select_for_update().values(*FIELDS)[:batch_size])
+            if not rows:
+                break
+            last = rows[-1]['id']
+            now = timezone.now()
+            ids = [row['id'] for row in rows]
+            candidates.filter(pk__in=ids).update(status=status, updated_at=now)
+            ListingStatusEvent.objects.bulk_create([
+                ListingStatusEvent(
+                    listing_id=row['id'], from_status=row['status'], to_status=status,
+                    actor=actor, source=source, created_at=now,
+                )
+                for row in rows
+            ])
+            batch_moved(rows, status, now)
+        moved += ids
+        if len(rows) < batch_size:
+            break
+    return moved
+
+
+def batch_moved(rows, status, when):
+    """
+    update() skips the signals: count, recommend and expire pages for a
+    batch of moved listings, once per batch rather than per row
+    """
+    ids = [row['id'] for row in rows]
+    listings = [
+        Listing(**{field: value for field, value in row.items() if field != 'status'}, status=status)
+        for row in rows
+    ]
+    if status == 'available':
+        stats.listings_created(listings)
+        transaction.on_commit(lambda: recommendations.refresh_listings(ids), robust=True)
+    else:
+        was_available = [row for row in rows if row['status'] == 'available']
+        for category_id, subcategory_id in {(row['category_id'], row['subcategory_id']) for row in was_available}:
+            stats.refresh(category_id, subcategory_id)
+        recommendations.forget([row['id'] for row in was_available])
+    dashboard.increment(dashboard.status_deltas(listings, status, when))
+    invalidate_listings(ids)
+    transaction.on_commit(lambda: invalidate_listings(ids))
+
+
+def log_saved_change(listing, from_status):
+    """Record a status change made by saving the listing itself"""
+    ListingStatusEvent.objects.create(listing=listing, from_status=from_status, to_status=listing.status)
+    dashboard.record_status_change(listing, listing.status)
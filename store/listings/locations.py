@@ -0,0 +1,137 @@
+import math
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Q
+from django.db.models.functions import ACos, Cos, Least, Radians, Sin
+
+from .caching import invalidate_listings
+from .models import City, Listing
+from .taxonomy import get_taxonomy, invalidate_taxonomy
+from .taxonomy_loader import TaxonomyFileError, node_values, read_file
+
+DEFAULT_CITIES_FILE = Path(__file__).resolve().parent / 'data' / 'cities.json'
+EARTH_RADIUS_KM = 6371.0
+# Columns a cities file sets, per city
+FIELDS = ('name', 'name_am', 'region', 'aliases', 'latitude', 'longitude')
+
+
+def city_values(node):
+    values = node_values(node, 'city')
+    del values['icon']
+    coordinates = (node.get('latitude'), node.get('longitude'))
+    if (coordinates[0] is None) != (coordinates[1] is None):
+        raise TaxonomyFileError(f"city {node['slug']}: give both latitude and longitude, or neither")
+    values.update(
+        region=node.get('region') or '',
+        aliases=list(node.get('aliases') or []),
+        latitude=coordinates[0],
+        longitude=coordinates[1],
+    )
+    return values
+
+
+def load_cities(path=DEFAULT_CITIES_FILE):
+    """Create and update the cities of a JSON or YAML file in one bulk upsert. Returns how many."""
+    cities = {node.get('slug'): city_values(node) for node in (read_file(path) or {}).get('cities', [])}
+    with transaction.atomic():
+        City.objects.bulk_create(
+            [City(slug=slug, **values) for slug, values in cities.items()],
+            update_conflicts=True, unique_fields=['slug'], update_fields=list(FIELDS),
+        )
+        # Bulk writes skip the signals that expire the cached taxonomy
+        invalidate_taxonomy()
+        transaction.on_commit(invalidate_taxonomy)
+    return len(cities)
+
+
+def city_id_for(location):
+    city = get_taxonomy().match_city(location)
+    return city.id if city else None
+
+
+def assign_cities(listings=None, dry_run=False, batch_size=500):
+    """
+    Point listings at the city their free-text location names. Each
+    distinct location is matched once, and listings are updated with one
+    UPDATE per city and batch of spellings rather than per row.
+
+    Returns `({city id: listings}, Counter({unmatched location: listings}))`.
+    """
+    if listings is None:
+        listings = Listing.objects.all()
+    taxonomy = get_taxonomy()
+    matched, unmatched = Counter(), Counter()
+    locations = defaultdict(list)
+    for row in listings.order_by().values('location').annotate(count=Count('pk')).iterator():
+        city = taxonomy.match_city(row['location'])
+        if city is None:
+            unmatched[row['location']] += row['count']
+        else:
+            matched[city.id] += row['count']
+            locations[city.id].append(row['location'])
+
+    if not dry_run and locations:
+        with transaction.atomic():
+            for city_id, texts in locations.items():
+                for start in range(0, len(texts), batch_size):
+                    listings.filter(location__in=texts[start:start + batch_size]).exclude(
+                        city_id=city_id,
+                    ).update(city_id=city_id)
+            # update() skips the signals, the location filters' results changed
+            transaction.on_commit(invalidate_listings)
+    return dict(matched), unmatched
+
+
+def bounding_box(latitude, longitude, km):
+    """`(min lat, max lat, min lon, max lon)` of a box containing the circle of `km` around a point"""
+    delta_latitude = math.degrees(km / EARTH_RADIUS_KM)
+    # Meridians converge, a degree of longitude is shorter away from the equator
+    scale = math.cos(math.radians(min(abs(latitude) + delta_latitude, 89.0)))
+    delta_longitude = min(180.0, delta_latitude / scale)
+    return (
+        latitude - delta_latitude, latitude + delta_latitude,
+        longitude - delta_longitude, longitude + delta_longitude,
+    )
+
+
+def distance_km(latitude, longitude, other_latitude, other_longitude):
+    """Great-circle distance between two points"""
+    a = math.sin(math.radians(other_latitude - latitude) / 2) ** 2 + (
+        math.cos(math.radians(latitude)) * math.cos(math.radians(other_latitude))
+        * math.sin(math.radians(other_longitude - longitude) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def cities_within(latitude, longitude, km):
+    """
+    Cities within `km` of a point. The coordinate index narrows them to a
+    bounding box, the exact distance is only computed for those.
+    """
+    min_latitude, max_latitude, min_longitude, max_longitude = bounding_box(latitude, longitude, km)
+    # Spherical law of cosines, clamped against rounding above 1
+    distance = EARTH_RADIUS_KM * ACos(Least(
+        Sin(Radians(F('latitude'))) * math.sin(math.radians(latitude))
+        + Cos(Radians(F('latitude'))) * math.cos(math.radians(latitude))
+        * Cos(Radians(F('longitude')) - math.radians(longitude)),
+        1.0,
+        output_field=FloatField(),
+    ))
+    return City.objects.filter(
+        latitude__range=(min_latitude, max_latitude),
+        longitude__range=(min_longitude, max_longitude),
+    ).annotate(distance=distance).filter(distance__lte=km)
+
+
+def location_condition(city_id, radius=None):
+    """
+    Q for listings in a city, or within `radius` km of it when the city has
+    coordinates. Radius searches select listings by an indexed city id
+    subquery, so they cost the same however many listings each city has.
+    """
+    city = get_taxonomy().city_by_id.get(city_id)
+    if radius and city is not None and city.has_coordinates:
+        return Q(city__in=cities_within(city.latitude, city.longitude, radius).values('pk'))
+    return Q(city=city_id)
@@ -0,0 +1,79 @@
+import gc
+import json
+
+import cloudinary
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+
+from listings.benchmarks import ENDPOINTS, RequestMix, compare, environment, run_endpoint
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the hot endpoints in process and report latency, queries and allocations as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS))
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=20, help='Untimed requests per endpoint first')
+        parser.add_argument('--profile-samples', type=int, default=20,
+                            help='Requests per endpoint traced for queries and allocations')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed of the request mix')
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='Keep the anonymous page cache on (measures cache hits)')
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+        parser.add_argument('--compare', help='Earlier JSON report to check for regressions')
+        parser.add_argument('--tolerance', type=float, default=20.0,
+                            help='Percent a latency or allocation figure may grow before it counts as a regression')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be positive')
+        # URLs are built offline, they only need a cloud name
+        if not cloudinary.config().cloud_name:
+            cloudinary.config(cloud_name='benchmark')
+
+        overrides = {
+            'VIEW_COUNT_FLUSH_INTERVAL': 0,
+            'IMAGE_UPLOAD_BACKEND': 'listings.uploads.FileSystemUploadBackend',
+            'ALLOWED_HOSTS': ['testserver'],
+        }
+        if not options['warm_cache']:
+            overrides['PAGE_CACHE_TIMEOUT'] = 0
+
+        with override_settings(**overrides):
+            cache.clear()
+            try:
+                mix = RequestMix(seed=options['seed'])
+            except ValueError as exc:
+                raise CommandError(exc)
+            client = Client()
+            report = {'environment': environment(), 'settings': {
+                key: options[key] for key in ('requests', 'warmup', 'profile_samples', 'seed', 'warm_cache')
+            }, 'endpoints': {}}
+            for endpoint in options['endpoints']:
+                gc.collect()
+                result = run_endpoint(
+                    client, mix, endpoint, options['requests'], options['warmup'], options['profile_samples'],
+                )
+                report['endpoints'][endpoint] = result
+                self.stderr.write(
+                    f"{endpoint:<20} p50 {result['p50_ms']:>8.2f}ms  p95 {result['p95_ms']:>8.2f}ms  "
+                    f"p99 {result['p99_ms']:>8.2f}ms  queries {result['queries_max']}  "
+                    f"alloc {result['alloc_kib_p50']}KiB  errors {result['errors']}"
+                )
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                regressions = compare(json.load(f), report, options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions:\n  ' + '\n  '.join(regressions))
+            self.stderr.write(self.style.SUCCESS('No regressions against ' + options['compare']))
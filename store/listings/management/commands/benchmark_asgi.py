@@ -0,0 +1,84 @@
+import asyncio
+import json
+
+import cloudinary
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+
+from listings.benchmarks import RequestMix, environment, run_asgi_load, run_wsgi_load, simulated_latency
+
+AJAX_ENDPOINTS = ('filter_listings', 'search_suggestions', 'get_subcategories')
+
+
+class Command(BaseCommand):
+    help = 'Compare throughput of the async AJAX endpoints under the ASGI and WSGI handlers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoints', nargs='+', choices=AJAX_ENDPOINTS, default=list(AJAX_ENDPOINTS))
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and level')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32],
+                            help='In-flight requests (WSGI: threads) to test at')
+        parser.add_argument('--db-latency', type=float, default=0.0,
+                            help='Milliseconds added to every query, to mimic a networked database')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or min(options['concurrency']) < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+        if not cloudinary.config().cloud_name:
+            cloudinary.config(cloud_name='benchmark')
+
+        latency = simulated_latency(options['db_latency'] / 1000) if options['db_latency'] else None
+
+        def add_latency(connection, **kwargs):
+            if latency not in connection.execute_wrappers:
+                connection.execute_wrappers.append(latency)
+
+        if latency:
+            connection_created.connect(add_latency)
+            for connection in connections.all():
+                add_latency(connection)
+
+        overrides = {'VIEW_COUNT_FLUSH_INTERVAL': 0, 'ALLOWED_HOSTS': ['testserver'], 'PAGE_CACHE_TIMEOUT': 0}
+        report = {
+            'environment': environment(),
+            'settings': {key: options[key] for key in ('requests', 'concurrency', 'db_latency', 'seed')},
+            'endpoints': {},
+        }
+        try:
+            with override_settings(**overrides):
+                for endpoint in options['endpoints']:
+                    results = report['endpoints'][endpoint] = {'wsgi': [], 'asgi': []}
+                    for concurrency in options['concurrency']:
+                        for handler in ('wsgi', 'asgi'):
+                            # Same requests for both handlers, and a cold cache
+                            try:
+                                mix = RequestMix(seed=options['seed'])
+                            except ValueError as exc:
+                                raise CommandError(exc)
+                            requests = [mix.request(endpoint) for _ in range(options['requests'])]
+                            cache.clear()
+                            if handler == 'wsgi':
+                                result = run_wsgi_load(requests, concurrency)
+                            else:
+                                result = asyncio.run(run_asgi_load(requests, concurrency))
+                            results[handler].append(result)
+                            self.stderr.write(
+                                f"{endpoint:<20} {handler} x{concurrency:<4} {result['throughput_rps']:>8.1f} req/s  "
+                                f"p50 {result['p50_ms']:>8.2f}ms  p99 {result['p99_ms']:>8.2f}ms  "
+                                f"errors {result['errors']}"
+                            )
+        finally:
+            if latency:
+                connection_created.disconnect(add_latency)
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
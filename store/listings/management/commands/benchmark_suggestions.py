@@ -0,0 +1,77 @@
+import gc
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from listings.benchmarks import percentile
+from listings.models import Category, SubCategory, Listing
+
+
+class Command(BaseCommand):
+    help = 'Load test the search_suggestions endpoint at a fixed request rate'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rps', type=int, default=200, help='Requests per second to send')
+        parser.add_argument('--duration', type=int, default=10, help='Seconds to run for')
+        parser.add_argument('--warmup', type=int, default=2, help='Seconds of unmeasured traffic first')
+        parser.add_argument('--workers', type=int, default=16, help='Concurrent client threads')
+        parser.add_argument('--p99-budget', type=float, default=20.0, help='Fail if p99 exceeds this (ms)')
+
+    def sample_queries(self):
+        names = list(Category.objects.values_list('name', flat=True))
+        names += SubCategory.objects.values_list('name', flat=True)
+        names += Listing.objects.available().values_list('title', flat=True)[:200]
+        queries = {name[:length].lower() for name in names for length in (2, 3, 4, 6) if len(name) >= length}
+        if not queries:
+            raise CommandError('Nothing to query, run create_categories first')
+        return sorted(queries)
+
+    def handle(self, *args, **options):
+        rps, duration = options['rps'], options['duration']
+        queries = itertools.cycle(self.sample_queries())
+        url = reverse('search_suggestions')
+        local = threading.local()
+
+        def send(scheduled, query):
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if not hasattr(local, 'client'):
+                local.client = Client(HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            response = local.client.get(url, {'q': query})
+            # Measured from the scheduled send time so queueing delay counts
+            return (time.perf_counter() - scheduled) * 1000, response.status_code
+
+        def run(executor, seconds):
+            count = rps * seconds
+            started = time.perf_counter()
+            futures = [
+                executor.submit(send, started + i / rps, next(queries))
+                for i in range(count)
+            ]
+            return [future.result() for future in futures], time.perf_counter() - started
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            # Warm up connections, the suggestion index and the URL resolver
+            run(executor, options['warmup'])
+            # Same as store.wsgi: keep startup objects out of the collector's way
+            gc.freeze()
+            results, elapsed = run(executor, duration)
+        total = len(results)
+
+        latencies = [latency for latency, _ in results]
+        errors = sum(1 for _, status in results if status != 200)
+        p99 = percentile(latencies, 99)
+        self.stdout.write(
+            f'{total} requests in {elapsed:.1f}s ({total / elapsed:.0f} req/s), {errors} errors\n'
+            f'p50 {percentile(latencies, 50):.2f}ms  p95 {percentile(latencies, 95):.2f}ms  '
+            f'p99 {p99:.2f}ms  max {max(latencies):.2f}ms'
+        )
+        if errors or p99 > options['p99_budget']:
+            raise CommandError(f"Over budget: p99 {p99:.2f}ms > {options['p99_budget']}ms or errors")
+        self.stdout.write(self.style.SUCCESS('search_suggestions is within budget'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.retention import ExpiryReport, ListingExpirer
+
+
+class Command(BaseCommand):
+    help = (
+        'Mark listings past their retention TTL removed and archive old sold and removed ones, '
+        'in batches that resume where an interrupted run stopped. Run nightly.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Listings moved per transaction')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches, the next run continues')
+        parser.add_argument(
+            '--purge-images', action='store_true', help="Also delete archived listings' photos from the image host",
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        expirer = ListingExpirer(options['batch_size'], options['purge_images'], options['max_batches'])
+        report = ExpiryReport()
+        for report in expirer.run(report):
+            self.stdout.write(
+                f'{report.expired} expired, {report.archived} archived with {report.images} photos, '
+                f'{report.purged} photos purged ({report.rows_per_second:.0f} listings/s)'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Expired {report.expired} and archived {report.archived} listings, purged {report.purged} photos, '
+            f'in {report.elapsed:.1f}s ({report.rows_per_second:.0f} listings/s)'
+        ))
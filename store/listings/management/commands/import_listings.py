@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from listings.imports import ImportReport, ListingImporter, detect_format, read_rows, text_stream
+from listings.models import User
+
+
+class Command(BaseCommand):
+    help = 'Create listings for a seller from a CSV or JSON Lines file, in validated chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='The CSV or JSON Lines file')
+        parser.add_argument('--seller', required=True, help='Username or email of the seller')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Default: from the file extension')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows validated and written together')
+        parser.add_argument('--images-dir', help='Directory that local image paths are relative to')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        seller = User.objects.filter(Q(username=options['seller']) | Q(email=options['seller'])).first()
+        if seller is None:
+            raise CommandError(f"No user {options['seller']}")
+        try:
+            format = options['format'] or detect_format(options['path'])
+            binary = open(options['path'], 'rb')
+        except (OSError, ValueError) as exc:
+            raise CommandError(exc)
+
+        importer = ListingImporter(seller, options['chunk_size'], options['images_dir'])
+        report = ImportReport()
+        reported = 0
+        with text_stream(binary) as stream:
+            try:
+                for report in importer.run(read_rows(stream, format), report):
+                    for error in report.errors[reported:]:
+                        messages = '; '.join(
+                            f'{field}: {" ".join(errors)}' for field, errors in error['errors'].items()
+                        )
+                        self.stderr.write(f"line {error['line']}: {messages}")
+                    reported = len(report.errors)
+                    self.stdout.write(
+                        f'{report.processed} rows, {report.created} created, {report.failed} failed '
+                        f'({report.rows_per_second:.0f} rows/s)'
+                    )
+            except (UnicodeDecodeError, ValueError) as exc:
+                raise CommandError(exc)
+
+        style = self.style.SUCCESS if not report.failed else self.style.WARNING
+        self.stdout.write(style(
+            f'Imported {report.created} of {report.processed} rows, {report.images} photos queued, '
+            f'in {report.elapsed:.1f}s ({report.rows_per_second:.0f} rows/s)'
+        ))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from listings.taxonomy_loader import DEFAULT_TAXONOMY_FILE, TaxonomyFileError, load_taxonomy
+
+
+class Command(BaseCommand):
+    help = 'Create and update categories and subcategories from JSON or YAML taxonomy files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=[str(DEFAULT_TAXONOMY_FILE)],
+                            help='Taxonomy files, later ones override earlier ones (default: the bundled taxonomy)')
+        parser.add_argument('--dry-run', action='store_true', help='Report the changes without writing them')
+
+    def handle(self, *args, **options):
+        try:
+            plan, timings = load_taxonomy(options['paths'], dry_run=options['dry_run'])
+        except (OSError, ValueError, TaxonomyFileError, IntegrityError) as exc:
+            raise CommandError(exc)
+
+        for slug in plan.new_categories:
+            self.stdout.write(f'+ {slug}')
+        for slug in plan.changed_categories:
+            self.stdout.write(f'~ {slug}')
+        for category, slug in plan.new_subcategories:
+            self.stdout.write(f'+ {category}/{slug}')
+        for category, slug in plan.changed_subcategories:
+            self.stdout.write(f'~ {category}/{slug}')
+        for slug in plan.missing_categories:
+            self.stdout.write(f'? {slug} is not in the files, left as is')
+
+        summary = ', '.join(f"{count} {label.replace('_', ' ')}" for label, count in plan.summary().items())
+        timing = ', '.join(f'{phase} {seconds * 1000:.1f}ms' for phase, seconds in timings.items())
+        prefix = 'Dry run, nothing written: ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(f'{prefix}{summary} ({timing})'))
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from listings import locations
+from listings.models import Listing
+from listings.taxonomy import get_taxonomy
+from listings.taxonomy_loader import TaxonomyFileError
+
+
+class Command(BaseCommand):
+    help = "Load the cities and point each listing at the city its free-text location names"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cities', default=str(locations.DEFAULT_CITIES_FILE),
+                            help='JSON or YAML cities file (default: the bundled cities)')
+        parser.add_argument('--missing', action='store_true', help='Only listings without a city yet')
+        parser.add_argument('--dry-run', action='store_true', help='Report the matches without writing them')
+        parser.add_argument('--show-unmatched', type=int, default=20,
+                            help='How many of the most common unmatched locations to list')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if not options['dry_run']:
+            try:
+                count = locations.load_cities(options['cities'])
+            except (OSError, ValueError, TaxonomyFileError, IntegrityError) as exc:
+                raise CommandError(exc)
+            self.stdout.write(f'Loaded {count} cities')
+
+        listings = Listing.objects.filter(city=None) if options['missing'] else Listing.objects.all()
+        matched, unmatched = locations.assign_cities(listings, dry_run=options['dry_run'])
+
+        cities = get_taxonomy().city_by_id
+        for city_id, count in sorted(matched.items(), key=lambda item: -item[1]):
+            self.stdout.write(f'{cities[city_id].name}: {count}')
+        for location, count in unmatched.most_common(options['show_unmatched']):
+            self.stdout.write(f'? {location!r}: {count}')
+
+        prefix = 'Dry run, nothing written: ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}{sum(matched.values())} listings matched to {len(matched)} cities, '
+            f'{sum(unmatched.values())} unmatched, in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from listings.models import Listing, ListingImage
+from listings.uploads import queue, release_stale_claims
+
+
+class Command(BaseCommand):
+    help = 'Upload listing photos still waiting in the staging area, e.g. after a restart'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help='Also retry uploads that ran out of attempts')
+        parser.add_argument(
+            '--refresh-thumbnails', action='store_true',
+            help='Also build the card thumbnail URLs left empty, e.g. by migrating without a Cloudinary cloud name',
+        )
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            ListingImage.objects.filter(status='failed').exclude(staged_file='', source_url='').update(
+                status='pending', attempts=0,
+            )
+        released = release_stale_claims()
+        if released:
+            self.stdout.write(f'{released} uploads released from workers that stopped')
+        # Images the upload pool claims meanwhile are skipped, process() only uploads what it claims
+        image_ids = list(ListingImage.objects.filter(status='pending').values_list('pk', flat=True))
+        ready = failed = 0
+        for image_id in image_ids:
+            image = queue.process(image_id)
+            if image is not None and image.status == 'ready':
+                ready += 1
+            elif image is not None:
+                failed += 1
+        self.stdout.write(self.style.SUCCESS(f'{ready} uploaded, {failed} failed'))
+        if options['refresh_thumbnails']:
+            self.refresh_thumbnails()
+
+    def refresh_thumbnails(self, batch_size=500):
+        missing = Listing.objects.filter(thumbnail_url='').exclude(thumbnail_public_id='').order_by('pk')
+        last = refreshed = 0
+        while True:
+            listing_ids = list(missing.filter(pk__gt=last).values_list('pk', flat=True)[:batch_size])
+            if not listing_ids:
+                break
+            last = listing_ids[-1]
+            Listing.objects.filter(pk__in=listing_ids).refresh_primary_images(touch=True)
+            refreshed += len(listing_ids)
+        self.stdout.write(self.style.SUCCESS(f'{refreshed} thumbnail URLs refreshed'))
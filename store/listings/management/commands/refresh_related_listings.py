@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from listings import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Recompute the precomputed related listings, for every available listing or the given ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('listing_ids', nargs='*', type=int, help='Only refresh these listings')
+        parser.add_argument('--batch-size', type=int, default=500, help='Listings written per transaction')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        started = time.perf_counter()
+        if options['listing_ids']:
+            recommendations.refresh_listings(options['listing_ids'])
+            done = len(options['listing_ids'])
+        else:
+            def progress(done):
+                rate = done / (time.perf_counter() - started)
+                self.stdout.write(f'{done} listings ({rate:.0f}/s)')
+
+            done = recommendations.rebuild(options['batch_size'], progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed related listings of {done} listings in {time.perf_counter() - started:.1f}s'
+        ))
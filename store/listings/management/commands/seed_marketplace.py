@@ -0,0 +1,147 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+import cloudinary
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from listings.models import City, User, SubCategory, Listing, ListingImage
+from listings import locations, recommendations, stats
+from listings.search import get_search_backend
+
+LOCATIONS = [
+    'Addis Ababa', 'Adama', 'Bahir Dar', 'Dire Dawa', 'Gondar', 'Hawassa',
+    'Jimma', 'Mekelle', 'Dessie', 'Harar', 'Debre Birhan', 'Arba Minch',
+]
+ADJECTIVES = ['Clean', 'Like new', 'Cheap', 'Original', 'Slightly used', 'Brand new', 'Urgent sale', 'Quality']
+DETAILS = [
+    'Works perfectly', 'Comes with the original box', 'Minor scratches on the side',
+    'Price is negotiable', 'Pickup only', 'Can deliver within the city', 'Bought last year',
+]
+# Most listings stay available, as on the live site
+STATUS_WEIGHTS = [('available', 85), ('sold', 10), ('removed', 5)]
+
+
+@contextmanager
+def explicit_created_at():
+    """Let bulk_create keep the spread-out created_at values we assign"""
+    field = Listing._meta.get_field('created_at')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = 'Seed users, listings and images for benchmarking (no Cloudinary uploads)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=10000, help='Listings to create')
+        parser.add_argument('--users', type=int, default=None, help='Sellers to create (default listings / 20)')
+        parser.add_argument('--images', type=int, default=2, help='Images per listing')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, for reproducible data')
+        parser.add_argument('--days', type=int, default=365, help='Spread created_at over this many days')
+        parser.add_argument('--clear', action='store_true', help='Delete previously seeded data first')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        total = options['listings']
+        batch_size = options['batch_size']
+        if total < 1 or batch_size < 1:
+            raise CommandError('--listings and --batch-size must be positive')
+        # Thumbnail URLs are built offline, they only need a cloud name
+        if not cloudinary.config().cloud_name:
+            cloudinary.config(cloud_name='benchmark')
+
+        if options['clear']:
+            User.objects.filter(username__startswith='bench-').delete()
+        if not SubCategory.objects.exists():
+            call_command('create_categories', stdout=self.stdout)
+        if not City.objects.exists():
+            locations.load_cities()
+        subcategories = list(SubCategory.objects.select_related('category'))
+        if not subcategories:
+            raise CommandError('No subcategories to seed listings into')
+
+        started = time.perf_counter()
+        sellers = self.create_users(options['users'] or max(1, total // 20), batch_size)
+        now = timezone.now()
+        span = options['days'] * 24 * 60 * 60
+        backend = get_search_backend()
+        created = 0
+        with explicit_created_at():
+            while created < total:
+                count = min(batch_size, total - created)
+                with transaction.atomic():
+                    listings = Listing.objects.bulk_create([
+                        self.build_listing(rng, created + i, subcategories, sellers, now, span)
+                        for i in range(count)
+                    ])
+                    ListingImage.objects.bulk_create([
+                        ListingImage(
+                            listing_id=listing.pk,
+                            image=f'listings/bench-{listing.pk}-{n}',
+                            is_primary=(n == 0),
+                        )
+                        for listing in listings
+                        for n in range(options['images'])
+                    ], batch_size=batch_size)
+                    # bulk_create skips post_save, so index and point at the photos explicitly
+                    backend.update_many(listings)
+                    Listing.objects.filter(pk__in=[listing.pk for listing in listings]).refresh_primary_images()
+                created += count
+                rate = created / (time.perf_counter() - started)
+                self.stdout.write(f'{created}/{total} listings ({rate:.0f}/s)')
+
+        self.stdout.write('Computing related listings')
+        recommendations.rebuild()
+        stats.rebuild()
+
+        # Counts, pages and fragments cached before the seed are all stale now
+        cache.clear()
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(sellers)} sellers and {total} listings in {time.perf_counter() - started:.1f}s'
+        ))
+
+    def create_users(self, count, batch_size):
+        existing = User.objects.filter(username__startswith='bench-').count()
+        password = make_password('benchmark')
+        User.objects.bulk_create([
+            User(
+                username=f'bench-{i}', email=f'bench-{i}@example.com', password=password,
+                telegram_username=f'bench{i}', location=LOCATIONS[i % len(LOCATIONS)],
+            )
+            for i in range(existing, count)
+        ], batch_size=batch_size)
+        return list(User.objects.filter(username__startswith='bench-').values_list('pk', flat=True)[:count])
+
+    def build_listing(self, rng, n, subcategories, sellers, now, span):
+        subcategory = rng.choice(subcategories)
+        status = rng.choices([s for s, _ in STATUS_WEIGHTS], [w for _, w in STATUS_WEIGHTS])[0]
+        title = f'{rng.choice(ADJECTIVES)} {subcategory.name.lower()} {n}'
+        listing = Listing(
+            title=title,
+            description=f'{title}. {rng.choice(DETAILS)}. {rng.choice(DETAILS)}.',
+            # Log-uniform, so cheap items outnumber expensive ones
+            price=Decimal(round(10 ** rng.uniform(1, 6), 2)).quantize(Decimal('0.01')),
+            category_id=subcategory.category_id,
+            subcategory_id=subcategory.pk,
+            condition=rng.choice(['new', 'used']),
+            location=rng.choice(LOCATIONS),
+            contact_telegram='@seller',
+            seller_id=rng.choice(sellers),
+            status=status,
+            view_count=min(int(rng.paretovariate(1.5)) - 1, 100000),
+            created_at=now - timedelta(seconds=rng.randrange(span)),
+        )
+        listing.city_id = locations.city_id_for(listing.location)
+        return listing
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:44
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        config = getattr(settings, 'LISTING_SEARCH_CONFIG', 'english')
+        schema_editor.execute(
+            "UPDATE listings_listing SET search_vector = "
+            "setweight(to_tsvector(%s::regconfig, coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector(%s::regconfig, coalesce(description, '')), 'B')",
+            params=[config, config],
+        )
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS listings_listing_search_gin '
+            'ON listings_listing USING gin (search_vector)'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS listings_listing_fts '
+            "USING fts5(title, description, tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            'INSERT INTO listings_listing_fts (rowid, title, description) '
+            'SELECT id, title, description FROM listings_listing'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS listings_listing_search_gin')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS listings_listing_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0002_subcategory_icon'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
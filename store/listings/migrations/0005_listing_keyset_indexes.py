@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0004_listing_title_trigram'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='listing_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['status', 'price', 'id'], name='listing_status_price_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0005_listing_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('status', 'available')), fields=['category', '-created_at', '-id'], name='listing_avail_cat_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('status', 'available')), fields=['category', 'price', 'id'], name='listing_avail_cat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('status', 'available')), fields=['subcategory', '-created_at', '-id'], name='listing_avail_sub_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('status', 'available')), fields=['subcategory', 'price', 'id'], name='listing_avail_sub_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('status', 'available')), fields=['condition', '-created_at', '-id'], name='listing_avail_cond_created_idx'),
+        ),
+    ]
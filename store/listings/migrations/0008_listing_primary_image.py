@@ -0,0 +1,100 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:15
+
+import cloudinary
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 1000
+
+
+# listings.images.VARIANTS['thumb'] and COMMON_OPTIONS as of this migration,
+# copied so that later changes to the app can't break it
+THUMBNAIL_OPTIONS = {
+    'width': 150, 'height': 150, 'crop': 'fill', 'quality': 'auto:good', 'fetch_format': 'auto', 'secure': True,
+}
+
+
+def thumbnail_url(public_id):
+    # Without a cloud name the URLs are left empty, and filled in by
+    # process_image_uploads --refresh-thumbnails once one is configured
+    if not public_id or not cloudinary.config().cloud_name:
+        return ''
+    return cloudinary.CloudinaryImage(public_id).build_url(dpr='1.0', **THUMBNAIL_OPTIONS)
+
+
+def backfill_primary_images(apps, schema_editor):
+    """
+    Keep the first of several primary photos, then point every listing at its
+    primary ready photo. One transaction per batch of listings, so a large
+    table isn't locked for the whole backfill.
+    """
+    Listing = apps.get_model('listings', 'Listing')
+    ListingImage = apps.get_model('listings', 'ListingImage')
+    db = schema_editor.connection.alias
+    last_id = 0
+    while True:
+        with transaction.atomic(using=db):
+            listing_ids = list(
+                Listing.objects.using(db).filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE]
+            )
+            if not listing_ids:
+                break
+            primaries, demoted, chosen = set(), [], {}
+            images = ListingImage.objects.using(db).filter(listing_id__in=listing_ids).order_by(
+                'listing_id', '-is_primary', 'pk',
+            ).only('id', 'listing_id', 'image', 'is_primary', 'status')
+            for image in images:
+                if image.is_primary:
+                    if image.listing_id in primaries:
+                        demoted.append(image.pk)
+                    primaries.add(image.listing_id)
+                if image.status == 'ready':
+                    chosen.setdefault(image.listing_id, image)
+            ListingImage.objects.using(db).filter(pk__in=demoted).update(is_primary=False)
+
+            listings = []
+            for listing_id in listing_ids:
+                image = chosen.get(listing_id)
+                public_id = str(image.image) if image and image.image else ''
+                listings.append(Listing(
+                    pk=listing_id,
+                    primary_image=image,
+                    thumbnail_public_id=public_id,
+                    thumbnail_url=thumbnail_url(public_id),
+                ))
+            Listing.objects.using(db).bulk_update(
+                listings, ['primary_image', 'thumbnail_public_id', 'thumbnail_url'], batch_size=500,
+            )
+        last_id = listing_ids[-1]
+
+
+class Migration(migrations.Migration):
+    # The backfill commits batch by batch
+    atomic = False
+
+    dependencies = [
+        ('listings', '0007_listing_image_upload_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='primary_image',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='listings.listingimage'),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='thumbnail_public_id',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='thumbnail_url',
+            field=models.URLField(blank=True, editable=False, max_length=500),
+        ),
+        migrations.RunPython(backfill_primary_images, migrations.RunPython.noop, atomic=False),
+        migrations.AddConstraint(
+            model_name='listingimage',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_primary', True)), fields=('listing',), name='listingimage_one_primary'),
+        ),
+    ]
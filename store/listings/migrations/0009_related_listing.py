@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0008_listing_primary_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedListing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='listings.listing')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommended_with', to='listings.listing')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('listing', 'rank'), name='relatedlisting_listing_rank')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0009_related_listing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='name_am',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='subcategory',
+            name='name_am',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
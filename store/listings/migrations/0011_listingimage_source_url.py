@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0010_taxonomy_amharic_names'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listingimage',
+            name='source_url',
+            field=models.URLField(blank=True, max_length=500),
+        ),
+    ]
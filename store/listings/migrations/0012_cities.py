@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0011_listingimage_source_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='City',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('name_am', models.CharField(blank=True, max_length=100)),
+                ('slug', models.SlugField(unique=True)),
+                ('region', models.CharField(blank=True, max_length=100)),
+                ('aliases', models.JSONField(blank=True, default=list)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Cities',
+                'ordering': ['name'],
+                'indexes': [models.Index(fields=['latitude', 'longitude'], name='city_coordinates_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='city',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='listings', to='listings.city'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('status', 'available')), fields=['city', '-created_at', '-id'], name='listing_avail_city_created_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+
+def known(*values):
+    return [value for value in values if value is not None]
+
+
+def backfill_category_stats(apps, schema_editor):
+    """Counts and price ranges in one grouped query, medians are left to rebuild_category_stats"""
+    Listing = apps.get_model('listings', 'Listing')
+    CategoryStats = apps.get_model('listings', 'CategoryStats')
+    db = schema_editor.connection.alias
+    groups = Listing.objects.using(db).filter(status='available').order_by().values(
+        'category_id', 'subcategory_id',
+    ).annotate(count=Count('pk'), low=Min('price'), high=Max('price'), newest=Max('created_at'))
+    rows, categories = [], {}
+    for group in groups:
+        rows.append(CategoryStats(
+            category_id=group['category_id'], subcategory_id=group['subcategory_id'],
+            available_count=group['count'], min_price=group['low'], max_price=group['high'],
+            newest_listing_at=group['newest'],
+        ))
+        category = categories.setdefault(group['category_id'], CategoryStats(category_id=group['category_id']))
+        category.available_count += group['count']
+        category.min_price = min(known(category.min_price, group['low']))
+        category.max_price = max(known(category.max_price, group['high']))
+        category.newest_listing_at = max(known(category.newest_listing_at, group['newest']))
+    CategoryStats.objects.using(db).bulk_create(rows + list(categories.values()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0012_cities'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('available_count', models.PositiveIntegerField(default=0)),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('median_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('max_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('newest_listing_at', models.DateTimeField(blank=True, null=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='listings.category')),
+                ('subcategory', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='listings.subcategory')),
+            ],
+            options={
+                'verbose_name_plural': 'Category stats',
+                'constraints': [models.UniqueConstraint(condition=models.Q(('subcategory', None)), fields=('category',), name='categorystats_one_per_category'), models.UniqueConstraint(fields=('subcategory',), name='categorystats_one_per_subcategory')],
+            },
+        ),
+        migrations.RunPython(backfill_category_stats, migrations.RunPython.noop),
+    ]
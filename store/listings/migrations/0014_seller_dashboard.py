@@ -0,0 +1,80 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def backfill_seller_stats(apps, schema_editor):
+    """
+    Seed the daily rows from the listings as they are. Past views were never
+    dated, they are credited to the day each listing was created, and sold
+    listings to the day they were last updated.
+    """
+    Listing = apps.get_model('listings', 'Listing')
+    SellerDailyStats = apps.get_model('listings', 'SellerDailyStats')
+    db = schema_editor.connection.alias
+    days = {}
+
+    def day(seller_id, date):
+        return days.setdefault((seller_id, date), SellerDailyStats(seller_id=seller_id, date=date))
+
+    created = Listing.objects.using(db).annotate(day=TruncDate('created_at')).order_by().values(
+        'seller_id', 'day',
+    ).annotate(count=Count('pk'), views=Sum('view_count'))
+    for group in created:
+        row = day(group['seller_id'], group['day'])
+        row.listings_created, row.views = group['count'], group['views'] or 0
+
+    sold = Listing.objects.using(db).filter(status='sold').values_list('seller_id', 'created_at', 'updated_at')
+    for seller_id, created_at, updated_at in sold.iterator(chunk_size=2000):
+        row = day(seller_id, timezone.localdate(updated_at))
+        row.listings_sold += 1
+        row.seconds_to_sell += max(0, int((updated_at - created_at).total_seconds()))
+    SellerDailyStats.objects.using(db).bulk_create(days.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0013_category_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SellerDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('listings_created', models.PositiveIntegerField(default=0)),
+                ('listings_sold', models.PositiveIntegerField(default=0)),
+                ('listings_removed', models.PositiveIntegerField(default=0)),
+                ('seconds_to_sell', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Seller daily stats',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['seller', '-created_at', '-id'], name='listing_seller_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['seller', 'status', '-created_at', '-id'], name='listing_seller_status_idx'),
+        ),
+        migrations.AddField(
+            model_name='sellerdailystats',
+            name='seller',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='sellerdailystats',
+            constraint=models.UniqueConstraint(fields=('seller', 'date'), name='sellerdailystats_seller_date'),
+        ),
+        migrations.RunPython(backfill_seller_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:41
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0014_seller_dashboard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingStatusEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(choices=[('available', 'Available'), ('sold', 'Sold'), ('removed', 'Removed')], max_length=10)),
+                ('to_status', models.CharField(choices=[('available', 'Available'), ('sold', 'Sold'), ('removed', 'Removed')], max_length=10)),
+                ('source', models.CharField(blank=True, max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_events', to='listings.listing')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['listing', 'created_at'], name='statusevent_listing_idx')],
+            },
+        ),
+    ]
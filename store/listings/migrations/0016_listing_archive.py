@@ -0,0 +1,81 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:44
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0015_listing_status_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedListing',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=200)),
+                ('description', models.TextField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('condition', models.CharField(choices=[('new', 'New'), ('used', 'Used')], max_length=10)),
+                ('location', models.CharField(max_length=200)),
+                ('contact_telegram', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('available', 'Available'), ('sold', 'Sold'), ('removed', 'Removed')], max_length=10)),
+                ('view_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedListingImage',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('public_id', models.CharField(blank=True, max_length=255)),
+                ('is_primary', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField()),
+                ('purged_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='listingstatusevent',
+            name='listing',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='status_events', to='listings.listing'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['status', 'updated_at', 'id'], name='listing_status_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedlisting',
+            name='category',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='listings.category'),
+        ),
+        migrations.AddField(
+            model_name='archivedlisting',
+            name='city',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='listings.city'),
+        ),
+        migrations.AddField(
+            model_name='archivedlisting',
+            name='seller',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_listings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedlisting',
+            name='subcategory',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='listings.subcategory'),
+        ),
+        migrations.AddField(
+            model_name='archivedlistingimage',
+            name='listing',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='images', to='listings.archivedlisting'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedlistingimage',
+            index=models.Index(condition=models.Q(('purged_at', None)), fields=['id'], name='archivedimage_unpurged_idx'),
+        ),
+    ]
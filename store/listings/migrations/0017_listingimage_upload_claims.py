@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0016_listing_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listingimage',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='listingimage',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('uploading', 'Uploading'), ('ready', 'Ready'), ('failed', 'Failed')], default='ready', max_length=10),
+        ),
+    ]
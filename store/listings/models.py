@@ -1,9 +1,12 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.search import SearchVectorField
 from django.urls import reverse
-import cloudinary
+from django.utils import timezone
 from cloudinary.models import CloudinaryField
 
+from .images import variant_url, variant_urls
+
 class User(AbstractUser):
     email = models.EmailField(unique=True)
     telegram_username = models.CharField(max_length=100, blank=True)
@@ -16,6 +19,8 @@ class User(AbstractUser):
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
+    # Amharic name, shown instead of `name` when the site is in Amharic
+    name_am = models.CharField(max_length=100, blank=True)
     slug = models.SlugField(unique=True)
     icon = models.CharField(max_length=50, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -30,6 +35,7 @@ class Category(models.Model):
 class SubCategory(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='subcategories')
     name = models.CharField(max_length=100)
+    name_am = models.CharField(max_length=100, blank=True)
     slug = models.SlugField()
     icon = models.CharField(max_length=50, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -42,6 +48,70 @@ class SubCategory(models.Model):
     def __str__(self):
         return f"{self.category.name} → {self.name}"
 
+class City(models.Model):
+    """A place listings are normalized to, see listings.locations"""
+    name = models.CharField(max_length=100)
+    name_am = models.CharField(max_length=100, blank=True)
+    slug = models.SlugField(unique=True)
+    region = models.CharField(max_length=100, blank=True)
+    # Other spellings and neighbourhoods that mean this city
+    aliases = models.JSONField(default=list, blank=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'Cities'
+        ordering = ['name']
+        indexes = [
+            # Bounding box prefilter of the "within N km" search
+            models.Index(fields=['latitude', 'longitude'], name='city_coordinates_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name}, {self.region}" if self.region else self.name
+
+# Listing columns (attnames) a loaded row needs for listings.stats to tell what a save
+# changes. listings.signals.STATS_UPDATE_FIELDS are the field names whose saves it handles.
+STATS_COLUMNS = frozenset(['status', 'category_id', 'subcategory_id', 'price', 'created_at'])
+
+class ListingQuerySet(models.QuerySet):
+    def available(self):
+        return self.filter(status='available')
+
+    def with_card_data(self):
+        """Everything a listing card renders, in one query"""
+        return self.select_related('category', 'subcategory', 'seller')
+
+    def refresh_primary_images(self, touch=False):
+        """
+        Point each listing at its primary ready photo (or its first, when none
+        is marked) and cache the photo's public_id and thumbnail URL on it.
+        `touch` also bumps updated_at, which keys the card fragments.
+        """
+        listing_ids = list(self.values_list('pk', flat=True))
+        if not listing_ids:
+            return
+        images = {}
+        ready = ListingImage.objects.filter(listing_id__in=listing_ids, status='ready')
+        for image in ready.order_by('listing_id', '-is_primary', 'pk').only('id', 'listing_id', 'image'):
+            images.setdefault(image.listing_id, image)
+
+        fields = ['primary_image', 'thumbnail_public_id', 'thumbnail_url'] + (['updated_at'] if touch else [])
+        now = timezone.now()
+        listings = []
+        for listing_id in listing_ids:
+            image = images.get(listing_id)
+            public_id = image.public_id if image else None
+            listings.append(Listing(
+                pk=listing_id,
+                primary_image=image,
+                thumbnail_public_id=public_id or '',
+                thumbnail_url=variant_url(public_id, 'thumb') if public_id else '',
+                updated_at=now,
+            ))
+        Listing.objects.bulk_update(listings, fields, batch_size=500)
+
+
 class Listing(models.Model):
     CONDITION_CHOICES = [
         ('new', 'New'),
@@ -61,15 +131,65 @@ class Listing(models.Model):
     subcategory = models.ForeignKey(SubCategory, on_delete=models.CASCADE)
     condition = models.CharField(max_length=10, choices=CONDITION_CHOICES)
     location = models.CharField(max_length=200)
+    # Normalized from `location` by the signals and normalize_locations
+    city = models.ForeignKey(
+        City, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='listings',
+    )
     contact_telegram = models.CharField(max_length=100)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='available')
     view_count = models.PositiveIntegerField(default=0)
+    # Denormalized from ListingImage by refresh_primary_images() so cards
+    # render without touching the images table
+    primary_image = models.ForeignKey(
+        'ListingImage', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='+',
+    )
+    thumbnail_public_id = models.CharField(max_length=255, blank=True, editable=False)
+    thumbnail_url = models.URLField(max_length=500, blank=True, editable=False)
     seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='listings')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by listings.search on Postgres, GIN index added in migration 0003
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = ListingQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination seeks for the browse orderings, see listings.pagination
+            models.Index(fields=['status', '-created_at', '-id'], name='listing_status_created_idx'),
+            models.Index(fields=['status', 'price', 'id'], name='listing_status_price_idx'),
+            # Browse filters only ever look at available listings, see ListingSearchForm
+            models.Index(
+                fields=['category', '-created_at', '-id'], name='listing_avail_cat_created_idx',
+                condition=models.Q(status='available'),
+            ),
+            models.Index(
+                fields=['category', 'price', 'id'], name='listing_avail_cat_price_idx',
+                condition=models.Q(status='available'),
+            ),
+            models.Index(
+                fields=['subcategory', '-created_at', '-id'], name='listing_avail_sub_created_idx',
+                condition=models.Q(status='available'),
+            ),
+            models.Index(
+                fields=['subcategory', 'price', 'id'], name='listing_avail_sub_price_idx',
+                condition=models.Q(status='available'),
+            ),
+            models.Index(
+                fields=['condition', '-created_at', '-id'], name='listing_avail_cond_created_idx',
+                condition=models.Q(status='available'),
+            ),
+            models.Index(
+                fields=['city', '-created_at', '-id'], name='listing_avail_city_created_idx',
+                condition=models.Q(status='available'),
+            ),
+            # The seller dashboard's pages, all listings or one status
+            models.Index(fields=['seller', '-created_at', '-id'], name='listing_seller_created_idx'),
+            models.Index(fields=['seller', 'status', '-created_at', '-id'], name='listing_seller_status_idx'),
+            # listings.retention finds the listings past their status's TTL
+            models.Index(fields=['status', 'updated_at', 'id'], name='listing_status_updated_idx'),
+        ]
     
     def __str__(self):
         return self.title
@@ -77,13 +197,41 @@ class Listing(models.Model):
     def get_absolute_url(self):
         return reverse('listing_detail', kwargs={'pk': self.pk})
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What listings.stats counted the row as, to tell what a save changes
+        if STATS_COLUMNS.issubset(field_names):
+            instance._stats_entry = instance.stats_entry()
+        # Status changes are recorded by listings.dashboard
+        if 'status' in field_names:
+            instance._loaded_status = instance.status
+        return instance
+
+    def stats_entry(self):
+        """`(category, subcategory, price, created_at)` when the listing counts towards CategoryStats"""
+        if self.status != 'available':
+            return None
+        return (self.category_id, self.subcategory_id, self.price, self.created_at)
+
     def get_primary_image(self):
-        primary_image = self.images.filter(is_primary=True).first()
-        if primary_image:
-            return primary_image
-        return self.images.first()
+        """The primary photo, rebuilt from the denormalized columns without a query"""
+        if not self.thumbnail_public_id:
+            return None
+        if '_primary_image' not in self.__dict__:
+            self._primary_image = ListingImage(
+                pk=self.primary_image_id, listing_id=self.pk, image=self.thumbnail_public_id, is_primary=True,
+            )
+        return self._primary_image
 
 class ListingImage(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('uploading', 'Uploading'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='images')
     # Replace ImageField with CloudinaryField
     image = CloudinaryField(
@@ -95,34 +243,210 @@ class ListingImage(models.Model):
             'width': 800,
             'height': 600,
             'crop': 'limit'
-        }
+        },
+        blank=True,
+        null=True,
     )
     is_primary = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Uploads are staged locally and sent to the image host in the background
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='ready')
+    staged_file = models.CharField(max_length=255, blank=True)
+    # Or fetched by the upload backend from here, for bulk imports
+    source_url = models.URLField(max_length=500, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    # When a worker took the upload, see UploadQueue.claim()
+    claimed_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['listing'], condition=models.Q(is_primary=True), name='listingimage_one_primary',
+            ),
+        ]
     
     def __str__(self):
         return f"Image for {self.listing.title}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What the listing's denormalized primary photo depended on, to tell whether a save changes it
+        if {'image', 'is_primary', 'status'}.issubset(field_names):
+            instance._card_entry = instance.card_entry()
+        return instance
+
+    def card_entry(self):
+        """`(public_id, is_primary)` when the photo can be a listing's primary, see refresh_primary_images()"""
+        if self.status != 'ready':
+            return None
+        return (self.public_id, self.is_primary)
+
+    def save(self, *args, **kwargs):
+        # Marking a photo primary unmarks the listing's other one
+        update_fields = kwargs.get('update_fields')
+        if self.is_primary and self.listing_id and (update_fields is None or 'is_primary' in update_fields):
+            ListingImage.objects.filter(listing_id=self.listing_id, is_primary=True).exclude(
+                pk=self.pk,
+            ).update(is_primary=False)
+        super().save(*args, **kwargs)
     
+    @property
+    def public_id(self):
+        return str(self.image) if self.image else None
+
+    def get_variant_urls(self, variant):
+        """(1x, 2x) URLs of a named variant from listings.images.VARIANTS"""
+        if not self.image:
+            return None
+        urls = self.__dict__.setdefault('_variant_urls', {})
+        if variant not in urls:
+            urls[variant] = variant_urls([self.public_id], variant)[self.public_id]
+        return urls[variant]
+
+    def get_variant_url(self, variant):
+        urls = self.get_variant_urls(variant)
+        return urls[0] if urls else None
+
     def get_thumbnail_url(self):
         """Get a thumbnail version of the image"""
-        if self.image:
-            return cloudinary.CloudinaryImage(str(self.image)).build_url(
-                width=300,
-                height=200,
-                crop='fill',
-                quality='auto:good',
-                fetch_format='auto'
-            )
-        return None
-    
+        return self.get_variant_url('thumb')
+
     def get_medium_url(self):
         """Get a medium-sized version of the image"""
-        if self.image:
-            return cloudinary.CloudinaryImage(str(self.image)).build_url(
-                width=600,
-                height=400,
-                crop='limit',
-                quality='auto:good',
-                fetch_format='auto'
-            )
-        return None
\ No newline at end of file
+        return self.get_variant_url('medium')
+
+
+class RelatedListing(models.Model):
+    """Precomputed "you might also like" entries, see listings.recommendations"""
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='recommendations')
+    related = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='recommended_with')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            # Also the index the detail page reads a listing's entries in order with
+            models.UniqueConstraint(fields=['listing', 'rank'], name='relatedlisting_listing_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.listing_id} → {self.related_id} ({self.score:.2f})"
+
+
+class CategoryStats(models.Model):
+    """
+    Available listing count and price range of a category (subcategory
+    empty) or of a subcategory, kept current by listings.stats
+    """
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    subcategory = models.ForeignKey(SubCategory, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    available_count = models.PositiveIntegerField(default=0)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # Only recomputed by rebuilds and exact row refreshes, see listings.stats
+    median_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    newest_listing_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'Category stats'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['category'], condition=models.Q(subcategory=None), name='categorystats_one_per_category',
+            ),
+            models.UniqueConstraint(fields=['subcategory'], name='categorystats_one_per_subcategory'),
+        ]
+
+    def __str__(self):
+        return f"{self.subcategory_id or self.category_id}: {self.available_count}"
+
+
+class SellerDailyStats(models.Model):
+    """One seller's activity on one day, written by listings.dashboard"""
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    listings_created = models.PositiveIntegerField(default=0)
+    listings_sold = models.PositiveIntegerField(default=0)
+    listings_removed = models.PositiveIntegerField(default=0)
+    # Summed over the listings sold that day, divide by listings_sold
+    seconds_to_sell = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'Seller daily stats'
+        constraints = [
+            # Also the index the dashboard reads a seller's days in order with
+            models.UniqueConstraint(fields=['seller', 'date'], name='sellerdailystats_seller_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.seller_id} on {self.date}"
+
+
+class ListingStatusEvent(models.Model):
+    """A listing's status change, appended by listings.lifecycle and never edited"""
+    # Without a constraint the log outlives listings moved to ArchivedListing
+    listing = models.ForeignKey(
+        Listing, on_delete=models.DO_NOTHING, db_constraint=False, related_name='status_events',
+    )
+    from_status = models.CharField(max_length=10, choices=Listing.STATUS_CHOICES)
+    to_status = models.CharField(max_length=10, choices=Listing.STATUS_CHOICES)
+    # Empty for changes made by commands and background jobs
+    actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    source = models.CharField(max_length=20, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['listing', 'created_at'], name='statusevent_listing_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.listing_id}: {self.from_status} → {self.to_status}"
+
+
+class ArchivedListing(models.Model):
+    """
+    A sold or removed listing moved out of Listing by listings.retention,
+    under its original id
+    """
+    id = models.BigIntegerField(primary_key=True)
+    title = models.CharField(max_length=200)
+    description = models.TextField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='+')
+    subcategory = models.ForeignKey(SubCategory, on_delete=models.SET_NULL, null=True, related_name='+')
+    condition = models.CharField(max_length=10, choices=Listing.CONDITION_CHOICES)
+    location = models.CharField(max_length=200)
+    city = models.ForeignKey(City, on_delete=models.SET_NULL, null=True, related_name='+')
+    contact_telegram = models.CharField(max_length=100)
+    status = models.CharField(max_length=10, choices=Listing.STATUS_CHOICES)
+    view_count = models.PositiveIntegerField(default=0)
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_listings')
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.title
+
+
+class ArchivedListingImage(models.Model):
+    """A photo of an archived listing, its hosted asset deleted once `purged_at` is set"""
+    id = models.BigIntegerField(primary_key=True)
+    listing = models.ForeignKey(ArchivedListing, on_delete=models.CASCADE, related_name='images')
+    # The image host's public id, empty when the upload never finished
+    public_id = models.CharField(max_length=255, blank=True)
+    is_primary = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+    purged_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The images still to purge, in the order listings.retention works through them
+            models.Index(fields=['id'], condition=models.Q(purged_at=None), name='archivedimage_unpurged_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived image {self.public_id or self.pk}"
@@ -0,0 +1,211 @@
+import base64
+import binascii
+import datetime
+import hashlib
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Q
+
+# Below this many rows an exact COUNT(*) is cheap enough to run
+EXACT_COUNT_THRESHOLD = 1000
+COUNT_CACHE_TIMEOUT = 60
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder rounds to milliseconds, cursors need exact values
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            return self.paginator.encode_cursor(self.object_list[-1], 'next')
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous:
+            return self.paginator.encode_cursor(self.object_list[0], 'prev')
+        return None
+
+
+class KeysetPaginator:
+    """
+    Cursor pagination over a queryset's own ordering. Each page seeks past the
+    last row of the previous one instead of using OFFSET, and no COUNT(*) is
+    needed to know whether there is a next page. The ordering must end in a
+    unique field for the cursor to be stable, the primary key is appended
+    when it doesn't.
+    """
+
+    def __init__(self, queryset, per_page):
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        if not ordering or ordering[-1].lstrip('-') not in ('id', 'pk'):
+            # Tie-break on the primary key, in the direction of the last column
+            descending = bool(ordering) and ordering[-1].startswith('-')
+            ordering.append('-id' if descending else 'id')
+            queryset = queryset.order_by(*ordering)
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+
+    def encode_cursor(self, obj, direction):
+        values = [getattr(obj, field.lstrip('-')) for field in self.ordering]
+        payload = json.dumps([direction, self.ordering, values], cls=CursorEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, token):
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            direction, ordering, values = json.loads(base64.urlsafe_b64decode(padded))
+        except (ValueError, TypeError, binascii.Error):
+            raise InvalidCursor(token)
+        if tuple(ordering) != self.ordering or direction not in ('next', 'prev') or len(values) != len(ordering):
+            raise InvalidCursor(token)
+        try:
+            return direction, [self.to_python(field, value) for field, value in zip(ordering, values)]
+        except ValidationError:
+            raise InvalidCursor(token)
+
+    def to_python(self, field, value):
+        name = field.lstrip('-')
+        try:
+            return self.queryset.model._meta.get_field(name).to_python(value)
+        except FieldDoesNotExist:
+            # An annotation such as search_rank
+            return value
+
+    def seek(self, values, reverse):
+        """Rows strictly after `values` in the ordering (before, if reverse)"""
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            descending = field.startswith('-') != reverse
+            step = Q(**{f"{field.lstrip('-')}__{'lt' if descending else 'gt'}": values[i]})
+            for previous, value in zip(self.ordering[:i], values[:i]):
+                step &= Q(**{previous.lstrip('-'): value})
+            condition |= step
+        # Redundant range on the leading column so the index can be used for the seek
+        leading = self.ordering[0]
+        descending = leading.startswith('-') != reverse
+        bound = Q(**{f"{leading.lstrip('-')}__{'lte' if descending else 'gte'}": values[0]})
+        return bound & condition
+
+    def page_queryset(self, cursor):
+        """The query for the page at `cursor`, and the direction it reads in"""
+        direction, values = None, None
+        if cursor:
+            try:
+                direction, values = self.decode_cursor(cursor)
+            except InvalidCursor:
+                pass
+
+        queryset = self.queryset
+        if direction == 'prev':
+            flipped = [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+            queryset = queryset.filter(self.seek(values, reverse=True)).order_by(*flipped)
+        elif direction == 'next':
+            queryset = queryset.filter(self.seek(values, reverse=False))
+
+        return queryset[:self.per_page + 1], direction
+
+    def make_page(self, rows, direction):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'prev':
+            rows.reverse()
+            return KeysetPage(rows, self, has_next=True, has_previous=has_more)
+        return KeysetPage(rows, self, has_next=has_more, has_previous=direction == 'next')
+
+    def get_page(self, cursor=None):
+        queryset, direction = self.page_queryset(cursor)
+        return self.make_page(list(queryset), direction)
+
+    async def aget_page(self, cursor=None):
+        queryset, direction = self.page_queryset(cursor)
+        return self.make_page([row async for row in queryset], direction)
+
+    def count(self):
+        return estimate_count(self.queryset)
+
+    async def acount(self):
+        return await aestimate_count(self.queryset)
+
+
+def planner_estimate(queryset):
+    """Row estimate from the Postgres planner, no rows are read"""
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_key(queryset):
+    return 'listing-count:' + hashlib.md5(str(queryset.order_by().query).encode('utf-8')).hexdigest()
+
+
+def estimate_count(queryset):
+    """
+    Returns `(count, is_estimate)`. Counts are cached per query; large result
+    sets on Postgres use the planner's estimate instead of COUNT(*).
+    """
+    key = count_key(queryset)
+    result = cache.get(key)
+    if result is None:
+        if connection.vendor == 'postgresql':
+            estimate = planner_estimate(queryset)
+            if estimate >= EXACT_COUNT_THRESHOLD:
+                result = (estimate, True)
+        if result is None:
+            result = (queryset.count(), False)
+        cache.set(key, result, COUNT_CACHE_TIMEOUT)
+    return result
+
+
+async def aestimate_count(queryset):
+    """estimate_count() for async views"""
+    key = count_key(queryset)
+    result = await cache.aget(key)
+    if result is None:
+        if connection.vendor == 'postgresql':
+            estimate = await sync_to_async(planner_estimate)(queryset)
+            if estimate >= EXACT_COUNT_THRESHOLD:
+                result = (estimate, True)
+        if result is None:
+            result = (await queryset.acount(), False)
+        await cache.aset(key, result, COUNT_CACHE_TIMEOUT)
+    return result
@@ -0,0 +1,168 @@
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Listing, RelatedListing
+from .search import tokenize
+
+logger = logging.getLogger(__name__)
+
+# How much each signal adds to a pair's score, out of 1
+WEIGHTS = {'subcategory': 0.4, 'price': 0.25, 'location': 0.15, 'title': 0.2}
+# Scoring looks at this many of the most recent listings of the same subcategory,
+# topped up from the category when the subcategory is small
+MAX_CANDIDATES = 200
+FIELDS = ('id', 'title', 'price', 'location', 'category_id', 'subcategory_id')
+
+
+def related_count():
+    return getattr(settings, 'RELATED_LISTINGS_COUNT', 8)
+
+
+class Features:
+    """What scoring needs of a listing, precomputed once"""
+
+    __slots__ = ('id', 'price', 'location', 'category_id', 'subcategory_id', 'tokens')
+
+    def __init__(self, row):
+        self.id = row['id']
+        self.price = float(row['price'])
+        self.location = row['location'].strip().lower()
+        self.category_id = row['category_id']
+        self.subcategory_id = row['subcategory_id']
+        self.tokens = frozenset(token for token in tokenize(row['title']) if len(token) > 2)
+
+
+def score(a, b):
+    """Similarity of two listings, symmetric and between 0 and 1"""
+    total = 0.0
+    if a.subcategory_id == b.subcategory_id:
+        total += WEIGHTS['subcategory']
+    if a.price > 0 and b.price > 0:
+        total += WEIGHTS['price'] * min(a.price, b.price) / max(a.price, b.price)
+    if a.location and a.location == b.location:
+        total += WEIGHTS['location']
+    if a.tokens and b.tokens:
+        total += WEIGHTS['title'] * len(a.tokens & b.tokens) / len(a.tokens | b.tokens)
+    return total
+
+
+def top_related(listing, candidates, k):
+    """The k best `(score, id)` pairs for a listing, best first, ties to the newer listing"""
+    scored = [(score(listing, candidate), candidate.id) for candidate in candidates if candidate.id != listing.id]
+    scored.sort(reverse=True)
+    return scored[:k]
+
+
+def candidates_for(listing):
+    """Available listings that may be related to `listing`"""
+    available = Listing.objects.available().order_by('-created_at', '-id').values(*FIELDS)
+    rows = list(available.filter(subcategory=listing.subcategory_id)[:MAX_CANDIDATES])
+    if len(rows) < MAX_CANDIDATES:
+        rows += available.filter(category=listing.category_id).exclude(
+            subcategory=listing.subcategory_id,
+        )[:MAX_CANDIDATES - len(rows)]
+    return [Features(row) for row in rows]
+
+
+def save_related(related):
+    """Replace the stored lists of `{listing_id: [(score, related_id), ...]}`"""
+    with transaction.atomic():
+        RelatedListing.objects.filter(listing_id__in=related).delete()
+        RelatedListing.objects.bulk_create([
+            RelatedListing(listing_id=listing_id, related_id=related_id, score=score, rank=rank)
+            for listing_id, pairs in related.items()
+            for rank, (score, related_id) in enumerate(pairs)
+        ], batch_size=1000)
+
+
+def refresh_listing(listing_id):
+    refresh_listings([listing_id])
+
+
+def refresh_listings(listing_ids):
+    """
+    Recompute these listings' related listings, and offer each to the lists
+    of the listings it is related to. The score is symmetric, so those are
+    the only lists it can have entered. Candidates are loaded once per
+    subcategory, the other lists in one query and all of it saved together.
+    """
+    k = related_count()
+    rows = list(Listing.objects.filter(pk__in=list(listing_ids)).values('status', *FIELDS))
+    # Holes are filled from the spare entries, and on the next rebuild
+    forget([row['id'] for row in rows if row['status'] != 'available'])
+    listings = [Features(row) for row in rows if row['status'] == 'available']
+    if not listings:
+        return
+
+    by_subcategory = defaultdict(list)
+    for listing in listings:
+        by_subcategory[listing.subcategory_id].append(listing)
+    updates = {}
+    for siblings in by_subcategory.values():
+        candidates = candidates_for(siblings[0])
+        for listing in siblings:
+            updates[listing.id] = top_related(listing, candidates, k)
+
+    # Offers to the lists of listings outside the batch, whose own lists are fresh
+    offers = defaultdict(list)
+    for listing_id, pairs in list(updates.items()):
+        for pair_score, related_id in pairs:
+            if related_id not in updates:
+                offers[related_id].append((pair_score, listing_id))
+    entries = defaultdict(list)
+    for entry in RelatedListing.objects.filter(listing_id__in=list(offers)).exclude(related_id__in=list(updates)):
+        entries[entry.listing_id].append((entry.score, entry.related_id))
+    for related_id, offered in offers.items():
+        current = entries[related_id]
+        if len(current) < k or max(offered)[0] > min(current)[0]:
+            updates[related_id] = sorted(current + offered, reverse=True)[:k]
+    save_related(updates)
+
+
+def forget(listing_ids):
+    """Drop listings that are no longer available from every list, in two DELETEs"""
+    RelatedListing.objects.filter(listing_id__in=listing_ids).delete()
+    RelatedListing.objects.filter(related_id__in=listing_ids).delete()
+
+
+def rebuild(batch_size=500, progress=None):
+    """
+    Recompute every available listing's related listings, a subcategory at
+    a time so each candidate set is loaded once. Returns the listings done.
+    """
+    k = related_count()
+    available = Listing.objects.available().order_by('-created_at', '-id')
+    by_category = defaultdict(list)
+    for row in available.values(*FIELDS).iterator(chunk_size=2000):
+        by_category[row['category_id']].append(Features(row))
+
+    RelatedListing.objects.exclude(listing__status='available').delete()
+    done = 0
+    pending = {}
+    for listings in by_category.values():
+        by_subcategory = defaultdict(list)
+        for listing in listings:
+            by_subcategory[listing.subcategory_id].append(listing)
+        for siblings in by_subcategory.values():
+            candidates = siblings[:MAX_CANDIDATES]
+            if len(candidates) < MAX_CANDIDATES:
+                candidates += [
+                    listing for listing in listings if listing.subcategory_id != siblings[0].subcategory_id
+                ][:MAX_CANDIDATES - len(candidates)]
+            for listing in siblings:
+                pending[listing.id] = top_related(listing, candidates, k)
+                if len(pending) >= batch_size:
+                    save_related(pending)
+                    done += len(pending)
+                    pending = {}
+                    if progress is not None:
+                        progress(done)
+    if pending:
+        save_related(pending)
+        done += len(pending)
+        if progress is not None:
+            progress(done)
+    return done
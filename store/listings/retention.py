@@ -0,0 +1,201 @@
+import time
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import lifecycle, recommendations
+from .caching import invalidate_listings
+from .models import ArchivedListing, ArchivedListingImage, Listing, ListingImage
+from .search import get_search_backend
+from .taxonomy import get_taxonomy
+from .uploads import get_delete_backend, staging_storage
+
+# Statuses whose expired listings are archived, available ones are marked removed first
+ARCHIVED_STATUSES = ('sold', 'removed')
+# Listing columns copied to ArchivedListing
+ARCHIVED_FIELDS = (
+    'id', 'title', 'description', 'price', 'category_id', 'subcategory_id', 'condition', 'location',
+    'city_id', 'contact_telegram', 'status', 'view_count', 'seller_id', 'created_at', 'updated_at',
+)
+
+
+def retention_days(status, category_slug=None):
+    """Days a listing may stay unchanged in `status`, or None to keep it"""
+    overrides = getattr(settings, 'LISTING_RETENTION_CATEGORY_DAYS', {}).get(category_slug, {})
+    if status in overrides:
+        return overrides[status]
+    return getattr(settings, 'LISTING_RETENTION_DAYS', {}).get(status)
+
+
+def expired(status, now=None):
+    """
+    Listings in `status` unchanged for longer than its TTL, one condition
+    per category with its own TTL and one for all the others
+    """
+    now = now or timezone.now()
+    conditions, overridden = [], []
+    for slug, days in getattr(settings, 'LISTING_RETENTION_CATEGORY_DAYS', {}).items():
+        category = get_taxonomy().category_by_slug.get(slug)
+        if category is None or status not in days:
+            continue
+        overridden.append(category.id)
+        if days[status] is not None:
+            conditions.append(Q(category=category.id, updated_at__lt=now - timedelta(days=days[status])))
+    default = retention_days(status)
+    if default is not None:
+        conditions.append(Q(updated_at__lt=now - timedelta(days=default)) & ~Q(category__in=overridden))
+    if not conditions:
+        return Listing.objects.none()
+    return Listing.objects.filter(reduce(or_, conditions), status=status)
+
+
+def delete_rows(model, column, values):
+    """
+    One DELETE by `column`. The Listing and ListingImage delete signals work
+    row by row, and an archived batch needs none of them: its listings
+    aren't counted, recommended or found by the browse pages.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    placeholders = ', '.join(['%s'] * len(values))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {connection.ops.quote_name(column)} IN ({placeholders})', values)
+
+
+def delete_staged(names):
+    storage = staging_storage()
+    for name in names:
+        storage.delete(name)
+
+
+class ExpiryReport:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.expired = 0
+        self.archived = 0
+        self.images = 0
+        self.purged = 0
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        return (self.expired + self.archived) / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'expired': self.expired,
+            'archived': self.archived,
+            'images': self.images,
+            'purged': self.purged,
+            'elapsed': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+
+class ListingExpirer:
+    """
+    Applies the retention settings `batch_size` listings at a time, each
+    batch in its own transaction: expired available listings are marked
+    removed, expired sold and removed ones are copied with their photos to
+    the archive tables and deleted. With `purge_images`, the archived
+    photos are then deleted from the image host.
+
+    The tables are the checkpoint. Archived listings have left Listing and
+    purged photos have `purged_at` set, so an interrupted run picks up
+    where it stopped, and `max_batches` bounds the work of one run.
+    """
+
+    def __init__(self, batch_size=500, purge_images=False, max_batches=None, now=None):
+        self.batch_size = batch_size
+        self.purge_images = purge_images
+        self.max_batches = max_batches
+        self.now = now or timezone.now()
+        self.batches = 0
+
+    def run(self, report=None):
+        """Do every step, yielding the report after each batch"""
+        self.report = report or ExpiryReport()
+        steps = [self.expire_available()] + [self.archive(status) for status in ARCHIVED_STATUSES]
+        if self.purge_images:
+            steps.append(self.purge())
+        for step in steps:
+            for _ in step:
+                self.batches += 1
+                yield self.report
+                if self.max_batches is not None and self.batches >= self.max_batches:
+                    return
+
+    def expire_available(self):
+        last = 0
+        candidates = expired('available', self.now).order_by('pk').values_list('pk', flat=True)
+        while True:
+            ids = list(candidates.filter(pk__gt=last)[:self.batch_size])
+            if not ids:
+                return
+            last = ids[-1]
+            moved = lifecycle.transition(ids, 'removed', source='expiry', batch_size=self.batch_size)
+            self.report.expired += len(moved)
+            yield len(moved)
+
+    def archive(self, status):
+        last = 0
+        listings = expired(status, self.now)
+        candidates = listings.order_by('pk').values_list('pk', flat=True)
+        while True:
+            ids = list(candidates.filter(pk__gt=last)[:self.batch_size])
+            if not ids:
+                return
+            last = ids[-1]
+            yield self.archive_batch(listings.filter(pk__in=ids))
+
+    def archive_batch(self, listings):
+        """Move these listings and their photos to the archive tables, returns how many moved"""
+        with transaction.atomic():
+            # Locked and checked again, they may have been relisted since the scan
+            rows = list(listings.select_for_update().order_by().values(*ARCHIVED_FIELDS))
+            if not rows:
+                return 0
+            ids = [row['id'] for row in rows]
+            images = list(ListingImage.objects.filter(listing_id__in=ids).order_by().values(
+                'id', 'listing_id', 'image', 'is_primary', 'created_at', 'staged_file',
+            ))
+            ArchivedListing.objects.bulk_create(
+                [ArchivedListing(archived_at=self.now, **row) for row in rows], batch_size=500,
+            )
+            ArchivedListingImage.objects.bulk_create([
+                ArchivedListingImage(
+                    id=image['id'], listing_id=image['listing_id'], public_id=str(image['image']) if image['image'] else '',
+                    is_primary=image['is_primary'], created_at=image['created_at'],
+                )
+                for image in images
+            ], batch_size=500)
+            recommendations.forget(ids)
+            delete_rows(ListingImage, 'listing_id', ids)
+            delete_rows(Listing, 'id', ids)
+            get_search_backend().remove_many(ids)
+            transaction.on_commit(lambda: invalidate_listings(ids))
+            staged = [image['staged_file'] for image in images if image['staged_file']]
+            if staged:
+                transaction.on_commit(lambda: delete_staged(staged), robust=True)
+        self.report.archived += len(rows)
+        self.report.images += len(images)
+        return len(rows)
+
+    def purge(self):
+        backend = get_delete_backend()
+        pending = ArchivedListingImage.objects.filter(purged_at=None).order_by('pk').values_list('pk', 'public_id')
+        while True:
+            batch = list(pending[:self.batch_size])
+            if not batch:
+                return
+            backend.delete([public_id for _, public_id in batch if public_id])
+            ArchivedListingImage.objects.filter(pk__in=[pk for pk, _ in batch]).update(purged_at=timezone.now())
+            self.report.purged += len(batch)
+            yield len(batch)
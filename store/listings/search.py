@@ -0,0 +1,147 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q, Value, FloatField
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+SEARCH_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    return SEARCH_TOKEN_RE.findall(query.lower())[:10]
+
+
+class BaseSearchBackend:
+    """
+    A search backend filters a Listing queryset down to the matches for a
+    query and annotates each row with a `search_rank` (higher is better).
+    """
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def update(self, listing):
+        pass
+
+    def update_many(self, listings):
+        for listing in listings:
+            self.update(listing)
+
+    def remove(self, listing_id):
+        pass
+
+    def remove_many(self, listing_ids):
+        for listing_id in listing_ids:
+            self.remove(listing_id)
+
+
+class ContainsSearchBackend(BaseSearchBackend):
+    """Unindexed fallback for databases without full-text support"""
+
+    def search(self, queryset, query):
+        condition = Q()
+        for token in tokenize(query):
+            condition &= Q(title__icontains=token) | Q(description__icontains=token)
+        return queryset.filter(condition).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """Ranked search over the weighted `Listing.search_vector` column"""
+
+    def __init__(self):
+        self.config = getattr(settings, 'LISTING_SEARCH_CONFIG', 'english')
+
+    def vector(self):
+        from django.contrib.postgres.search import SearchVector
+        return (
+            SearchVector('title', weight='A', config=self.config)
+            + SearchVector('description', weight='B', config=self.config)
+        )
+
+    def search(self, queryset, query):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+        # Prefix match every token so results keep up with the user typing
+        search_query = SearchQuery(
+            ' & '.join(f'{token}:*' for token in tokens), search_type='raw', config=self.config
+        )
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
+        )
+
+    def update(self, listing):
+        self.update_many([listing])
+
+    def update_many(self, listings):
+        from .models import Listing
+        Listing.objects.filter(pk__in=[listing.pk for listing in listings]).update(search_vector=self.vector())
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """Ranked search over the FTS5 table created by migration 0003"""
+
+    table = 'listings_listing_fts'
+    # bm25() column weights, matching the A/B weights used on Postgres
+    weights = (10.0, 1.0)
+
+    def match_expression(self, query):
+        return ' '.join(f'"{token}"*' for token in tokenize(query))
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none()
+        table = self.table
+        weights = ', '.join(str(weight) for weight in self.weights)
+        return queryset.filter(
+            pk__in=RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', (match,))
+        ).annotate(
+            search_rank=RawSQL(
+                f'SELECT -bm25({table}, {weights}) FROM {table} '
+                f'WHERE {table} MATCH %s AND rowid = listings_listing.id',
+                (match,),
+                output_field=FloatField(),
+            )
+        )
+
+    def update(self, listing):
+        self.update_many([listing])
+
+    def update_many(self, listings):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {self.table} (rowid, title, description) VALUES (%s, %s, %s)',
+                [(listing.pk, listing.title, listing.description) for listing in listings],
+            )
+
+    def remove(self, listing_id):
+        self.remove_many([listing_id])
+
+    def remove_many(self, listing_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(pk,) for pk in listing_ids])
+
+
+VENDOR_BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+_backend = None
+
+
+def get_search_backend():
+    """Return the configured backend, or the best one for the active database"""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'LISTING_SEARCH_BACKEND', None)
+        if path:
+            backend_class = import_string(path)
+        else:
+            backend_class = VENDOR_BACKENDS.get(connection.vendor, ContainsSearchBackend)
+        _backend = backend_class()
+    return _backend
@@ -0,0 +1,99 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from .caching import invalidate_listing
+from .models import Category, City, SubCategory, Listing, ListingImage
+from . import dashboard, lifecycle, locations, recommendations, stats
+from .search import get_search_backend
+from .taxonomy import invalidate_taxonomy
+
+SEARCH_FIELDS = {'title', 'description'}
+# Fields listings.recommendations scores on, or that take a listing out of them
+RECOMMENDATION_FIELDS = {'title', 'price', 'location', 'category', 'subcategory', 'status'}
+# Field names in update_fields that can change the listings.stats counts,
+# see also models.STATS_COLUMNS
+STATS_UPDATE_FIELDS = {'status', 'price', 'category', 'subcategory'}
+
+
+@receiver(pre_save, sender=Listing)
+def assign_city(sender, instance, update_fields=None, **kwargs):
+    # Saves of some fields only write the city when they name it too
+    if update_fields is None or 'city' in update_fields:
+        instance.city_id = locations.city_id_for(instance.location)
+
+
+@receiver(post_save, sender=Listing)
+def index_listing(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not SEARCH_FIELDS.intersection(update_fields):
+        return
+    get_search_backend().update(instance)
+
+
+@receiver(post_save, sender=Listing)
+def update_category_stats(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not STATS_UPDATE_FIELDS.intersection(update_fields):
+        return
+    stats.listing_saved(instance, created)
+
+
+@receiver(post_save, sender=Listing)
+def record_seller_activity(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        dashboard.record_created([instance])
+    elif update_fields is None or 'status' in update_fields:
+        previous = instance.__dict__.get('_loaded_status')
+        if previous is not None and previous != instance.status:
+            lifecycle.log_saved_change(instance, previous)
+    instance._loaded_status = instance.status
+
+
+@receiver(post_delete, sender=Listing)
+def uncount_listing(sender, instance, **kwargs):
+    stats.listing_deleted(instance)
+
+
+@receiver(post_delete, sender=Listing)
+def unindex_listing(sender, instance, **kwargs):
+    get_search_backend().remove(instance.pk)
+
+
+@receiver(post_save, sender=Listing)
+def refresh_related_listings(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not RECOMMENDATION_FIELDS.intersection(update_fields):
+        return
+    # A failure only leaves the recommendations stale until the next rebuild
+    transaction.on_commit(lambda: recommendations.refresh_listing(instance.pk), robust=True)
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=SubCategory)
+@receiver([post_save, post_delete], sender=City)
+def reload_taxonomy(sender, **kwargs):
+    # Once now for this process, and again after commit so that other
+    # workers can't reload a snapshot from before the change
+    invalidate_taxonomy()
+    transaction.on_commit(invalidate_taxonomy)
+
+
+@receiver([post_save, post_delete], sender=Listing)
+def expire_listing_pages(sender, instance, **kwargs):
+    invalidate_listing(instance.pk)
+    transaction.on_commit(lambda: invalidate_listing(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=ListingImage)
+def expire_listing_image_pages(sender, instance, signal, created=False, **kwargs):
+    if signal is post_delete:
+        before, after = instance.card_entry(), None
+    else:
+        # Unknown when the image wasn't loaded with the columns to compare
+        before = None if created else instance.__dict__.get('_card_entry', False)
+        after = instance._card_entry = instance.card_entry()
+    # Saves that can't change the listing's primary photo, like upload retries, change no page
+    if before == after:
+        return
+    # Card fragments are keyed by the listing's updated_at
+    Listing.objects.filter(pk=instance.listing_id).refresh_primary_images(touch=True)
+    invalidate_listing(instance.listing_id)
+    transaction.on_commit(lambda: invalidate_listing(instance.listing_id))
@@ -0,0 +1,239 @@
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, DateTimeField, DecimalField, F, Max, Min, Q, Value, When
+
+from .caching import LISTINGS_VERSION_KEY, get_versions
+from .models import CategoryStats, Listing
+from .taxonomy import get_taxonomy
+
+COLUMNS = ('available_count', 'min_price', 'median_price', 'max_price', 'newest_listing_at')
+
+
+def rows_of(category_id, subcategory_id):
+    """The category's row and the subcategory's"""
+    return CategoryStats.objects.filter(
+        Q(category=category_id, subcategory=None) | Q(subcategory=subcategory_id)
+    )
+
+
+def ensure_rows(category_id, subcategory_id):
+    CategoryStats.objects.bulk_create([
+        CategoryStats(category_id=category_id),
+        CategoryStats(category_id=category_id, subcategory_id=subcategory_id),
+    ], ignore_conflicts=True)
+
+
+def add(category_id, subcategory_id, count, min_price, max_price, newest):
+    """Count `count` more available listings, in one UPDATE of both rows"""
+    price = DecimalField(max_digits=10, decimal_places=2)
+    extended = {
+        'available_count': F('available_count') + count,
+        'min_price': Case(
+            When(Q(min_price=None) | Q(min_price__gt=min_price), then=Value(min_price, output_field=price)),
+            default=F('min_price'),
+        ),
+        'max_price': Case(
+            When(Q(max_price=None) | Q(max_price__lt=max_price), then=Value(max_price, output_field=price)),
+            default=F('max_price'),
+        ),
+        'newest_listing_at': Case(
+            When(
+                Q(newest_listing_at=None) | Q(newest_listing_at__lt=newest),
+                then=Value(newest, output_field=DateTimeField()),
+            ),
+            default=F('newest_listing_at'),
+        ),
+    }
+    if rows_of(category_id, subcategory_id).update(**extended) < 2:
+        ensure_rows(category_id, subcategory_id)
+        # Only the rows just created are still at zero
+        rows_of(category_id, subcategory_id).filter(available_count=0).update(**extended)
+
+
+def remove(category_id, subcategory_id, price, created_at):
+    """
+    Count one available listing less. The range only shrinks when the
+    listing was at one of its ends, the rows are then recomputed from the
+    table as it is now. Returns whether they were.
+    """
+    rows = list(rows_of(category_id, subcategory_id))
+    if any(
+        row.available_count <= 1 or price <= row.min_price or price >= row.max_price
+        or created_at >= row.newest_listing_at
+        for row in rows if row.min_price is not None
+    ):
+        refresh(category_id, subcategory_id)
+        return True
+    rows_of(category_id, subcategory_id).filter(available_count__gt=0).update(
+        available_count=F('available_count') - 1,
+    )
+    return False
+
+
+def median(listings, count):
+    """Median price of `count` listings, read off the (…, price, id) indexes"""
+    if not count:
+        return None
+    prices = listings.order_by('price', 'id').values_list('price', flat=True)
+    middle = list(prices[(count - 1) // 2:count // 2 + 1])
+    return sum(middle) / len(middle)
+
+
+def compute(listings):
+    values = listings.order_by().aggregate(
+        available_count=Count('pk'), min_price=Min('price'), max_price=Max('price'),
+        newest_listing_at=Max('created_at'),
+    )
+    values['median_price'] = median(listings, values['available_count'])
+    return values
+
+
+def refresh(category_id, subcategory_id):
+    """Recompute the category's row and the subcategory's exactly"""
+    available = Listing.objects.available()
+    ensure_rows(category_id, subcategory_id)
+    with transaction.atomic():
+        CategoryStats.objects.filter(category=category_id, subcategory=None).update(
+            **compute(available.filter(category=category_id))
+        )
+        CategoryStats.objects.filter(subcategory=subcategory_id).update(
+            **compute(available.filter(subcategory=subcategory_id))
+        )
+
+
+def listing_saved(listing, created):
+    """Move a saved listing between the counts its save changed"""
+    before = None if created else listing.__dict__.get('_stats_entry', False)
+    after = listing.stats_entry()
+    if before is False:
+        # Loaded without the columns to compare, recount where it is now
+        if after is not None:
+            refresh(after[0], after[1])
+    elif before != after:
+        recounted = before is not None and remove(*before)
+        if recounted and after is not None and after[:2] != before[:2]:
+            refresh(after[0], after[1])
+        elif not recounted and after is not None:
+            category_id, subcategory_id, price, created_at = after
+            add(category_id, subcategory_id, 1, price, price, created_at)
+    listing._stats_entry = after
+
+
+def listing_deleted(listing):
+    entry = listing.__dict__.get('_stats_entry', listing.stats_entry())
+    if entry is not None:
+        remove(*entry)
+
+
+def listings_created(listings):
+    """Count listings written with bulk_create, one UPDATE per subcategory"""
+    groups = defaultdict(list)
+    for listing in listings:
+        entry = listing.stats_entry()
+        if entry is not None:
+            groups[entry[:2]].append(entry)
+    for (category_id, subcategory_id), entries in groups.items():
+        prices = [entry[2] for entry in entries]
+        add(category_id, subcategory_id, len(entries), min(prices), max(prices), max(entry[3] for entry in entries))
+
+
+class Accumulator:
+    __slots__ = ('prices', 'newest')
+
+    def __init__(self):
+        self.prices = []
+        self.newest = None
+
+    def add(self, price, created_at):
+        self.prices.append(price)
+        if self.newest is None or created_at > self.newest:
+            self.newest = created_at
+
+    def values(self):
+        # Prices arrive in order
+        prices, count = self.prices, len(self.prices)
+        if not count:
+            return {'available_count': 0}
+        middle = prices[(count - 1) // 2:count // 2 + 1]
+        return {
+            'available_count': count,
+            'min_price': prices[0],
+            'median_price': sum(middle) / len(middle),
+            'max_price': prices[-1],
+            'newest_listing_at': self.newest,
+        }
+
+
+def rebuild():
+    """
+    Recompute every row in one ordered pass over the available listings,
+    holding one category's prices at a time, then replace the table in a
+    transaction. Returns `(rows, seconds)`.
+    """
+    started = time.perf_counter()
+    taxonomy = get_taxonomy()
+    rows = []
+
+    def flush(category_id, by_category, by_subcategory):
+        rows.append(CategoryStats(category_id=category_id, **by_category.values()))
+        for subcategory in taxonomy.subcategories_for(category_id):
+            accumulator = by_subcategory.get(subcategory.id) or Accumulator()
+            rows.append(CategoryStats(category_id=category_id, subcategory_id=subcategory.id, **accumulator.values()))
+
+    listings = Listing.objects.available().order_by('category_id', 'price', 'id').values_list(
+        'category_id', 'subcategory_id', 'price', 'created_at',
+    )
+    seen = set()
+    current, by_category, by_subcategory = None, None, None
+    for category_id, subcategory_id, price, created_at in listings.iterator(chunk_size=5000):
+        if category_id != current:
+            if current is not None:
+                flush(current, by_category, by_subcategory)
+            current, by_category, by_subcategory = category_id, Accumulator(), defaultdict(Accumulator)
+            seen.add(category_id)
+        by_category.add(price, created_at)
+        by_subcategory[subcategory_id].add(price, created_at)
+    if current is not None:
+        flush(current, by_category, by_subcategory)
+    for category in taxonomy.categories:
+        if category.id not in seen:
+            flush(category.id, Accumulator(), {})
+
+    with transaction.atomic():
+        CategoryStats.objects.all().delete()
+        CategoryStats.objects.bulk_create(rows, batch_size=1000)
+    return len(rows), time.perf_counter() - started
+
+
+def load_category_stats():
+    categories, subcategories = {}, {}
+    for row in CategoryStats.objects.values('category_id', 'subcategory_id', *COLUMNS):
+        target = subcategories if row['subcategory_id'] else categories
+        target[row['subcategory_id'] or row['category_id']] = {
+            'count': row['available_count'],
+            'min_price': row['min_price'],
+            'median_price': row['median_price'],
+            'max_price': row['max_price'],
+            'newest': row['newest_listing_at'],
+        }
+    return {'categories': categories, 'subcategories': subcategories}
+
+
+def get_category_stats():
+    """
+    `{'categories': {id: stats}, 'subcategories': {id: stats}}` in one
+    query of the stats table, cached until the listings change. Counts,
+    ranges and newest dates are current, `median_price` is as of the last
+    rebuild or recount of the row and can lag behind.
+    """
+    listings_version, = get_versions(LISTINGS_VERSION_KEY)
+    key = f'category-stats:{listings_version}'
+    stats = cache.get(key)
+    if stats is None:
+        stats = load_category_stats()
+        cache.set(key, stats, getattr(settings, 'CATEGORY_STATS_CACHE_TIMEOUT', 300))
+    return stats
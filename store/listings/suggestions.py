@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import threading
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+from django.urls import reverse
+
+from .models import Listing
+from .taxonomy import aget_taxonomy, get_taxonomy
+
+MAX_SUGGESTIONS = 8
+MAX_CATEGORIES = 4
+MAX_SUBCATEGORIES = 5
+MAX_PRODUCTS = 3
+
+
+def normalize_query(query):
+    return ' '.join(query.lower().split())
+
+
+class TaxonomyTrie:
+    """
+    Prefix index over category and subcategory names. Every word of a name
+    is indexed, so "pho" finds "Mobile Phones" as well as "Phone Cases".
+    """
+
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, name, entry):
+        words = normalize_query(name).split()
+        keys = {' '.join(words[i:]) for i in range(len(words))}
+        for key in keys:
+            node = self.root
+            for char in key:
+                node = node.setdefault(char, {})
+            node.setdefault(None, []).append(entry)
+
+    def search(self, prefix, limit):
+        prefix = normalize_query(prefix)
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+        # The taxonomy is small enough to collect the whole subtree
+        results, seen, stack = [], set(), [node]
+        while stack:
+            node = stack.pop()
+            for char, child in node.items():
+                if char is not None:
+                    stack.append(child)
+            for entry in node.get(None, ()):
+                if entry['key'] not in seen:
+                    seen.add(entry['key'])
+                    results.append(entry)
+        # Names that start with the query first, then alphabetical
+        results.sort(key=lambda entry: (not entry['name'].lower().startswith(prefix), entry['name']))
+        return results[:limit]
+
+
+class SuggestionIndex:
+    def __init__(self, taxonomy):
+        self.version = taxonomy.version
+        self.categories = TaxonomyTrie()
+        self.subcategories = TaxonomyTrie()
+        for category in taxonomy.categories:
+            self.categories.insert(category.name, {
+                'key': ('category', category.id),
+                'name': category.name,
+                'category_id': category.id,
+            })
+        for subcategory in taxonomy.subcategories:
+            self.subcategories.insert(subcategory.name, {
+                'key': ('subcategory', subcategory.id),
+                'name': subcategory.name,
+                'category_id': subcategory.category.id,
+                'category_name': subcategory.category.name,
+                'subcategory_id': subcategory.id,
+            })
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index(taxonomy):
+    """Per-process index, rebuilt whenever the taxonomy is reloaded"""
+    global _index
+    index = _index
+    if index is None or index.version != taxonomy.version:
+        with _index_lock:
+            if _index is None or _index.version != taxonomy.version:
+                _index = SuggestionIndex(taxonomy)
+            index = _index
+    return index
+
+
+async def aget_index(taxonomy):
+    # Rebuilding is CPU-bound, do it off the event loop while products are fetched
+    index = _index
+    if index is None or index.version != taxonomy.version:
+        index = await sync_to_async(get_index, thread_sensitive=False)(taxonomy)
+    return index
+
+
+def product_queryset(query, limit=MAX_PRODUCTS):
+    listings = Listing.objects.available()
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramSimilarity
+        # Both conditions are served by the gin_trgm_ops index from migration 0004
+        listings = listings.filter(
+            Q(title__icontains=query) | Q(title__trigram_similar=query)
+        ).annotate(similarity=TrigramSimilarity('title', query)).order_by('-similarity')
+    else:
+        listings = listings.filter(title__icontains=query).order_by('-view_count')
+    return listings.values('title', 'category_id', 'subcategory_id', 'category__name')[:limit]
+
+
+def product_suggestions(query, limit=MAX_PRODUCTS):
+    return list(product_queryset(query, limit))
+
+
+async def aproduct_suggestions(query, limit=MAX_PRODUCTS):
+    return [product async for product in product_queryset(query, limit)]
+
+
+def build_suggestions(query, index, products=None):
+    listings_url = reverse('listings')
+    suggestions = []
+
+    for category in index.categories.search(query, MAX_CATEGORIES):
+        suggestions.append({
+            'name': category['name'],
+            'type': 'category',
+            'type_display': 'Category',
+            'url': f"{listings_url}?category={category['category_id']}",
+            'category_id': category['category_id'],
+            'subcategory_id': None,
+        })
+
+    for subcategory in index.subcategories.search(query, MAX_SUBCATEGORIES):
+        suggestions.append({
+            'name': subcategory['name'],
+            'type': 'subcategory',
+            'type_display': f"in {subcategory['category_name']}",
+            'url': f"{listings_url}?category={subcategory['category_id']}&subcategory={subcategory['subcategory_id']}",
+            'category_id': subcategory['category_id'],
+            'subcategory_id': subcategory['subcategory_id'],
+        })
+
+    if products is None:
+        products = product_suggestions(query)
+    for product in products:
+        suggestions.append({
+            'name': product['title'],
+            'type': 'product',
+            'type_display': f"Product in {product['category__name']}",
+            'url': f"{listings_url}?category={product['category_id']}&subcategory={product['subcategory_id']}",
+            'category_id': product['category_id'],
+            'subcategory_id': product['subcategory_id'],
+        })
+
+    # Remove duplicates based on URL and limit results
+    unique_suggestions = []
+    seen_urls = set()
+    for suggestion in suggestions:
+        if suggestion['url'] not in seen_urls:
+            unique_suggestions.append(suggestion)
+            seen_urls.add(suggestion['url'])
+    unique_suggestions = unique_suggestions[:MAX_SUGGESTIONS]
+
+    if not unique_suggestions:
+        unique_suggestions.append({
+            'name': f"Search results for '{query}'",
+            'type': 'search',
+            'type_display': 'General Search',
+            'url': f"{listings_url}?{urlencode({'search': query})}",
+            'category_id': None,
+            'subcategory_id': None,
+        })
+    return unique_suggestions
+
+
+def suggestions_key(query, taxonomy):
+    return f"suggestions:{taxonomy.version}:{hashlib.md5(query.encode('utf-8')).hexdigest()}"
+
+
+def get_suggestions(query):
+    """Suggestions for a typeahead query, cached per normalized prefix"""
+    query = normalize_query(query)
+    taxonomy = get_taxonomy()
+    key = suggestions_key(query, taxonomy)
+    suggestions = cache.get(key)
+    if suggestions is None:
+        suggestions = build_suggestions(query, get_index(taxonomy))
+        cache.set(key, suggestions, getattr(settings, 'SEARCH_SUGGESTIONS_TIMEOUT', 60))
+    return suggestions
+
+
+async def aget_suggestions(query):
+    """get_suggestions() for async views, the taxonomy and product lookups run together"""
+    query = normalize_query(query)
+    taxonomy = await aget_taxonomy()
+    key = suggestions_key(query, taxonomy)
+    suggestions = await cache.aget(key)
+    if suggestions is None:
+        index, products = await asyncio.gather(
+            aget_index(taxonomy),
+            aproduct_suggestions(query),
+        )
+        suggestions = build_suggestions(query, index, products)
+        await cache.aset(key, suggestions, getattr(settings, 'SEARCH_SUGGESTIONS_TIMEOUT', 60))
+    return suggestions
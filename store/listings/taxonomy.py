@@ -0,0 +1,224 @@
+import re
+import threading
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.utils.translation import get_language
+
+from .models import Category, City, SubCategory
+
+TAXONOMY_VERSION_KEY = 'taxonomy:version'
+# Words that say nothing about which city a free-text location is
+PLACE_NOISE = re.compile(r'\b(ethiopia|city|town|area|near|around)\b')
+PLACE_SEPARATORS = re.compile(r'[,/;()|]+|\s-\s')
+
+
+def localized_name(name, name_am):
+    """The Amharic name on Amharic pages when there is one, the English name otherwise"""
+    if name_am and get_language() == 'am':
+        return name_am
+    return name
+
+
+class CategoryNode:
+    __slots__ = ('id', 'name', 'name_am', 'slug', 'icon', 'subcategories')
+
+    def __init__(self, id, name, slug, icon, name_am=''):
+        self.id = id
+        self.name = name
+        self.name_am = name_am
+        self.slug = slug
+        self.icon = icon
+        self.subcategories = []
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def display_name(self):
+        return localized_name(self.name, self.name_am)
+
+
+class SubCategoryNode:
+    __slots__ = ('id', 'name', 'name_am', 'slug', 'icon', 'category')
+
+    def __init__(self, id, name, slug, icon, category, name_am=''):
+        self.id = id
+        self.name = name
+        self.name_am = name_am
+        self.slug = slug
+        self.icon = icon
+        self.category = category
+
+    @property
+    def display_name(self):
+        return localized_name(self.name, self.name_am)
+
+    def __str__(self):
+        return f"{self.category.name} → {self.name}"
+
+
+class CityNode:
+    __slots__ = ('id', 'name', 'name_am', 'slug', 'region', 'latitude', 'longitude')
+
+    def __init__(self, id, name, slug, region='', latitude=None, longitude=None, name_am=''):
+        self.id = id
+        self.name = name
+        self.name_am = name_am
+        self.slug = slug
+        self.region = region
+        self.latitude = latitude
+        self.longitude = longitude
+
+    @property
+    def display_name(self):
+        return localized_name(self.name, self.name_am)
+
+    @property
+    def has_coordinates(self):
+        return self.latitude is not None and self.longitude is not None
+
+    def __str__(self):
+        return self.name
+
+
+def place_key(text):
+    """`text` lowercased, without punctuation or filler words, for matching place names"""
+    text = PLACE_NOISE.sub(' ', str(text or '').lower())
+    return ' '.join(re.sub(r"[^\w\s]", ' ', text).split())
+
+
+class Taxonomy:
+    """
+    Immutable snapshot of every category, subcategory and city, loaded in
+    three queries. Categories and their subcategories are ordered by name.
+    """
+
+    def __init__(self, categories, subcategories, version=None, cities=()):
+        self.version = version
+        self.categories = [
+            CategoryNode(c['id'], c['name'], c['slug'], c['icon'], c['name_am']) for c in categories
+        ]
+        self.category_by_id = {category.id: category for category in self.categories}
+        self.category_by_slug = {category.slug: category for category in self.categories}
+        self.subcategory_by_id = {}
+        for s in subcategories:
+            category = self.category_by_id[s['category_id']]
+            node = SubCategoryNode(s['id'], s['name'], s['slug'], s['icon'], category, s['name_am'])
+            category.subcategories.append(node)
+            self.subcategory_by_id[node.id] = node
+        self.subcategories = list(self.subcategory_by_id.values())
+        self.cities = []
+        self.city_by_id = {}
+        self.city_by_key = {}
+        for c in cities:
+            node = CityNode(
+                c['id'], c['name'], c['slug'], c['region'], c['latitude'], c['longitude'], c['name_am'],
+            )
+            self.cities.append(node)
+            self.city_by_id[node.id] = node
+            for name in [node.name, node.slug.replace('-', ' '), node.name_am, *(c['aliases'] or [])]:
+                self.city_by_key.setdefault(place_key(name), node)
+        self.city_by_key.pop('', None)
+
+    @classmethod
+    def load(cls, version=None):
+        return cls(
+            Category.objects.order_by('name').values('id', 'name', 'name_am', 'slug', 'icon'),
+            SubCategory.objects.order_by('name').values('id', 'name', 'name_am', 'slug', 'icon', 'category_id'),
+            version=version,
+            cities=City.objects.order_by('name').values(
+                'id', 'name', 'name_am', 'slug', 'region', 'latitude', 'longitude', 'aliases',
+            ),
+        )
+
+    def subcategories_for(self, category_id):
+        try:
+            return self.category_by_id[int(category_id)].subcategories
+        except (KeyError, TypeError, ValueError):
+            return []
+
+    def find_category(self, value):
+        """A category by id or slug, or None"""
+        value = str(value or '').strip()
+        if value.isdigit():
+            return self.category_by_id.get(int(value))
+        return self.category_by_slug.get(value)
+
+    def find_subcategory(self, category, value):
+        """One of `category`'s subcategories by id or slug, or None"""
+        value = str(value or '').strip()
+        for subcategory in category.subcategories:
+            if value in (str(subcategory.id), subcategory.slug):
+                return subcategory
+        return None
+
+    def match_city(self, location):
+        """
+        The city a free-text location names, or None. Tries the whole text,
+        then each comma separated part, last first as addresses usually end
+        with the city ("Bole, Addis Ababa").
+        """
+        city = self.city_by_key.get(place_key(location))
+        if city is not None:
+            return city
+        for part in reversed(PLACE_SEPARATORS.split(str(location or ''))):
+            city = self.city_by_key.get(place_key(part))
+            if city is not None:
+                return city
+        return None
+
+    def category_choices(self):
+        return [(category.id, category.name) for category in self.categories]
+
+    def subcategory_choices(self):
+        return [(subcategory.id, str(subcategory)) for subcategory in self.subcategories]
+
+    def city_choices(self):
+        return [(city.id, city.name) for city in self.cities]
+
+
+_taxonomy = None
+_lock = threading.Lock()
+
+
+def new_version():
+    # Random rather than a counter, so a worker can never mistake a version
+    # created after a cache flush for the one it already loaded
+    return uuid.uuid4().hex
+
+
+def get_taxonomy_version():
+    return cache.get_or_set(TAXONOMY_VERSION_KEY, new_version, None)
+
+
+def get_taxonomy():
+    """
+    The per-process taxonomy. A shared cache version key tells every worker
+    to reload after a change made in any of them.
+    """
+    global _taxonomy
+    version = get_taxonomy_version()
+    taxonomy = _taxonomy
+    if taxonomy is None or taxonomy.version != version:
+        with _lock:
+            if _taxonomy is None or _taxonomy.version != version:
+                _taxonomy = Taxonomy.load(version)
+            taxonomy = _taxonomy
+    return taxonomy
+
+
+async def aget_taxonomy():
+    """get_taxonomy() for async views, only leaves the event loop to reload"""
+    version = await cache.aget_or_set(TAXONOMY_VERSION_KEY, new_version, None)
+    taxonomy = _taxonomy
+    if taxonomy is None or taxonomy.version != version:
+        taxonomy = await sync_to_async(get_taxonomy)()
+    return taxonomy
+
+
+def invalidate_taxonomy():
+    global _taxonomy
+    _taxonomy = None
+    cache.set(TAXONOMY_VERSION_KEY, new_version(), None)
@@ -0,0 +1,153 @@
+import json
+import time
+from pathlib import Path
+
+from django.db import transaction
+
+from .models import Category, SubCategory
+from .taxonomy import invalidate_taxonomy
+
+DEFAULT_TAXONOMY_FILE = Path(__file__).resolve().parent / 'data' / 'taxonomy.json'
+# Columns a taxonomy file sets, per node
+FIELDS = ('name', 'name_am', 'icon')
+
+
+class TaxonomyFileError(ValueError):
+    pass
+
+
+def read_file(path):
+    """Parse a JSON or YAML taxonomy file"""
+    path = Path(path)
+    with open(path, encoding='utf-8') as f:
+        if path.suffix in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise TaxonomyFileError('Loading YAML taxonomies needs PyYAML (pip install pyyaml)')
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def node_values(node, where):
+    """`{name, name_am, icon}` of a file node. `name` is a string or `{'en': ..., 'am': ...}`."""
+    if not isinstance(node, dict) or not node.get('slug'):
+        raise TaxonomyFileError(f'{where}: every node needs a slug')
+    name = node.get('name')
+    names = name if isinstance(name, dict) else {'en': name}
+    if not names.get('en'):
+        raise TaxonomyFileError(f"{where} {node['slug']}: missing English name")
+    return {'name': names['en'], 'name_am': names.get('am') or '', 'icon': node.get('icon') or ''}
+
+
+def parse(data):
+    """
+    `({category slug: values}, {(category slug, subcategory slug): values})`
+    from the contents of one or more taxonomy files, later files winning
+    """
+    categories, subcategories = {}, {}
+    for document in data:
+        for category in (document or {}).get('categories', []):
+            values = node_values(category, 'category')
+            categories[category['slug']] = values
+            for subcategory in category.get('subcategories', []):
+                subcategories[category['slug'], subcategory['slug']] = node_values(
+                    subcategory, f"subcategory of {category['slug']}"
+                )
+    names = [values['name'] for values in categories.values()]
+    duplicates = {name for name in names if names.count(name) > 1}
+    if duplicates:
+        raise TaxonomyFileError(f"Category names must be unique: {', '.join(sorted(duplicates))}")
+    return categories, subcategories
+
+
+class TaxonomyPlan:
+    """What loading a taxonomy would change, from one read of the current tree"""
+
+    def __init__(self, categories, subcategories):
+        existing = {
+            row['slug']: row for row in Category.objects.values('id', 'slug', *FIELDS)
+        }
+        existing_subcategories = {
+            (row['category__slug'], row['slug']): row
+            for row in SubCategory.objects.values('id', 'slug', 'category__slug', *FIELDS)
+        }
+        self.categories = categories
+        self.subcategories = subcategories
+        self.new_categories, self.changed_categories = diff(categories, existing)
+        self.new_subcategories, self.changed_subcategories = diff(subcategories, existing_subcategories)
+        # Never deleted here, listings may still point at them
+        self.missing_categories = sorted(set(existing) - set(categories))
+        self.missing_subcategories = sorted(set(existing_subcategories) - set(subcategories))
+
+    @property
+    def has_changes(self):
+        return any((self.new_categories, self.changed_categories, self.new_subcategories, self.changed_subcategories))
+
+    def summary(self):
+        return {
+            'categories_created': len(self.new_categories),
+            'categories_updated': len(self.changed_categories),
+            'subcategories_created': len(self.new_subcategories),
+            'subcategories_updated': len(self.changed_subcategories),
+            'categories_not_in_file': len(self.missing_categories),
+            'subcategories_not_in_file': len(self.missing_subcategories),
+        }
+
+    def apply(self):
+        """Write the changes in one transaction, a bulk upsert per table"""
+        if not self.has_changes:
+            return
+        with transaction.atomic():
+            Category.objects.bulk_create(
+                [
+                    Category(slug=slug, **self.categories[slug])
+                    for slug in self.new_categories + self.changed_categories
+                ],
+                update_conflicts=True, unique_fields=['slug'], update_fields=list(FIELDS),
+            )
+            category_ids = dict(Category.objects.values_list('slug', 'id'))
+            SubCategory.objects.bulk_create(
+                [
+                    SubCategory(category_id=category_ids[key[0]], slug=key[1], **self.subcategories[key])
+                    for key in self.new_subcategories + self.changed_subcategories
+                ],
+                update_conflicts=True, unique_fields=['category', 'slug'], update_fields=list(FIELDS),
+                batch_size=1000,
+            )
+            # Bulk writes skip the signals that expire the cached taxonomy
+            invalidate_taxonomy()
+            transaction.on_commit(invalidate_taxonomy)
+
+
+def diff(wanted, existing):
+    new, changed = [], []
+    for key, values in wanted.items():
+        row = existing.get(key)
+        if row is None:
+            new.append(key)
+        elif any(row[field] != values[field] for field in FIELDS):
+            changed.append(key)
+    return new, changed
+
+
+def load_taxonomy(paths=(DEFAULT_TAXONOMY_FILE,), dry_run=False):
+    """
+    Bring the categories and subcategories in line with taxonomy files.
+    Returns the TaxonomyPlan and the seconds spent reading, diffing and
+    writing.
+    """
+    timings = {}
+    started = time.perf_counter()
+    categories, subcategories = parse([read_file(path) for path in paths])
+    timings['read'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    plan = TaxonomyPlan(categories, subcategories)
+    timings['diff'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if not dry_run:
+        plan.apply()
+    timings['write'] = time.perf_counter() - started
+    return plan, timings
@@ -0,0 +1,16 @@
+from django import template
+
+from listings.taxonomy import SubCategoryNode
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def stats_for(context, node):
+    """
+    The precomputed stats of a category or subcategory node, from the view's
+    `category_stats`. Its `median_price` may lag, see stats.get_category_stats().
+    """
+    stats = context.get('category_stats') or {}
+    group = stats.get('subcategories' if isinstance(node, SubCategoryNode) else 'categories', {})
+    return group.get(node.id)
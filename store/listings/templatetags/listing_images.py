@@ -0,0 +1,32 @@
+from django import template
+from django.utils.html import format_html
+
+from listings.images import variant_urls, srcset
+
+register = template.Library()
+
+
+@register.simple_tag
+def prime_variants(items, variant):
+    """
+    Build the URLs of one variant for a whole page of listings (their primary
+    images) or images in a single batch, so later image_srcset tags are free.
+    """
+    images = []
+    for item in items:
+        image = item.get_primary_image() if hasattr(item, 'get_primary_image') else item
+        if image is not None and image.image:
+            images.append(image)
+    urls = variant_urls([image.public_id for image in images], variant)
+    for image in images:
+        image.__dict__.setdefault('_variant_urls', {})[variant] = urls[image.public_id]
+    return ''
+
+
+@register.simple_tag
+def image_srcset(image, variant):
+    """src and srcset attributes of an image variant"""
+    urls = image.get_variant_urls(variant)
+    if not urls:
+        return ''
+    return format_html('src="{}" srcset="{}"', urls[0], srcset(urls))
@@ -0,0 +1,10 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class BudgetTestRunner(DiscoverRunner):
+    """Test runner that turns query budget warnings into failures"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.QUERY_BUDGET_STRICT = True
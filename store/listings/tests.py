@@ -1,3 +1,1531 @@
-from django.test import TestCase
+import csv
+import importlib
+import io
+import itertools
+import json
+import os
+import re
+import tempfile
+from types import SimpleNamespace
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import cloudinary
+from asgiref.sync import sync_to_async
+from PIL import Image
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.apps import apps as django_apps
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone, translation
+
+from .forms import ListingSearchForm
+from .models import User, ArchivedListing, ArchivedListingImage, Category, CategoryStats, City, SubCategory, Listing, ListingImage, ListingStatusEvent, RelatedListing, SellerDailyStats
+from .pagination import KeysetPaginator
+from .search import get_search_backend
+from .views import apply_listing_filters
+from .suggestions import TaxonomyTrie
+from .taxonomy import get_taxonomy, invalidate_taxonomy
+from . import facets as facets_module
+from . import api, benchmarks, dashboard, images, imports, lifecycle, instrumentation, locations, retention, stats, taxonomy_loader, uploads, view_counter
+
+# URL building is offline, it only needs a cloud name to format the URLs
+cloudinary.config(cloud_name='ethagora-test')
+
+
+class ListingFixturesMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(
+            username='seller', email='seller@example.com', password='pass12345'
+        )
+        cls.category = Category.objects.create(name='Electronics', slug='electronics', icon='laptop')
+        cls.subcategory = SubCategory.objects.create(
+            category=cls.category, name='Laptops', slug='laptops', icon='laptop'
+        )
+
+    @classmethod
+    def create_listings(cls, count, images_per_listing=2, **overrides):
+        listings = []
+        for i in range(count):
+            fields = {
+                'title': f'Laptop {i}',
+                'description': 'A fast laptop in good shape',
+                'price': 100 + i,
+                'category': cls.category,
+                'subcategory': cls.subcategory,
+                'condition': 'used',
+                'location': 'Addis Ababa',
+                'contact_telegram': '@seller',
+                'seller': cls.seller,
+            }
+            fields.update(overrides)
+            listing = Listing.objects.create(**fields)
+            for n in range(images_per_listing):
+                ListingImage.objects.create(
+                    listing=listing, image=f'listings/laptop-{i}-{n}', is_primary=(n == 1)
+                )
+            listings.append(listing)
+        return listings
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=0)
+class ListingCardQueryTests(ListingFixturesMixin, TestCase):
+    def count_queries(self, url, **params):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def assertConstantQueries(self, url, **params):
+        self.create_listings(2)
+        small = self.count_queries(url, **params)
+        self.create_listings(10)
+        large = self.count_queries(url, **params)
+        self.assertEqual(small, large)
+
+    def test_home_query_count_is_constant(self):
+        self.assertConstantQueries(reverse('home'))
+
+    def test_listings_view_query_count_is_constant(self):
+        self.assertConstantQueries(reverse('listings'))
+
+    def test_filter_listings_query_count_is_constant(self):
+        self.assertConstantQueries(reverse('filter_listings'), category=self.category.pk)
+
+    def test_my_listings_query_count_is_constant(self):
+        self.client.force_login(self.seller)
+        self.assertConstantQueries(reverse('my_listings'))
+
+    def test_listing_detail_query_count_is_constant(self):
+        listing = self.create_listings(1)[0]
+        self.assertConstantQueries(reverse('listing_detail', kwargs={'pk': listing.pk}))
+
+    def test_primary_image_prefers_flagged_image(self):
+        listing = self.create_listings(1)[0]
+        card = Listing.objects.with_card_data().get(pk=listing.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(card.get_primary_image().is_primary)
+        listing.refresh_from_db()
+        self.assertEqual(listing.get_primary_image(), listing.images.get(is_primary=True))
+
+    def test_primary_image_falls_back_to_first_image(self):
+        listing = self.create_listings(1, images_per_listing=0)[0]
+        first = ListingImage.objects.create(listing=listing, image='listings/first')
+        ListingImage.objects.create(listing=listing, image='listings/second')
+        card = Listing.objects.with_card_data().get(pk=listing.pk)
+        self.assertEqual(card.get_primary_image(), first)
+
+    def test_cards_render_without_image_queries(self):
+        self.create_listings(3)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('home'))
+        self.assertFalse(any('listings_listingimage' in q['sql'] for q in ctx.captured_queries))
+
+    def test_one_primary_image_per_listing(self):
+        listing = self.create_listings(1)[0]
+        first, second = listing.images.order_by('pk')
+        first.is_primary = True
+        first.save()
+        self.assertEqual(list(listing.images.filter(is_primary=True)), [first])
+        listing.refresh_from_db()
+        self.assertEqual((listing.primary_image_id, listing.thumbnail_public_id), (first.pk, first.public_id))
+        self.assertIn(first.public_id, listing.thumbnail_url)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ListingImage.objects.filter(pk=second.pk).update(is_primary=True)
+
+        first.delete()
+        listing.refresh_from_db()
+        self.assertEqual(listing.primary_image_id, second.pk)
+
+    def test_backfill_migration(self):
+        listing = self.create_listings(1)[0]
+        Listing.objects.filter(pk=listing.pk).update(primary_image=None, thumbnail_public_id='', thumbnail_url='')
+        migration = importlib.import_module('listings.migrations.0008_listing_primary_image')
+        migration.backfill_primary_images(django_apps, SimpleNamespace(connection=connection))
+        listing.refresh_from_db()
+        self.assertEqual(listing.primary_image, listing.images.get(is_primary=True))
+        self.assertTrue(listing.thumbnail_url)
+
+
+class ListingSearchTests(ListingFixturesMixin, TestCase):
+    def search(self, query):
+        listings = get_search_backend().search(Listing.objects.available(), query)
+        return list(listings.order_by('-search_rank').values_list('title', flat=True))
+
+    def test_search_matches_title_and_description(self):
+        self.create_listings(1, images_per_listing=0, title='Dell XPS', description='Silver ultrabook')
+        self.create_listings(1, images_per_listing=0, title='Office chair', description='Ergonomic')
+        self.assertEqual(self.search('dell'), ['Dell XPS'])
+        self.assertEqual(self.search('ultrabook'), ['Dell XPS'])
+
+    def test_search_matches_word_prefixes(self):
+        self.create_listings(1, images_per_listing=0, title='Samsung Galaxy')
+        self.assertEqual(self.search('sams gal'), ['Samsung Galaxy'])
+
+    def test_title_matches_rank_above_description_matches(self):
+        self.create_listings(1, images_per_listing=0, title='Phone case', description='Fits most models')
+        self.create_listings(1, images_per_listing=0, title='Tecno Spark phone', description='Like new')
+        self.create_listings(1, images_per_listing=0, title='Leather wallet', description='Has a phone pocket')
+        self.assertEqual(self.search('phone')[-1], 'Leather wallet')
+
+    def test_index_follows_edits(self):
+        listing = self.create_listings(1, images_per_listing=0, title='Old title')[0]
+        listing.title = 'Mountain bike'
+        listing.save()
+        self.assertEqual(self.search('old'), [])
+        self.assertEqual(self.search('mountain'), ['Mountain bike'])
+        listing.delete()
+        self.assertEqual(self.search('mountain'), [])
+
+    def test_filter_listings_sorts_by_relevance(self):
+        self.create_listings(1, images_per_listing=0, title='Wallet', description='Leather with a phone pocket')
+        self.create_listings(1, images_per_listing=0, title='Phone charger', description='Fast')
+        response = self.client.get(reverse('filter_listings'), {'search': 'phone', 'sort_by': 'relevance'})
+        html = response.json()['listings_html']
+        self.assertLess(html.index('Phone charger'), html.index('Wallet'))
+
+
+class SearchSuggestionTests(ListingFixturesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def suggest(self, query):
+        response = self.client.get(
+            reverse('search_suggestions'), {'q': query}, HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        return [(s['type'], s['name']) for s in response.json()['suggestions']]
+
+    def test_trie_matches_any_word_prefix(self):
+        trie = TaxonomyTrie()
+        trie.insert('Mobile Phones', {'key': 1, 'name': 'Mobile Phones'})
+        trie.insert('Phone Cases', {'key': 2, 'name': 'Phone Cases'})
+        trie.insert('Laptops', {'key': 3, 'name': 'Laptops'})
+        self.assertEqual([e['name'] for e in trie.search('PHO', 5)], ['Phone Cases', 'Mobile Phones'])
+        self.assertEqual(trie.search('xyz', 5), [])
+
+    def test_suggests_taxonomy_and_products(self):
+        stands = SubCategory.objects.create(category=self.category, name='Stands', slug='stands')
+        self.create_listings(1, images_per_listing=0, title='Lapdesk stand', subcategory=stands)
+        self.assertEqual(self.suggest('lap'), [
+            ('subcategory', 'Laptops'),
+            ('product', 'Lapdesk stand'),
+        ])
+
+    def test_index_rebuilds_when_taxonomy_changes(self):
+        self.assertEqual(self.suggest('cam'), [('search', "Search results for 'cam'")])
+        SubCategory.objects.create(category=self.category, name='Cameras', slug='cameras')
+        self.assertEqual(self.suggest('cam'), [('subcategory', 'Cameras')])
+
+    def test_suggestions_are_cached_per_normalized_query(self):
+        self.suggest('Laptops')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('  laptops '), [('subcategory', 'Laptops')])
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=0)
+class ViewCounterTests(ListingFixturesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        view_counter.buffer.drain()
+
+    def view(self, listing, ip='10.0.0.1'):
+        return self.client.get(reverse('listing_detail', kwargs={'pk': listing.pk}), REMOTE_ADDR=ip)
+
+    def test_detail_view_does_not_write(self):
+        listing = self.create_listings(1, images_per_listing=0)[0]
+        with CaptureQueriesContext(connection) as ctx:
+            self.view(listing)
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')])
+        self.assertEqual(view_counter.buffer.pending(listing.pk), 1)
+
+    def test_flush_applies_buffered_views(self):
+        first, second = self.create_listings(2, images_per_listing=0)
+        for ip in ('10.0.0.1', '10.0.0.2', '10.0.0.3'):
+            self.view(first, ip)
+        self.view(second)
+        # The counts, then the sellers' daily rows: look up, insert, add
+        with self.assertNumQueries(5):
+            self.assertEqual(view_counter.buffer.flush(), 4)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.view_count, second.view_count), (3, 1))
+        self.assertEqual(SellerDailyStats.objects.get(seller=self.seller, date=timezone.localdate()).views, 4)
+        self.assertEqual(view_counter.buffer.flush(), 0)
+
+    def test_repeat_views_within_window_count_once(self):
+        listing = self.create_listings(1, images_per_listing=0)[0]
+        self.view(listing)
+        self.view(listing)
+        self.assertEqual(view_counter.buffer.pending(listing.pk), 1)
+        with override_settings(VIEW_COUNT_DEDUP_WINDOW=0):
+            self.view(listing)
+        self.assertEqual(view_counter.buffer.pending(listing.pk), 2)
+
+    def test_forwarded_for_header_is_not_trusted(self):
+        listing = self.create_listings(1, images_per_listing=0)[0]
+        for spoofed in ('1.1.1.1', '2.2.2.2'):
+            self.client.get(
+                reverse('listing_detail', kwargs={'pk': listing.pk}),
+                REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR=spoofed,
+            )
+        self.assertEqual(view_counter.buffer.pending(listing.pk), 1)
+
+
+class KeysetPaginationTests(ListingFixturesMixin, TestCase):
+    def walk(self, queryset, per_page=3):
+        paginator = KeysetPaginator(queryset, per_page)
+        page, seen = paginator.get_page(), []
+        while True:
+            seen.extend(listing.pk for listing in page)
+            if not page.has_next():
+                return seen
+            page = paginator.get_page(page.next_cursor)
+
+    def test_walks_every_ordering_without_gaps_or_repeats(self):
+        listings = self.create_listings(7, images_per_listing=0)
+        # Ties on price and created_at are broken by id
+        Listing.objects.filter(pk__in=[l.pk for l in listings[:4]]).update(price=50)
+        queryset = Listing.objects.available()
+        for ordering in (('-created_at', '-id'), ('price', 'id'), ('-price', '-id'), ('created_at',)):
+            expected = list(queryset.order_by(*ordering, 'id').values_list('pk', flat=True))
+            self.assertEqual(self.walk(queryset.order_by(*ordering)), expected, ordering)
+
+    def test_previous_cursor_returns_previous_page(self):
+        self.create_listings(7, images_per_listing=0)
+        paginator = KeysetPaginator(Listing.objects.order_by('price', 'id'), 3)
+        first = paginator.get_page()
+        second = paginator.get_page(first.next_cursor)
+        self.assertFalse(first.has_previous())
+        self.assertEqual(list(paginator.get_page(second.previous_cursor)), list(first))
+
+    def test_invalid_or_foreign_cursor_falls_back_to_first_page(self):
+        self.create_listings(4, images_per_listing=0)
+        by_price = KeysetPaginator(Listing.objects.order_by('price', 'id'), 2)
+        by_date = KeysetPaginator(Listing.objects.order_by('-created_at', '-id'), 2)
+        cursor = by_price.get_page().next_cursor
+        self.assertEqual(list(by_date.get_page(cursor)), list(by_date.get_page()))
+        self.assertEqual(list(by_date.get_page('not-a-cursor')), list(by_date.get_page()))
+
+    def test_filter_listings_returns_cursors(self):
+        self.create_listings(14, images_per_listing=0)
+        data = self.client.get(reverse('filter_listings'), {'sort_by': 'price_low'}).json()
+        self.assertTrue(data['has_next'])
+        self.assertEqual(data['total_count'], 14)
+        data = self.client.get(reverse('filter_listings'), {'sort_by': 'price_low', 'cursor': data['next_cursor']}).json()
+        self.assertFalse(data['has_next'])
+        self.assertIn('Laptop 13', data['listings_html'])
+        self.assertIsNotNone(data['previous_cursor'])
+
+
+class BrowseQueryPlanTests(ListingFixturesMixin, TestCase):
+    """Every ListingSearchForm combination must be served from an index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        subcategories = [cls.subcategory] + [
+            SubCategory.objects.create(category=category, name=f'Sub {n}', slug=f'sub-{n}')
+            for n, category in enumerate(
+                [cls.category] + [Category.objects.create(name=f'Cat {n}', slug=f'cat-{n}') for n in range(4)]
+            )
+        ]
+        Listing.objects.bulk_create([
+            Listing(
+                title=f'Item {i}', description='Seeded', price=i % 500,
+                category_id=subcategories[i % len(subcategories)].category_id,
+                subcategory=subcategories[i % len(subcategories)],
+                condition=('new', 'used')[i % 2], status=('available', 'sold', 'removed')[i % 3],
+                location='Addis Ababa', contact_telegram='@seller', seller=cls.seller,
+            )
+            for i in range(600)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def full_table_scan(self, plan):
+        if connection.vendor == 'postgresql':
+            return 'Seq Scan on listings_listing' in plan
+        return re.search(r'\bSCAN listings_listing\b(?! USING)', plan) is not None
+
+    def test_every_filter_combination_uses_an_index(self):
+        if connection.vendor == 'postgresql':
+            # The seeded table is tiny; ask whether an index *can* serve the query
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        filters = {
+            'search': 'item',
+            'category': self.category,
+            'subcategory': self.subcategory,
+            'condition': 'new',
+            'min_price': 10,
+            'max_price': 300,
+        }
+        sorts = ['relevance', 'newest', 'oldest', 'price_low', 'price_high']
+        for size in range(len(filters) + 1):
+            for names in itertools.combinations(filters, size):
+                for sort_by in sorts:
+                    data = {name: filters[name] for name in names}
+                    data['sort_by'] = sort_by
+                    plan = apply_listing_filters(Listing.objects.available(), data).explain()
+                    self.assertFalse(self.full_table_scan(plan), f'{data}\n{plan}')
+
+
+class TaxonomyCacheTests(ListingFixturesMixin, TestCase):
+    def setUp(self):
+        get_taxonomy()
+
+    def test_subcategories_are_served_from_memory(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('get_subcategories'), {'category_id': self.category.pk})
+        self.assertEqual(response.json(), [{'id': self.subcategory.pk, 'name': 'Laptops', 'icon': 'laptop'}])
+
+    def test_search_form_validates_without_queries(self):
+        with self.assertNumQueries(0):
+            form = ListingSearchForm({'category': self.category.pk, 'subcategory': self.subcategory.pk})
+            self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['category'], self.category.pk)
+        self.assertFalse(ListingSearchForm({'category': 0}).is_valid())
+
+    def test_changes_reload_the_taxonomy(self):
+        SubCategory.objects.create(category=self.category, name='Desktops', slug='desktops')
+        names = [s.name for s in get_taxonomy().subcategories_for(self.category.pk)]
+        self.assertEqual(names, ['Desktops', 'Laptops'])
+        self.category.delete()
+        self.assertEqual(get_taxonomy().categories, [])
+
+    def test_reloads_after_cache_flush(self):
+        Category.objects.filter(pk=self.category.pk).update(name='Gadgets')
+        cache.clear()
+        self.assertEqual(get_taxonomy().categories[0].name, 'Gadgets')
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=0)
+class ImageVariantTests(ListingFixturesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        images.local_urls.clear()
+
+    def test_variant_urls_carry_the_registry_transformation(self):
+        urls = images.variant_urls(['listings/a'], 'card')['listings/a']
+        self.assertEqual(len(urls), len(images.DENSITIES))
+        self.assertIn('c_fill', urls[0])
+        self.assertIn('h_300', urls[0])
+        self.assertIn('w_400', urls[0])
+        self.assertIn('dpr_2.0', urls[1])
+        with self.assertRaises(ValueError):
+            images.variant_urls(['listings/a'], 'poster')
+
+    def test_urls_are_built_once(self):
+        with mock.patch.object(images, 'build_urls', wraps=images.build_urls) as build:
+            images.variant_urls(['listings/a', 'listings/b'], 'thumb')
+            images.variant_urls(['listings/a', 'listings/b'], 'thumb')
+            self.assertEqual(build.call_count, 2)
+            # Another worker finds them in the shared cache
+            images.local_urls.clear()
+            images.variant_urls(['listings/a'], 'thumb')
+            self.assertEqual(build.call_count, 2)
+
+    def test_local_cache_is_bounded(self):
+        local = images.VariantURLCache(2)
+        for key in 'abc':
+            local.set(key, (key,))
+        self.assertIsNone(local.get('a'))
+        self.assertEqual(local.get('c'), ('c',))
+
+    def test_cards_render_srcset(self):
+        self.create_listings(3)
+        with mock.patch.object(images, 'build_urls', wraps=images.build_urls) as build:
+            response = self.client.get(reverse('listings'))
+        self.assertEqual(build.call_count, 3)
+        self.assertContains(response, 'srcset="', count=3)
+        self.assertContains(response, 'c_fill,dpr_2.0,f_auto,h_300,q_auto:good,w_400')
+
+
+def photo(name='photo.png'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), 'red').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class ImageUploadPipelineTests(ListingFixturesMixin, TestCase):
+    def setUp(self):
+        staging = tempfile.TemporaryDirectory()
+        self.addCleanup(staging.cleanup)
+        self.staging = staging.name
+        settings_override = override_settings(
+            IMAGE_STAGING_ROOT=self.staging,
+            IMAGE_UPLOAD_BACKEND='listings.uploads.FileSystemUploadBackend',
+            IMAGE_UPLOAD_WORKERS=0,
+            IMAGE_UPLOAD_RETRY_DELAY=0,
+            VIEW_COUNT_FLUSH_INTERVAL=0,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client.force_login(self.seller)
+
+    def post_listing(self, *files, primary=(0,)):
+        data = {
+            'title': 'Gaming laptop', 'description': 'Barely used', 'price': '900',
+            'category': self.category.pk, 'subcategory': self.subcategory.pk,
+            'condition': 'used', 'location': 'Addis Ababa', 'contact_telegram': '@seller',
+            'images-TOTAL_FORMS': len(files), 'images-INITIAL_FORMS': 0,
+            'images-MIN_NUM_FORMS': 0, 'images-MAX_NUM_FORMS': 1000,
+        }
+        for i, file in enumerate(files):
+            data[f'images-{i}-image'] = file
+        for i in primary:
+            data[f'images-{i}-is_primary'] = 'on'
+        response = self.client.post(reverse('create_listing'), data)
+        self.assertEqual(response.status_code, 302)
+        return Listing.objects.get(title='Gaming laptop')
+
+    def test_listing_is_saved_before_photos_upload(self):
+        with mock.patch.object(uploads.FileSystemUploadBackend, 'upload') as upload:
+            with self.captureOnCommitCallbacks():
+                listing = self.post_listing(photo('a.png'), photo('b.png'))
+            upload.assert_not_called()
+        self.assertEqual(
+            list(listing.images.values_list('status', flat=True)), ['pending', 'pending']
+        )
+        self.assertIsNone(listing.get_primary_image())
+
+    def test_staged_photos_are_uploaded(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            listing = self.post_listing(photo('a.png'), photo('b.png'))
+        images = list(listing.images.order_by('pk'))
+        self.assertEqual([image.status for image in images], ['ready', 'ready'])
+        self.assertTrue(all(image.public_id.startswith('listings/') for image in images))
+        self.assertEqual(os.listdir(self.staging), ['uploaded'])
+        listing.refresh_from_db()
+        self.assertEqual(listing.get_primary_image(), images[0])
+
+    def test_first_ticked_photo_stays_primary(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            listing = self.post_listing(photo('a.png'), photo('b.png'), photo('c.png'), primary=(1, 2))
+        images = list(listing.images.order_by('pk'))
+        self.assertEqual([image.is_primary for image in images], [False, True, False])
+        listing.refresh_from_db()
+        self.assertEqual(listing.primary_image, images[1])
+
+    def test_failed_uploads_are_retried_then_marked_failed(self):
+        with mock.patch.object(uploads.FileSystemUploadBackend, 'upload', side_effect=OSError('timeout')) as upload:
+            with self.assertLogs('listings.uploads', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+                listing = self.post_listing(photo())
+        image = listing.images.get()
+        self.assertEqual(upload.call_count, 3)
+        self.assertEqual((image.status, image.attempts, image.error), ('failed', 3, 'timeout'))
+        self.assertTrue(image.staged_file)
+
+        call_command('process_image_uploads', '--retry-failed', stdout=io.StringIO())
+        image.refresh_from_db()
+        self.assertEqual(image.status, 'ready')
+        self.assertEqual(image.staged_file, '')
+
+    def test_images_are_claimed_before_upload(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            listing = self.post_listing(photo())
+        image = listing.images.get()
+        self.assertIsNotNone(uploads.queue.claim(image.pk))
+        # The pool or the command got there first
+        with mock.patch.object(uploads.FileSystemUploadBackend, 'upload') as upload:
+            self.assertIsNone(uploads.queue.process(image.pk))
+            call_command('process_image_uploads', stdout=io.StringIO())
+        upload.assert_not_called()
+
+        ListingImage.objects.filter(pk=image.pk).update(claimed_at=timezone.now() - timezone.timedelta(hours=1))
+        call_command('process_image_uploads', stdout=io.StringIO())
+        image.refresh_from_db()
+        self.assertEqual((image.status, image.claimed_at), ('ready', None))
+
+    def test_pool_workers_schedule_retries_instead_of_sleeping(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            listing = self.post_listing(photo())
+        image = listing.images.get()
+        with mock.patch.object(uploads.FileSystemUploadBackend, 'upload', side_effect=OSError('timeout')), \
+                mock.patch('listings.uploads.threading.Timer') as timer, \
+                mock.patch('listings.uploads.time.sleep') as sleep, \
+                mock.patch('listings.uploads.connections'), self.assertLogs('listings.uploads', 'WARNING'):
+            uploads.queue._run(image.pk)
+        sleep.assert_not_called()
+        timer.assert_called_once_with(0, uploads.queue.submit, [[image.pk]])
+        image.refresh_from_db()
+        self.assertEqual((image.status, image.attempts), ('pending', 1))
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=0)
+class PageCacheTests(ListingFixturesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.listing = self.create_listings(1)[0]
+
+    def test_anonymous_pages_are_served_from_cache(self):
+        for url in (reverse('home'), reverse('listings'), self.listing.get_absolute_url()):
+            self.client.get(url)
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+            self.assertContains(response, 'Laptop 0')
+            self.assertIn('Accept-Language', response['Vary'])
+            self.assertIn('Cookie', response['Vary'])
+
+    def test_listing_changes_expire_cached_pages(self):
+        url = reverse('listings')
+        self.client.get(url)
+        self.listing.title = 'Renamed laptop'
+        self.listing.save()
+        self.assertContains(self.client.get(url), 'Renamed laptop')
+        self.client.get(url)
+        self.listing.images.first().delete()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        self.assertTrue(ctx.captured_queries)
+
+    def test_cache_varies_on_language_and_auth(self):
+        url = reverse('home')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url, HTTP_ACCEPT_LANGUAGE='am')
+        self.assertTrue(ctx.captured_queries)
+        self.client.force_login(self.seller)
+        self.assertContains(self.client.get(url), 'seller@example.com')
+
+    def test_cached_detail_still_counts_views(self):
+        url = self.listing.get_absolute_url()
+        self.client.get(url)
+        view_counter.buffer.drain()
+        with override_settings(VIEW_COUNT_DEDUP_WINDOW=0):
+            self.client.get(url)
+        self.assertEqual(view_counter.buffer.drain(), {self.listing.pk: 1})
+
+    def test_image_changes_touch_the_listing(self):
+        before = Listing.objects.get(pk=self.listing.pk).updated_at
+        image = ListingImage.objects.filter(listing=self.listing, is_primary=False).first()
+        # Upload retries and other saves that leave the primary photo alone don't
+        with CaptureQueriesContext(connection) as ctx:
+            image.attempts += 1
+            image.save(update_fields=['attempts', 'error'])
+            image.save()
+        self.assertEqual(len(ctx.captured_queries), 2)
+        self.assertEqual(Listing.objects.get(pk=self.listing.pk).updated_at, before)
+
+        image.is_primary = True
+        image.save()
+        listing = Listing.objects.get(pk=self.listing.pk)
+        self.assertGreater(listing.updated_at, before)
+        self.assertEqual(listing.primary_image_id, image.pk)
+
+    def test_empty_thumbnail_urls_are_refreshed(self):
+        Listing.objects.filter(pk=self.listing.pk).update(thumbnail_url='')
+        out = io.StringIO()
+        call_command('process_image_uploads', refresh_thumbnails=True, stdout=out)
+        self.assertIn('laptop-0-1', Listing.objects.get(pk=self.listing.pk).thumbnail_url)
+        self.assertIn('1 thumbnail URLs refreshed', out.getvalue())
+
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=0)
+class ConditionalGetTests(ListingFixturesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.listing = self.create_listings(1)[0]
+
+    def test_unchanged_pages_are_not_modified(self):
+        for url in (reverse('home'), reverse('listings'), self.listing.get_absolute_url()):
+            response = self.client.get(url)
+            self.assertIn('no-cache', response['Cache-Control'])
+            with self.assertNumQueries(0):
+                response = self.client.get(url, headers={'If-None-Match': response['ETag']})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+            self.assertIn('Accept-Language', response['Vary'])
+            self.assertIn('Cookie', response['Vary'])
+
+    def test_etag_changes_with_listings_language_and_user(self):
+        url = reverse('home')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag, 'Accept-Language': 'am'}).status_code, 200)
+        self.client.force_login(self.seller)
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        self.client.logout()
+        self.listing.save()
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_detail_last_modified(self):
+        url = self.listing.get_absolute_url()
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 304)
+
+    def test_not_modified_detail_still_counts_views(self):
+        url = self.listing.get_absolute_url()
+        etag = self.client.get(url)['ETag']
+        view_counter.buffer.drain()
+        with override_settings(VIEW_COUNT_DEDUP_WINDOW=0):
+            self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(view_counter.buffer.drain(), {self.listing.pk: 1})
+
+class BenchmarkCommandTests(ListingFixturesMixin, TestCase):
+    def test_seed_then_benchmark_every_endpoint(self):
+        call_command('seed_marketplace', listings=30, users=3, batch_size=8, stdout=io.StringIO())
+        self.assertEqual(Listing.objects.filter(seller__username__startswith='bench-').count(), 30)
+        self.assertEqual(ListingImage.objects.filter(listing__seller__username__startswith='bench-').count(), 60)
+        # Seeded rows are searchable like ones saved through the ORM
+        self.assertTrue(get_search_backend().search(Listing.objects.all(), 'laptops').exists())
+
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as output:
+            call_command(
+                'benchmark', requests=2, warmup=0, profile_samples=1, output=output.name, stderr=io.StringIO(),
+            )
+            report = json.load(output)
+        self.assertEqual(set(report['endpoints']), set(benchmarks.ENDPOINTS))
+        for result in report['endpoints'].values():
+            self.assertEqual(result['errors'], 0)
+            self.assertIsNotNone(result['queries_max'])
+        self.assertEqual(benchmarks.compare(report, report, tolerance=0), [])
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=0, PAGE_CACHE_TIMEOUT=0)
+class QueryInstrumentationTests(ListingFixturesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        instrumentation.stats.reset()
+        self.listing = self.create_listings(1)[0]
+
+    def server_timing(self, response):
+        return dict(
+            re.match(r'(\w+);dur=([\d.]+)', part.strip()).groups()
+            for part in response['Server-Timing'].split(',') if 'dur=' in part
+        )
+
+    def test_reports_queries_and_timings(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.listing.get_absolute_url())
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries', response['Server-Timing'])
+        timings = self.server_timing(response)
+        self.assertGreater(float(timings['tpl']), 0)
+        self.assertGreaterEqual(float(timings['app']), float(timings['db']))
+        snapshot = instrumentation.stats.snapshot()['listing_detail']
+        self.assertEqual(snapshot['requests'], 1)
+        self.assertEqual(snapshot['queries_max'], len(ctx.captured_queries))
+
+    async def test_records_queries_under_asgi(self):
+        response = await self.async_client.get(reverse('listings'))
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries')
+
+    def test_fingerprints_collapse_parameters(self):
+        self.assertEqual(
+            instrumentation.fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s) LIMIT 21'),
+            instrumentation.fingerprint('SELECT * FROM t WHERE id IN (%s) LIMIT 1'),
+        )
+
+    def test_budget_fails_strictly_and_warns_otherwise(self):
+        with override_settings(QUERY_BUDGETS={'home': 1}):
+            with self.assertRaises(instrumentation.QueryBudgetExceeded):
+                self.client.get(reverse('home'))
+            with override_settings(QUERY_BUDGET_STRICT=False), self.assertLogs('listings.instrumentation', 'WARNING'):
+                self.assertEqual(self.client.get(reverse('home')).status_code, 200)
+        self.assertEqual(instrumentation.stats.snapshot()['home']['over_budget'], 2)
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=0)
+class AsyncEndpointTests(ListingFixturesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.create_listings(15)
+
+    async def test_filter_listings_pages_and_counts(self):
+        response = await self.async_client.get(reverse('filter_listings'), {'sort_by': 'price_low'})
+        data = response.json()
+        self.assertEqual((data['total_count'], data['count_is_estimate']), (15, False))
+        self.assertTrue(data['has_next'])
+        self.assertEqual(data['listings_html'].count('srcset="'), 12)
+
+        response = await self.async_client.get(
+            reverse('filter_listings'), {'sort_by': 'price_low', 'cursor': data['next_cursor']}
+        )
+        self.assertEqual(response.json()['listings_html'].count('srcset="'), 3)
+
+    async def test_async_paginator_matches_sync(self):
+        listings = Listing.objects.available().order_by('-price')
+        paginator = KeysetPaginator(listings, 4)
+        page = await paginator.aget_page()
+        expected = await sync_to_async(paginator.get_page)()
+        self.assertEqual([listing.pk for listing in page], [listing.pk for listing in expected])
+        self.assertEqual(await paginator.acount(), (15, False))
+
+    async def test_search_suggestions_and_subcategories(self):
+        response = await self.async_client.get(
+            reverse('search_suggestions'), {'q': 'lapt'}, headers={'X-Requested-With': 'XMLHttpRequest'}
+        )
+        types = {suggestion['type'] for suggestion in response.json()['suggestions']}
+        self.assertEqual(types, {'subcategory'})
+        response = await self.async_client.get(reverse('get_subcategories'), {'category_id': self.category.pk})
+        self.assertEqual([s['name'] for s in response.json()], ['Laptops'])
+
+
+class FacetCountTests(ListingFixturesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.other = Category.objects.create(name='Furniture', slug='furniture', icon='couch')
+        self.chairs = SubCategory.objects.create(category=self.other, name='Chairs', slug='chairs', icon='chair')
+        self.create_listings(3, images_per_listing=0)
+        self.create_listings(2, images_per_listing=0, condition='new', price=2500)
+        self.create_listings(
+            1, images_per_listing=0, category=self.other, subcategory=self.chairs, price=50000,
+        )
+
+    def counts(self, facets, name, key='id'):
+        return {facet[key]: facet['count'] for facet in facets[name]}
+
+    def test_every_facet_in_one_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            facets = facets_module.facet_counts({'condition': 'used'})
+        self.assertEqual(len([q for q in ctx.captured_queries if 'COUNT' in q['sql']]), 1)
+        self.assertEqual(facets['total'], 4)
+        # A facet ignores its own filter, so the alternatives keep their counts
+        self.assertEqual(self.counts(facets, 'conditions', 'value'), {'new': 2, 'used': 4})
+        self.assertEqual(self.counts(facets, 'categories'), {self.other.pk: 1, self.category.pk: 3})
+        self.assertEqual(
+            [bucket['count'] for bucket in facets['price_buckets']], [3, 0, 0, 1, 0],
+        )
+
+    def test_subcategories_follow_the_selected_category(self):
+        facets = facets_module.facet_counts({'category': self.category.pk, 'min_price': Decimal('1000')})
+        self.assertEqual(self.counts(facets, 'subcategories'), {self.subcategory.pk: 2})
+        self.assertEqual(self.counts(facets, 'categories'), {self.other.pk: 1, self.category.pk: 2})
+        self.assertEqual([bucket['count'] for bucket in facets['price_buckets']], [3, 2, 0, 0, 0])
+
+    def test_cached_per_filter_signature(self):
+        facets_module.facet_counts({'search': 'Laptop', 'sort_by': 'newest'})
+        with self.assertNumQueries(0):
+            facets_module.facet_counts({'search': '  laptop ', 'sort_by': 'price_low'})
+        with self.assertNumQueries(1):
+            facets_module.facet_counts({'search': 'laptop', 'condition': 'new'})
+
+        # Listing changes expire the counts
+        listing = Listing.objects.filter(condition='new').first()
+        listing.condition = 'used'
+        listing.save()
+        facets = facets_module.facet_counts({'search': 'laptop', 'condition': 'new'})
+        self.assertEqual(facets['total'], 1)
+
+    async def test_filter_listings_returns_facets(self):
+        response = await self.async_client.get(reverse('filter_listings'), {'category': self.other.pk})
+        facets = response.json()['facets']
+        self.assertEqual(facets['total'], 1)
+        self.assertEqual(self.counts(facets, 'conditions', 'value'), {'new': 0, 'used': 1})
+        self.assertEqual(self.counts(facets, 'subcategories'), {self.chairs.pk: 1})
+
+
+class ListingAPITests(ListingFixturesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.listings = self.create_listings(5)
+
+    async def test_compact_records(self):
+        response = await self.async_client.get(reverse('api_listings'), {'sort_by': 'price_low', 'limit': 2})
+        data = response.json()
+        self.assertEqual(data['version'], 1)
+        self.assertEqual([record['id'] for record in data['results']], [self.listings[0].pk, self.listings[1].pk])
+        record = data['results'][0]
+        self.assertEqual(set(record), set(api.LISTING_FIELDS))
+        self.assertEqual((record['price'], record['category_id']), ('100.00', self.category.pk))
+        self.assertIn('laptop-0-1', record['thumbnail_url'])
+        self.assertIsNotNone(data['next_cursor'])
+        # Compact separators
+        self.assertNotIn(b'": ', response.content)
+
+    async def test_field_selection(self):
+        response = await self.async_client.get(reverse('api_listings'), {'fields': 'title,id'})
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'title'})
+        response = await self.async_client.get(reverse('api_listings'), {'fields': 'title,seller'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('seller', response.json()['error'])
+
+    async def test_filters_survive_a_taxonomy_change_mid_request(self):
+        city = await City.objects.acreate(name='Adama', slug='adama')
+        apply_filters = apply_listing_filters
+
+        def reload_then_filter(listings, cleaned_data):
+            # Another worker edits the taxonomy after this request validated
+            invalidate_taxonomy()
+            return apply_filters(listings, cleaned_data)
+
+        # The reload's queries are on top of the request's own
+        with mock.patch('listings.views.apply_listing_filters', side_effect=reload_then_filter), \
+                self.settings(QUERY_BUDGET_STRICT=False):
+            response = await self.async_client.get(reverse('api_listings'), {'city': city.pk})
+        self.assertEqual(response.status_code, 200)
+
+    def test_images_not_loaded_without_thumbnails(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('api_listings'), {'fields': 'id,title'})
+        self.assertFalse(any('listings_listingimage' in q['sql'] for q in ctx.captured_queries))
+
+    def test_etag_revalidation(self):
+        url = reverse('api_listings')
+        response = self.client.get(url, {'condition': 'used'})
+        etag = response['ETag']
+        self.assertIn('must-revalidate', response['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'condition': 'used'}, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        # Other filters or changed listings make a new result set
+        response = self.client.get(url, {'condition': 'new'}, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.listings[0].save()
+        response = self.client.get(url, {'condition': 'used'}, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_gzipped_for_clients_that_accept_it(self):
+        self.create_listings(20)
+        response = self.client.get(reverse('api_listings'), headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response['ETag'].startswith('W/'))
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=0, RELATED_LISTINGS_COUNT=3)
+class RelatedListingTests(ListingFixturesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.desktops = SubCategory.objects.create(
+            category=self.category, name='Desktops', slug='desktops', icon='desktop'
+        )
+
+    def create(self, title, price, **overrides):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.create_listings(1, images_per_listing=0, title=title, price=price, **overrides)[0]
+
+    def related(self, listing):
+        return list(RelatedListing.objects.filter(listing=listing).order_by('rank').values_list('related', flat=True))
+
+    def test_new_listings_are_scored_and_offered_to_their_neighbours(self):
+        laptop = self.create('Thinkpad laptop', 1000)
+        similar = self.create('Thinkpad laptop charger', 950)
+        desktop = self.create('Gaming desktop', 1000, subcategory=self.desktops)
+        far = self.create('Old netbook', 90, location='Hawassa')
+        self.assertEqual(self.related(far), [similar.pk, laptop.pk, desktop.pk])
+        self.assertEqual(self.related(laptop), [similar.pk, far.pk, desktop.pk])
+        scores = RelatedListing.objects.filter(listing=laptop).order_by('rank').values_list('score', flat=True)
+        self.assertEqual(list(scores), sorted(scores, reverse=True))
+
+    def test_unavailable_listings_drop_out(self):
+        laptop = self.create('Thinkpad laptop', 1000)
+        sold = self.create('Thinkpad laptop charger', 950)
+        sold.status = 'sold'
+        with self.captureOnCommitCallbacks(execute=True):
+            sold.save(update_fields=['status', 'updated_at'])
+        self.assertEqual(self.related(laptop), [])
+        self.assertEqual(self.related(sold), [])
+
+    def test_detail_reads_related_in_rank_order(self):
+        listings = [self.create(f'Thinkpad {i}', 1000 + i * 300) for i in range(4)]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(listings[0].get_absolute_url())
+        self.assertEqual(
+            [listing.pk for listing in response.context['related_listings']], self.related(listings[0]),
+        )
+        self.assertEqual(len([q for q in ctx.captured_queries if 'listings_relatedlisting' in q['sql']]), 1)
+
+    def test_rebuild_command(self):
+        listings = self.create_listings(5, images_per_listing=0)
+        RelatedListing.objects.all().delete()
+        call_command('refresh_related_listings', batch_size=2, stdout=io.StringIO())
+        self.assertEqual(RelatedListing.objects.count(), 5 * 3)
+        self.assertNotIn(listings[0].pk, self.related(listings[0]))
+
+
+class TaxonomyLoaderTests(ListingFixturesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def write(self, data, suffix='.json'):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(data if isinstance(data, str) else json.dumps(data))
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_bundled_taxonomy_loads_in_bulk_and_is_idempotent(self):
+        with CaptureQueriesContext(connection) as ctx:
+            plan, timings = taxonomy_loader.load_taxonomy()
+        # The fixture's Electronics → Laptops already exist and are kept
+        self.assertEqual(len(plan.new_categories), 14)
+        self.assertEqual(len(plan.new_subcategories), 149)
+        self.assertLess(len(ctx.captured_queries), 10)
+        self.assertEqual(set(timings), {'read', 'diff', 'write'})
+        self.assertEqual(SubCategory.objects.count(), 150)
+
+        with CaptureQueriesContext(connection) as ctx:
+            plan, _ = taxonomy_loader.load_taxonomy()
+        self.assertFalse(plan.has_changes)
+        self.assertEqual(len(ctx.captured_queries), 2)
+
+    def test_localized_updates_expire_the_taxonomy(self):
+        version = get_taxonomy().version
+        path = self.write(
+            'categories:\n'
+            '  - slug: electronics\n'
+            '    name: {en: Electronics, am: ኤሌክትሮኒክስ}\n'
+            '    icon: laptop\n'
+            '    subcategories:\n'
+            '      - {slug: laptops, name: {en: Laptops, am: ላፕቶፖች}, icon: laptop}\n',
+            suffix='.yaml',
+        )
+        plan, _ = taxonomy_loader.load_taxonomy([path])
+        self.assertEqual((plan.changed_categories, plan.changed_subcategories), (['electronics'], [('electronics', 'laptops')]))
+        taxonomy = get_taxonomy()
+        self.assertNotEqual(taxonomy.version, version)
+        node = taxonomy.subcategory_by_id[self.subcategory.pk]
+        self.assertEqual(node.display_name, 'Laptops')
+        with translation.override('am'):
+            self.assertEqual(node.display_name, 'ላፕቶፖች')
+
+    def test_dry_run_writes_nothing(self):
+        path = self.write({'categories': [{'slug': 'books', 'name': 'Books', 'subcategories': [
+            {'slug': 'novels', 'name': 'Novels'},
+        ]}]})
+        out = io.StringIO()
+        call_command('load_taxonomy', path, dry_run=True, stdout=out)
+        self.assertIn('+ books/novels', out.getvalue())
+        self.assertIn('Dry run', out.getvalue())
+        self.assertFalse(Category.objects.filter(slug='books').exists())
+        call_command('load_taxonomy', path, stdout=io.StringIO())
+        self.assertTrue(SubCategory.objects.filter(category__slug='books', slug='novels').exists())
+
+    def test_invalid_files_are_rejected(self):
+        path = self.write({'categories': [{'name': 'No slug'}]})
+        with self.assertRaises(CommandError):
+            call_command('load_taxonomy', path, stdout=io.StringIO())
+
+
+class ListingImportTests(ListingFixturesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        staging = tempfile.TemporaryDirectory()
+        self.addCleanup(staging.cleanup)
+        self.staging = staging.name
+        settings_override = override_settings(
+            IMAGE_STAGING_ROOT=self.staging,
+            IMAGE_UPLOAD_BACKEND='listings.uploads.FileSystemUploadBackend',
+            IMAGE_UPLOAD_WORKERS=0,
+            IMAGE_UPLOAD_RETRY_DELAY=0,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def row(self, i, **overrides):
+        row = {
+            'title': f'Imported phone {i}', 'description': 'Sealed in the box', 'price': str(50 + i),
+            'category': 'electronics', 'subcategory': 'laptops', 'condition': 'new',
+            'location': 'Adama', 'contact_telegram': '@seller',
+        }
+        row.update(overrides)
+        return row
+
+    def write(self, rows, suffix):
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self.staging)
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            if suffix == '.csv':
+                writer = csv.DictWriter(f, fieldnames=list(self.row(0)) + ['images'])
+                writer.writeheader()
+                writer.writerows(rows)
+            else:
+                f.writelines(row if isinstance(row, str) else json.dumps(row) + '\n' for row in rows)
+        return path
+
+    def test_csv_rows_are_validated_and_created_in_chunks(self):
+        rows = [self.row(i) for i in range(5)]
+        rows[2]['price'] = 'cheap'
+        rows[3]['subcategory'] = 'phones'
+        path = self.write(rows, '.csv')
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_listings', path, seller='seller@example.com', chunk_size=2, stdout=out, stderr=err)
+
+        self.assertEqual(Listing.objects.filter(title__startswith='Imported').count(), 3)
+        listing = Listing.objects.get(title='Imported phone 4')
+        self.assertEqual((listing.seller, listing.subcategory), (self.seller, self.subcategory))
+        self.assertIn('line 4: price:', err.getvalue())
+        self.assertIn('line 5: subcategory: Not a subcategory of Electronics.', err.getvalue())
+        self.assertIn('Imported 3 of 5 rows', out.getvalue())
+        self.assertIn('rows/s', out.getvalue())
+        self.assertIn(listing, get_search_backend().search(Listing.objects.all(), 'imported'))
+
+    def test_chunk_queries_do_not_grow_with_rows(self):
+        importer = imports.ListingImporter(self.seller, chunk_size=200)
+        get_taxonomy()
+        rows = [(i, self.row(i)) for i in range(200)]
+        with CaptureQueriesContext(connection) as ctx:
+            report = list(importer.run(rows))[-1]
+        self.assertEqual(report.created, 200)
+        # Savepoints, the batched inserts, the search index and the stats rows, none per row
+        self.assertLess(len(ctx.captured_queries), 16)
+
+    def test_imported_listings_get_related_listings(self):
+        existing = self.create_listings(1, images_per_listing=0)[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            list(imports.ListingImporter(self.seller).run([(i, self.row(i)) for i in range(3)]))
+        imported = Listing.objects.filter(title__startswith='Imported').order_by('pk')
+        self.assertEqual(RelatedListing.objects.filter(listing=imported[0]).count(), 3)
+        # And are offered to the listings already there
+        self.assertEqual(RelatedListing.objects.filter(listing=existing).count(), 3)
+
+    def test_images_are_queued_and_the_first_becomes_primary(self):
+        with open(os.path.join(self.staging, 'a.png'), 'wb') as f:
+            f.write(photo('a.png').read())
+        path = self.write([
+            self.row(0, images=['https://example.com/front.jpg', 'a.png']),
+            self.row(1, images='../etc/passwd'),
+            '{not json\n',
+        ], '.jsonl')
+        err = io.StringIO()
+        with mock.patch.object(uploads.FileSystemUploadBackend, 'upload', return_value='listings/front') as upload:
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command(
+                    'import_listings', path, seller='seller', images_dir=self.staging, stdout=io.StringIO(), stderr=err,
+                )
+        self.assertEqual(upload.call_args_list[0].args, ('https://example.com/front.jpg',))
+        listing = Listing.objects.get(title='Imported phone 0')
+        images = list(listing.images.order_by('pk'))
+        self.assertEqual([image.status for image in images], ['ready', 'ready'])
+        self.assertEqual(images[0].source_url, '')
+        self.assertEqual(listing.primary_image_id, images[0].pk)
+        self.assertIn('line 2: images:', err.getvalue())
+        self.assertIn('line 3: __all__: Not a JSON object.', err.getvalue())
+
+    def test_upload_endpoint_streams_progress(self):
+        path = reverse('import_listings_upload')
+        body = '\n'.join(json.dumps(row) for row in [self.row(0), self.row(1, condition='broken')])
+        upload = SimpleUploadedFile('listings.jsonl', body.encode('utf-8'))
+        response = self.client.post(path, {'file': upload})
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(self.seller)
+        upload.seek(0)
+        response = self.client.post(path, {'file': upload})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(lines[0]['errors'][0]['line'], 2)
+        self.assertIn('condition', lines[0]['errors'][0]['errors'])
+        self.assertEqual(lines[-1]['done']['created'], 1)
+        self.assertTrue(Listing.objects.filter(title='Imported phone 0', seller=self.seller).exists())
+
+        response = self.client.post(path, {'file': SimpleUploadedFile('listings.xlsx', b'')})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=0)
+class LocationTests(ListingFixturesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        locations.load_cities()
+        self.addis, self.bishoftu, self.hawassa = (
+            City.objects.get(slug=slug) for slug in ('addis-ababa', 'bishoftu', 'hawassa')
+        )
+
+    def test_free_text_locations_are_matched(self):
+        taxonomy = get_taxonomy()
+        self.assertEqual(taxonomy.match_city('Bole, Addis Ababa').id, self.addis.pk)
+        self.assertEqual(taxonomy.match_city('  ADDIS ABEBA ').id, self.addis.pk)
+        self.assertEqual(taxonomy.match_city('Debre Zeit, Ethiopia').id, self.bishoftu.pk)
+        self.assertEqual(taxonomy.match_city('ሀዋሳ').id, self.hawassa.pk)
+        self.assertIsNone(taxonomy.match_city('Nairobi'))
+
+        listing, = self.create_listings(1, images_per_listing=0, location='Awassa')
+        self.assertEqual(listing.city_id, self.hawassa.pk)
+        listing.location = 'Nairobi'
+        listing.save()
+        self.assertIsNone(Listing.objects.get(pk=listing.pk).city_id)
+
+    def test_normalizer_updates_per_city_not_per_row(self):
+        self.create_listings(6, images_per_listing=0, location='Piassa')
+        self.create_listings(3, images_per_listing=0, location='Nazret')
+        self.create_listings(2, images_per_listing=0, location='Somewhere else')
+        Listing.objects.update(city=None)
+
+        out = io.StringIO()
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('normalize_locations', '--missing', stdout=out)
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(Listing.objects.filter(city=self.addis).count(), 6)
+        self.assertEqual(Listing.objects.filter(city__slug='adama').count(), 3)
+        self.assertIn("? 'Somewhere else': 2", out.getvalue())
+        self.assertIn('9 listings matched to 2 cities, 2 unmatched', out.getvalue())
+
+    def test_cities_within_radius(self):
+        self.assertAlmostEqual(
+            locations.distance_km(self.addis.latitude, self.addis.longitude, self.bishoftu.latitude, self.bishoftu.longitude),
+            41, delta=5,
+        )
+        nearby = locations.cities_within(self.addis.latitude, self.addis.longitude, 50)
+        slugs = set(nearby.values_list('slug', flat=True))
+        self.assertIn('bishoftu', slugs)
+        self.assertNotIn('hawassa', slugs)
+        self.assertNotIn('adama', slugs)
+        # The box's corner is further than the radius
+        min_lat, max_lat, min_lon, max_lon = locations.bounding_box(0, 0, 100)
+        self.assertGreater(locations.distance_km(0, 0, max_lat, max_lon), 100)
+
+    def test_browse_filters_by_city_and_distance(self):
+        self.create_listings(2, images_per_listing=0, location='Addis Ababa')
+        self.create_listings(1, images_per_listing=0, location='Bishoftu')
+        self.create_listings(1, images_per_listing=0, location='Hawassa')
+        headers = {'X-Requested-With': 'XMLHttpRequest'}
+        get_taxonomy()
+
+        response = self.client.get(reverse('filter_listings'), {'city': self.addis.pk}, headers=headers)
+        self.assertEqual((response.json()['total_count'], response.json()['facets']['total']), (2, 2))
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                reverse('filter_listings'), {'city': self.addis.pk, 'radius': 50}, headers=headers,
+            )
+        self.assertEqual((response.json()['total_count'], response.json()['facets']['total']), (3, 3))
+        response = self.client.get(reverse('listings'), {'city': self.hawassa.pk, 'radius': 10})
+        self.assertEqual(len(response.context['listings']), 1)
+        self.assertFalse(ListingSearchForm({'city': 0}).is_valid())
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=0)
+class CategoryStatsTests(ListingFixturesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.desktops = SubCategory.objects.create(category=self.category, name='Desktops', slug='desktops')
+
+    def rows(self):
+        return {
+            (row.category_id, row.subcategory_id): (
+                row.available_count, row.min_price, row.max_price, row.newest_listing_at,
+            )
+            for row in CategoryStats.objects.all()
+        }
+
+    def assert_matches_rebuild(self):
+        incremental = self.rows()
+        stats.rebuild()
+        rebuilt = self.rows()
+        for key, values in rebuilt.items():
+            self.assertEqual(incremental.get(key, (0, None, None, None)), values, key)
+
+    def test_signals_keep_counts_and_ranges_current(self):
+        cheap, middle, dear = self.create_listings(3, images_per_listing=0)
+        desktop, = self.create_listings(1, images_per_listing=0, subcategory=self.desktops, price=900)
+        row = CategoryStats.objects.get(subcategory=self.subcategory)
+        self.assertEqual((row.available_count, row.min_price, row.max_price), (3, 100, 102))
+        category = CategoryStats.objects.get(category=self.category, subcategory=None)
+        self.assertEqual((category.available_count, category.max_price), (4, 900))
+        self.assertEqual(category.newest_listing_at, desktop.created_at)
+        self.assert_matches_rebuild()
+
+        # One F() update when the range doesn't move, a recount when it does
+        with CaptureQueriesContext(connection) as ctx:
+            middle.status = 'sold'
+            middle.save()
+        self.assertEqual(len([q for q in ctx.captured_queries if 'categorystats' in q['sql']]), 2)
+        cheap.delete()
+        desktop.subcategory = self.subcategory
+        desktop.save()
+        dear.price = 50
+        dear.save()
+        self.assertEqual(CategoryStats.objects.get(subcategory=self.subcategory).available_count, 2)
+        self.assertEqual(CategoryStats.objects.get(subcategory=self.desktops).available_count, 0)
+        self.assert_matches_rebuild()
+
+    def test_rebuild_reads_listings_once(self):
+        self.create_listings(4, images_per_listing=0)
+        self.create_listings(1, images_per_listing=0, status='removed', price=5)
+        CategoryStats.objects.all().delete()
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('rebuild_category_stats', stdout=io.StringIO())
+        self.assertEqual(len([q for q in ctx.captured_queries if 'FROM "listings_listing"' in q['sql']]), 1)
+        row = CategoryStats.objects.get(subcategory=self.subcategory)
+        self.assertEqual(
+            (row.available_count, row.min_price, row.median_price, row.max_price),
+            (4, 100, Decimal('101.50'), 103),
+        )
+        self.assertEqual(CategoryStats.objects.get(subcategory=self.desktops).available_count, 0)
+
+    def test_pages_read_the_stats_table(self):
+        self.create_listings(2, images_per_listing=0)
+        imports_rows = [(1, {
+            'title': 'Imported desktop', 'description': 'Tower', 'price': '40', 'category': 'electronics',
+            'subcategory': 'desktops', 'condition': 'used', 'location': 'Adama', 'contact_telegram': '@seller',
+        })]
+        list(imports.ListingImporter(self.seller).run(imports_rows))
+        self.assertEqual(CategoryStats.objects.get(category=self.category, subcategory=None).min_price, 40)
+
+        get_taxonomy()
+        stats.get_category_stats()
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, '3 items · from $40')
+        with CaptureQueriesContext(connection) as ctx:
+            stats.load_category_stats()
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertNotIn('listings_listing', ctx.captured_queries[0]['sql'])
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=0)
+class SellerDashboardTests(ListingFixturesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        view_counter.buffer.drain()
+
+    def today(self):
+        return SellerDailyStats.objects.get(seller=self.seller, date=timezone.localdate())
+
+    def test_daily_rows_follow_creates_sales_and_views(self):
+        first, second, third = self.create_listings(3, images_per_listing=0)
+        self.assertEqual(self.today().listings_created, 3)
+
+        first.status = 'sold'
+        first.save(update_fields=['status', 'updated_at'])
+        second.status = 'removed'
+        second.save()
+        # Saving again without a change counts nothing
+        first.save()
+        row = self.today()
+        self.assertEqual((row.listings_sold, row.listings_removed), (1, 1))
+        self.assertGreaterEqual(row.seconds_to_sell, 0)
+
+        view_counter.buffer.add(third.pk, 2)
+        view_counter.buffer.flush()
+        self.assertEqual(self.today().views, 2)
+
+        summary = dashboard.seller_dashboard(self.seller)
+        self.assertEqual(summary['totals']['views'], 2)
+        self.assertEqual(summary['sold_last_days'], 1)
+        self.assertEqual(len(summary['series']), dashboard.DASHBOARD_DAYS)
+        self.assertEqual(summary['series'][-1]['height'], 100)
+
+    def test_days_to_sell_averages_the_sales(self):
+        when = timezone.now()
+        listings = [
+            SimpleNamespace(seller_id=self.seller.pk, created_at=when - timezone.timedelta(days=days))
+            for days in (1, 3)
+        ]
+        dashboard.increment(dashboard.status_deltas(listings, 'sold', when))
+        self.assertEqual(dashboard.seller_dashboard(self.seller)['days_to_sell'], 2.0)
+        self.assertEqual(dashboard.status_deltas(listings, 'available', when), {})
+
+    def test_page_filters_by_status_and_paginates(self):
+        self.client.force_login(self.seller)
+        listings = self.create_listings(23, images_per_listing=0)
+        Listing.objects.filter(pk=listings[0].pk).update(status='sold')
+
+        response = self.client.get(reverse('my_listings'))
+        self.assertEqual(len(response.context['listings']), 20)
+        self.assertEqual(response.context['total_count'], 23)
+        response = self.client.get(reverse('my_listings'), {'cursor': response.context['listings'].next_cursor})
+        self.assertEqual(len(response.context['listings']), 3)
+
+        response = self.client.get(reverse('my_listings'), {'status': 'sold'})
+        self.assertEqual([listing.pk for listing in response.context['listings']], [listings[0].pk])
+        response = self.client.get(reverse('my_listings'), {'status': 'bogus'})
+        self.assertEqual(response.context['status'], '')
+
+    def test_dashboard_reads_only_the_daily_rows(self):
+        self.create_listings(3, images_per_listing=0)
+        with CaptureQueriesContext(connection) as ctx:
+            dashboard.seller_dashboard(self.seller)
+        self.assertEqual(len(ctx.captured_queries), 2)
+        self.assertFalse(any('listings_listing' in q['sql'] for q in ctx.captured_queries))
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=0)
+class LifecycleTests(ListingFixturesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_bulk_transition_moves_logs_and_counts_once(self):
+        listings = self.create_listings(6, images_per_listing=0)
+        Listing.objects.filter(pk=listings[0].pk).update(status='removed')
+        ids = [listing.pk for listing in listings]
+
+        with CaptureQueriesContext(connection) as ctx:
+            moved = lifecycle.transition(ids, 'sold', actor=self.seller, seller=self.seller, batch_size=10)
+        self.assertEqual(sorted(moved), ids[1:])
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "listings_listing"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"status" IN', updates[0]['sql'])
+        self.assertEqual(Listing.objects.filter(status='sold').count(), 5)
+        # A removed listing can't be sold
+        self.assertEqual(Listing.objects.get(pk=ids[0]).status, 'removed')
+
+        events = ListingStatusEvent.objects.filter(to_status='sold')
+        self.assertEqual(events.count(), 5)
+        self.assertEqual({(e.from_status, e.actor_id) for e in events}, {('available', self.seller.pk)})
+        self.assertEqual(CategoryStats.objects.get(subcategory=self.subcategory).available_count, 0)
+        row = SellerDailyStats.objects.get(seller=self.seller, date=timezone.localdate())
+        self.assertEqual(row.listings_sold, 5)
+
+        # Relisting counts them again, across several batches
+        self.assertFalse(RelatedListing.objects.exists())
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            moved = lifecycle.transition(Listing.objects.filter(seller=self.seller), 'available', batch_size=2)
+        self.assertEqual(len(moved), 6)
+        # One recommendations refresh and one page expiry per batch
+        self.assertEqual(len(callbacks), 6)
+        self.assertEqual(RelatedListing.objects.filter(listing_id=ids[0]).count(), 5)
+        self.assertEqual(CategoryStats.objects.get(subcategory=self.subcategory).available_count, 6)
+        self.assertEqual(ListingStatusEvent.objects.filter(to_status='available').count(), 6)
+
+    def test_transitions_are_validated_and_scoped_to_the_seller(self):
+        listing = self.create_listings(1, images_per_listing=0)[0]
+        other = User.objects.create_user(username='other', email='other@example.com', password='x')
+        with self.assertRaises(lifecycle.InvalidTransition):
+            lifecycle.transition([listing.pk], 'archived')
+        self.assertEqual(lifecycle.transition([listing.pk], 'sold', seller=other), [])
+        self.assertEqual(lifecycle.transition([listing.pk], 'available'), [])
+        self.assertFalse(lifecycle.can_transition('removed', 'sold'))
+        self.assertFalse(ListingStatusEvent.objects.exists())
+
+    def test_saving_a_status_change_is_logged(self):
+        listing = self.create_listings(1, images_per_listing=0)[0]
+        listing.status = 'removed'
+        listing.save()
+        listing.save()
+        event = ListingStatusEvent.objects.get()
+        self.assertEqual((event.from_status, event.to_status, event.actor), ('available', 'removed', None))
+
+    def test_bulk_endpoint(self):
+        self.client.force_login(self.seller)
+        listings = self.create_listings(3, images_per_listing=0)
+        url = reverse('bulk_listing_status')
+        response = self.client.post(url, {'status': 'removed', 'ids': f'{listings[0].pk},{listings[1].pk},999999'})
+        self.assertEqual(response.json()['updated'], 2)
+        self.assertEqual(response.json()['skipped'], [999999])
+        self.assertEqual(self.client.post(url, {'status': 'gone', 'ids': listings[2].pk}).status_code, 400)
+        self.assertEqual(self.client.post(url, {'status': 'sold'}).status_code, 400)
+
+        Listing.objects.filter(pk=listings[2].pk).update(created_at=timezone.now() - timezone.timedelta(days=90))
+        for older_than in (-1, 10 ** 9, 'soon'):
+            response = self.client.post(url, {'status': 'removed', 'older_than': older_than})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Listing.objects.filter(status='removed').count(), 2)
+        with mock.patch('listings.views.BULK_STATUS_MAX_IDS', 0):
+            response = self.client.post(url, {'status': 'removed', 'older_than': 60})
+        self.assertEqual((response.json()['updated'], response.json()['more']), (0, True))
+        response = self.client.post(url, {'status': 'removed', 'older_than': 60})
+        self.assertEqual(response.json()['ids'], [listings[2].pk])
+        self.assertFalse(response.json()['more'])
+        self.assertEqual(Listing.objects.filter(status='removed').count(), 3)
+
+        response = self.client.get(reverse('listing_set_status', args=[listings[0].pk, 'available']))
+        self.assertRedirects(response, reverse('my_listings'), fetch_redirect_response=False)
+        self.assertEqual(Listing.objects.get(pk=listings[0].pk).status, 'available')
+
+    def test_admin_action(self):
+        admin_user = User.objects.create_superuser(username='admin', email='admin@example.com', password='x')
+        self.client.force_login(admin_user)
+        listings = self.create_listings(2, images_per_listing=0)
+        self.client.post(reverse('admin:listings_listing_changelist'), {
+            'action': 'mark_sold', '_selected_action': [listing.pk for listing in listings],
+        })
+        self.assertEqual(Listing.objects.filter(status='sold').count(), 2)
+        self.assertEqual(ListingStatusEvent.objects.filter(actor=admin_user, source='admin').count(), 2)
+
+
+@override_settings(
+    VIEW_COUNT_FLUSH_INTERVAL=0,
+    LISTING_RETENTION_DAYS={'available': None, 'sold': 90, 'removed': 30},
+    LISTING_RETENTION_CATEGORY_DAYS={},
+)
+class RetentionTests(ListingFixturesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def age(self, listings, days, status=None):
+        values = {'updated_at': timezone.now() - timezone.timedelta(days=days)}
+        if status:
+            values['status'] = status
+        Listing.objects.filter(pk__in=[listing.pk for listing in listings]).update(**values)
+
+    def test_expired_follows_status_and_category_ttls(self):
+        old_sold, recent_sold, old_removed, old_available = self.create_listings(4, images_per_listing=0)
+        self.age([old_sold], 100, 'sold')
+        self.age([recent_sold], 10, 'sold')
+        self.age([old_removed], 40, 'removed')
+        self.age([old_available], 400)
+        self.assertEqual(list(retention.expired('sold')), [old_sold])
+        self.assertEqual(list(retention.expired('removed')), [old_removed])
+        self.assertFalse(retention.expired('available').exists())
+
+        with self.settings(LISTING_RETENTION_CATEGORY_DAYS={self.category.slug: {'sold': 5, 'removed': None}}):
+            self.assertEqual(set(retention.expired('sold')), {old_sold, recent_sold})
+            self.assertFalse(retention.expired('removed').exists())
+            self.assertEqual(retention.retention_days('removed', self.category.slug), None)
+
+    def test_archive_moves_listings_and_photos(self):
+        sold, removed, kept = self.create_listings(3, images_per_listing=2)
+        self.age([sold], 100, 'sold')
+        self.age([removed], 40, 'removed')
+        lifecycle.log_saved_change(kept, 'available')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            report = list(retention.ListingExpirer(batch_size=10).run())[-1]
+        self.assertEqual((report.archived, report.images), (2, 4))
+        self.assertEqual(list(Listing.objects.all()), [kept])
+        self.assertEqual(ListingImage.objects.count(), 2)
+        archived = ArchivedListing.objects.get(pk=sold.pk)
+        self.assertEqual((archived.title, archived.status, archived.seller), (sold.title, 'sold', self.seller))
+        self.assertEqual(archived.images.count(), 2)
+        self.assertEqual(archived.images.get(is_primary=True).public_id, 'listings/laptop-0-1')
+        self.assertNotIn(sold, get_search_backend().search(Listing.objects.all(), 'laptop'))
+        # The status log outlives the listing
+        self.assertTrue(ListingStatusEvent.objects.filter(listing_id=kept.pk).exists())
+
+    def test_available_listings_expire_to_removed(self):
+        stale, fresh = self.create_listings(2, images_per_listing=0)
+        self.age([stale], 200)
+        with self.settings(LISTING_RETENTION_DAYS={'available': 180, 'sold': 90, 'removed': 30}):
+            report = list(retention.ListingExpirer().run())[-1]
+        self.assertEqual((report.expired, report.archived), (1, 0))
+        self.assertEqual(Listing.objects.get(pk=stale.pk).status, 'removed')
+        self.assertEqual(ListingStatusEvent.objects.get(listing_id=stale.pk).source, 'expiry')
+        self.assertEqual(Listing.objects.get(pk=fresh.pk).status, 'available')
+
+    def test_command_resumes_in_bounded_batches_and_purges(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        listings = self.create_listings(5, images_per_listing=1)
+        self.age(listings, 100, 'sold')
+        for listing in listings:
+            image = listing.images.get()
+            os.makedirs(os.path.join(root.name, 'listings'), exist_ok=True)
+            open(os.path.join(root.name, f'{image.image}.png'), 'w').close()
+
+        out = io.StringIO()
+        call_command('expire_listings', batch_size=2, max_batches=2, stdout=out)
+        self.assertEqual(ArchivedListing.objects.count(), 4)
+        self.assertIn('listings/s', out.getvalue())
+
+        backend = uploads.FileSystemDeleteBackend(root.name)
+        with mock.patch.object(retention, 'get_delete_backend', return_value=backend):
+            call_command('expire_listings', batch_size=2, purge_images=True, stdout=io.StringIO())
+        self.assertFalse(Listing.objects.exists())
+        self.assertFalse(ArchivedListingImage.objects.filter(purged_at=None).exists())
+        self.assertEqual(os.listdir(os.path.join(root.name, 'listings')), [])
+
+    def test_admin_lists_events_of_archived_listings(self):
+        admin_user = User.objects.create_superuser(username='admin', email='admin@example.com', password='x')
+        self.client.force_login(admin_user)
+        listing = self.create_listings(1, images_per_listing=0)[0]
+        lifecycle.transition([listing.pk], 'sold')
+        Listing.objects.filter(pk=listing.pk).update(updated_at=timezone.now() - timezone.timedelta(days=400))
+        list(retention.ListingExpirer().run())
+        self.assertFalse(Listing.objects.filter(pk=listing.pk).exists())
+        response = self.client.get(reverse('admin:listings_listingstatusevent_changelist'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 1)
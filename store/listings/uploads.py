@@ -0,0 +1,216 @@
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlsplit
+from urllib.request import urlopen
+
+import cloudinary.api
+import cloudinary.uploader
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import ListingImage
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_OPTIONS = {
+    'folder': 'listings',
+    'transformation': {
+        'quality': 'auto:good',
+        'fetch_format': 'auto',
+        'width': 800,
+        'height': 600,
+        'crop': 'limit',
+    },
+}
+
+
+class CloudinaryUploadBackend:
+    def upload(self, path):
+        """Upload a staged file or a URL, returning the value to store in ListingImage.image"""
+        return cloudinary.uploader.upload_resource(path, **UPLOAD_OPTIONS)
+
+
+class FileSystemUploadBackend:
+    """Copies uploads into a local directory, for tests and offline development"""
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(settings.IMAGE_STAGING_ROOT, 'uploaded')
+
+    def upload(self, path):
+        public_id = f"{UPLOAD_OPTIONS['folder']}/{uuid.uuid4().hex}"
+        destination = os.path.join(self.root, public_id + os.path.splitext(urlsplit(path).path)[1])
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        if is_url(path):
+            with urlopen(path, timeout=30) as response, open(destination, 'wb') as f:
+                shutil.copyfileobj(response, f)
+        else:
+            shutil.copyfile(path, destination)
+        return public_id
+
+
+class CloudinaryDeleteBackend:
+    # Public ids the Admin API deletes per call
+    batch_size = 100
+
+    def delete(self, public_ids):
+        """Delete hosted images, ids that are already gone included"""
+        public_ids = list(public_ids)
+        for start in range(0, len(public_ids), self.batch_size):
+            cloudinary.api.delete_resources(public_ids[start:start + self.batch_size])
+
+
+class FileSystemDeleteBackend:
+    """Deletes what FileSystemUploadBackend uploaded"""
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(settings.IMAGE_STAGING_ROOT, 'uploaded')
+
+    def delete(self, public_ids):
+        for public_id in public_ids:
+            directory, name = os.path.split(os.path.join(self.root, public_id))
+            if not os.path.isdir(directory):
+                continue
+            for filename in os.listdir(directory):
+                if os.path.splitext(filename)[0] == name:
+                    os.remove(os.path.join(directory, filename))
+
+
+def is_url(value):
+    return urlsplit(value).scheme in ('http', 'https')
+
+
+def get_upload_backend():
+    return import_string(settings.IMAGE_UPLOAD_BACKEND)()
+
+
+def get_delete_backend():
+    return import_string(settings.IMAGE_DELETE_BACKEND)()
+
+
+def staging_storage():
+    return FileSystemStorage(location=settings.IMAGE_STAGING_ROOT)
+
+
+def stage(uploaded_file):
+    """Write an uploaded file to the staging area and return its name there"""
+    extension = os.path.splitext(uploaded_file.name)[1].lower()
+    return staging_storage().save(f'{uuid.uuid4().hex}{extension}', uploaded_file)
+
+
+class UploadQueue:
+    """
+    Sends staged listing photos to the upload backend from a thread pool, so
+    requests only pay for writing the files locally. Each image is claimed
+    before it's uploaded, so the pool and process_image_uploads never send
+    the same one twice, and failures are retried with exponential backoff
+    until it ends up 'ready' or 'failed'.
+    """
+
+    def __init__(self):
+        self._executor = None
+
+    @property
+    def backend(self):
+        return get_upload_backend()
+
+    def enqueue(self, image_ids):
+        """Upload these images once the current transaction commits"""
+        image_ids = list(image_ids)
+        if image_ids:
+            transaction.on_commit(lambda: self.submit(image_ids))
+
+    def submit(self, image_ids):
+        workers = getattr(settings, 'IMAGE_UPLOAD_WORKERS', 4)
+        if not workers:
+            for image_id in image_ids:
+                self.process(image_id)
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-upload')
+        for image_id in image_ids:
+            self._executor.submit(self._run, image_id)
+
+    def _run(self, image_id):
+        close_old_connections()
+        try:
+            image = self.attempt(image_id)
+            if image is not None and image.status == 'pending':
+                # Resubmitted after the backoff rather than sleeping in one of the workers
+                timer = threading.Timer(retry_delay(image), self.submit, [[image_id]])
+                timer.daemon = True
+                timer.start()
+        except Exception:
+            logger.exception('Failed to process listing image %s', image_id)
+        finally:
+            connections.close_all()
+
+    def claim(self, image_id):
+        """Take a pending image with one conditional UPDATE, None when it isn't pending or another worker has it"""
+        claimed = ListingImage.objects.filter(pk=image_id, status='pending').update(
+            status='uploading', claimed_at=timezone.now(),
+        )
+        return ListingImage.objects.filter(pk=image_id).first() if claimed else None
+
+    def attempt(self, image_id):
+        """
+        Claim and upload one image once. Returns it 'ready', 'failed' after
+        IMAGE_UPLOAD_MAX_ATTEMPTS, or 'pending' again to be retried, or None
+        when it wasn't claimed.
+        """
+        image = self.claim(image_id)
+        if image is None:
+            return None
+        storage = staging_storage()
+        image.attempts += 1
+        image.claimed_at = None
+        try:
+            source = image.source_url or storage.path(image.staged_file)
+            image.image = self.backend.upload(source)
+        except Exception as exc:
+            logger.warning('Upload of listing image %s failed (attempt %s): %s', image.pk, image.attempts, exc)
+            image.error = str(exc)
+            image.status = 'failed' if image.attempts >= getattr(settings, 'IMAGE_UPLOAD_MAX_ATTEMPTS', 3) else 'pending'
+            image.save(update_fields=['status', 'attempts', 'error', 'claimed_at'])
+            return image
+        if image.staged_file:
+            storage.delete(image.staged_file)
+        image.status, image.staged_file, image.source_url, image.error = 'ready', '', '', ''
+        image.save(update_fields=['image', 'status', 'staged_file', 'source_url', 'attempts', 'error', 'claimed_at'])
+        return image
+
+    def process(self, image_id):
+        """Upload one image, waiting out the retries in this thread, for commands and IMAGE_UPLOAD_WORKERS = 0"""
+        while True:
+            image = self.attempt(image_id)
+            if image is None or image.status != 'pending':
+                return image
+            time.sleep(retry_delay(image))
+
+
+def retry_delay(image):
+    return getattr(settings, 'IMAGE_UPLOAD_RETRY_DELAY', 2) * 2 ** (image.attempts - 1)
+
+
+def release_stale_claims(timeout=None):
+    """Put back images claimed by workers that died mid-upload. Returns how many."""
+    if timeout is None:
+        timeout = getattr(settings, 'IMAGE_UPLOAD_CLAIM_TIMEOUT', 600)
+    return ListingImage.objects.filter(
+        status='uploading', claimed_at__lt=timezone.now() - timedelta(seconds=timeout),
+    ).update(status='pending', claimed_at=None)
+
+
+queue = UploadQueue()
+
+
+def enqueue_pending(listing):
+    queue.enqueue(listing.images.filter(status='pending').values_list('pk', flat=True))
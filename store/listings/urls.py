@@ -20,6 +20,8 @@ urlpatterns = [
     path('listing/<int:pk>/edit', views.edit_listing, name='listing_edit'),
     path('my-listings/', views.my_listings, name='my_listings'),
     path("listing/<int:pk>/status/<str:new_status>/", views.set_listing_status, name="listing_set_status"),
+    path('api/listings/status/', views.bulk_listing_status, name='bulk_listing_status'),
+    path('api/listings/import/', views.import_listings_upload, name='import_listings_upload'),
 
     
     # AJAX endpoints
@@ -27,6 +29,9 @@ urlpatterns = [
     path('api/filter-listings/', views.filter_listings, name='filter_listings'),
     path('search-suggestions/', views.search_suggestions, name='search_suggestions'),
 
+    # Versioned JSON API
+    path('api/v1/listings/', views.api_listings, name='api_listings'),
+
     path("privacy-policy/", views.privacy_policy, name="privacy_policy"),
     path("terms-of-service/", views.terms_of_service, name="terms_of_service"),
 
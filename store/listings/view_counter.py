@@ -0,0 +1,116 @@
+import atexit
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import F
+
+from . import dashboard
+from .models import Listing
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCountBuffer:
+    """
+    Collects listing view increments in memory and writes them in batches of
+    `UPDATE ... SET view_count = view_count + n`, one statement per distinct n.
+    """
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def add(self, listing_id, count=1):
+        with self._lock:
+            self._counts[listing_id] += count
+        self._ensure_flusher()
+
+    def pending(self, listing_id):
+        with self._lock:
+            return self._counts.get(listing_id, 0)
+
+    def drain(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        return counts
+
+    def flush(self):
+        counts = self.drain()
+        if not counts:
+            return 0
+        by_increment = defaultdict(list)
+        for listing_id, count in counts.items():
+            by_increment[count].append(listing_id)
+        try:
+            for count, listing_ids in by_increment.items():
+                Listing.objects.filter(pk__in=listing_ids).update(view_count=F('view_count') + count)
+        except Exception:
+            # Put the increments back so the next flush retries them
+            with self._lock:
+                self._counts.update(counts)
+            raise
+        try:
+            dashboard.record_views(counts)
+        except Exception:
+            # The listings' own counts are written, only the sellers' day is short
+            logger.exception('Failed to add listing views to the seller stats')
+        return sum(counts.values())
+
+    def _ensure_flusher(self):
+        interval = getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL', 30)
+        if not interval or self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._run, args=(interval,), name='view-count-flusher', daemon=True
+                )
+                self._flusher.start()
+                atexit.register(self._flush_on_exit)
+
+    def _run(self, interval):
+        while True:
+            time.sleep(interval)
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush listing view counts')
+
+    def _flush_on_exit(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Failed to flush listing view counts on exit')
+
+
+buffer = ViewCountBuffer()
+
+
+def viewer_key(request):
+    if request.session.session_key:
+        return f'session:{request.session.session_key}'
+    # Not X-Forwarded-For, which any client can set. Behind a proxy the
+    # server (uvicorn's --forwarded-allow-ips) puts the address it appended here.
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def record_view(request, listing_id):
+    """
+    Buffer a view of a listing. Repeat views by the same session or IP within
+    VIEW_COUNT_DEDUP_WINDOW seconds are ignored. Returns whether it counted.
+    """
+    window = getattr(settings, 'VIEW_COUNT_DEDUP_WINDOW', 30 * 60)
+    if window:
+        digest = hashlib.md5(viewer_key(request).encode('utf-8')).hexdigest()
+        if not cache.add(f'listing-viewed:{listing_id}:{digest}', 1, window):
+            return False
+    buffer.add(listing_id)
+    return True
@@ -1,27 +1,47 @@
+import asyncio
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
-from django.db.models import Q
-from django.core.paginator import Paginator
+from django.http import JsonResponse, StreamingHttpResponse
+from django.db.models import Prefetch, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
 from django.views.decorators.http import require_http_methods
-from .models import Listing, Category, SubCategory, ListingImage
+from .models import Listing, ListingImage
 from .forms import SellerSignUpForm, ListingForm, ListingSearchForm
 from .forms import ListingImageFormSet
+from .pagination import KeysetPaginator
+from .search import get_search_backend
+from .facets import afacet_counts, facet_counts
+from .locations import location_condition
+from .suggestions import aget_suggestions
+from .taxonomy import TAXONOMY_VERSION_KEY, aget_taxonomy
+from . import api, dashboard, imports, lifecycle, stats, uploads, view_counter
+from .caching import (
+    LISTINGS_VERSION_KEY, aget_versions, cache_anonymous_page, conditional_page, listing_version_key,
+)
 
 
+@conditional_page()
+@cache_anonymous_page()
 def home(request):
     # Get recent listings
-    recent_listings = Listing.objects.filter(status='available')[:8]
-    featured=Listing.objects.filter(status='available')[:3]
-    categories = Category.objects.all()
+    cards = Listing.objects.available().with_card_data()
+    recent_listings = cards[:8]
+    featured = cards[:3]
     
     context = {
         'recent_listings': recent_listings,
         'featured':featured,
-        'categories': categories,
+        'category_stats': stats.get_category_stats(),
     }
     return render(request, 'listings/home.html', context)
 
@@ -41,76 +61,110 @@ def signup(request):
     return render(request, 'registration/signup.html', {'form': form})
 
 
+# Every ordering ends in the primary key so keyset cursors are stable
+SORT_ORDERINGS = {
+    'newest': ('-created_at', '-id'),
+    'oldest': ('created_at', 'id'),
+    'price_low': ('price', 'id'),
+    'price_high': ('-price', '-id'),
+}
+
+
+def apply_listing_filters(listings, cleaned_data):
+    """Apply the ListingSearchForm filters and ordering shared by the browse views"""
+    search = cleaned_data.get('search')
+    category = cleaned_data.get('category')
+    subcategory = cleaned_data.get('subcategory')
+    condition = cleaned_data.get('condition')
+    min_price = cleaned_data.get('min_price')
+    max_price = cleaned_data.get('max_price')
+    city = cleaned_data.get('city')
+    sort_by = cleaned_data.get('sort_by') or ('relevance' if search else 'newest')
+
+    if search:
+        listings = get_search_backend().search(listings, search)
+    if category:
+        listings = listings.filter(category=category)
+    if subcategory:
+        listings = listings.filter(subcategory=subcategory)
+    if condition:
+        listings = listings.filter(condition=condition)
+    if min_price:
+        listings = listings.filter(price__gte=min_price)
+    if max_price:
+        listings = listings.filter(price__lte=max_price)
+    if city:
+        listings = listings.filter(location_condition(city, cleaned_data.get('radius')))
+
+    # Sorting
+    if sort_by == 'relevance' and search:
+        return listings.order_by('-search_rank', '-id')
+    return listings.order_by(*SORT_ORDERINGS.get(sort_by, SORT_ORDERINGS['newest']))
+
+
+@conditional_page()
+@cache_anonymous_page()
 def listings_view(request):
     form = ListingSearchForm(request.GET)
-    listings = Listing.objects.filter(status='available')
+    listings = Listing.objects.available().with_card_data()
     
     # Apply filters
     if form.is_valid():
-        search = form.cleaned_data.get('search')
-        category = form.cleaned_data.get('category')
-        subcategory = form.cleaned_data.get('subcategory')
-        condition = form.cleaned_data.get('condition')
-        min_price = form.cleaned_data.get('min_price')
-        max_price = form.cleaned_data.get('max_price')
-        sort_by = form.cleaned_data.get('sort_by')
-        
-        if search:
-            listings = listings.filter(
-                Q(title__icontains=search) | Q(description__icontains=search)
-            )
-        if category:
-            listings = listings.filter(category=category)
-        if subcategory:
-            listings = listings.filter(subcategory=subcategory)
-        if condition:
-            listings = listings.filter(condition=condition)
-        if min_price:
-            listings = listings.filter(price__gte=min_price)
-        if max_price:
-            listings = listings.filter(price__lte=max_price)
-            
-        # Sorting
-        if sort_by == 'oldest':
-            listings = listings.order_by('created_at')
-        elif sort_by == 'price_low':
-            listings = listings.order_by('price')
-        elif sort_by == 'price_high':
-            listings = listings.order_by('-price')
-        else:  # newest (default)
-            listings = listings.order_by('-created_at')
+        listings = apply_listing_filters(listings, form.cleaned_data)
+        facets = facet_counts(form.cleaned_data)
+    else:
+        listings = listings.order_by(*SORT_ORDERINGS['newest'])
+        facets = facet_counts({})
     
     # Pagination
-    paginator = Paginator(listings, 12)
-    page_number = request.GET.get('page')
-    listings = paginator.get_page(page_number)
+    paginator = KeysetPaginator(listings, 12)
+    listings = paginator.get_page(request.GET.get('cursor'))
+    total_count, count_is_estimate = paginator.count()
     
     context = {
         'listings': listings,
+        'total_count': total_count,
+        'count_is_estimate': count_is_estimate,
+        'facets': facets,
+        'category_stats': stats.get_category_stats(),
         'form': form,
-        'categories': Category.objects.all(),
     }
     return render(request, 'listings/listings.html', context)
 
 
+@conditional_page(
+    version_keys=lambda request, pk: [listing_version_key(pk)],
+    on_not_modified=lambda request, pk: view_counter.record_view(request, pk),
+)
+@cache_anonymous_page(
+    version_keys=lambda request, pk: [listing_version_key(pk)],
+    on_hit=lambda request, pk: view_counter.record_view(request, pk),
+)
 def listing_detail(request, pk):
-    listing = get_object_or_404(Listing, pk=pk)
+    listing = get_object_or_404(
+        Listing.objects.select_related('category', 'subcategory', 'seller').prefetch_related(
+            Prefetch('images', queryset=ListingImage.objects.filter(status='ready'))
+        ),
+        pk=pk,
+    )
     
-    # Increment view count
-    listing.view_count += 1
-    listing.save(update_fields=['view_count'])
+    # Views are buffered and written in batches, show the unflushed ones too
+    view_counter.record_view(request, listing.pk)
+    listing.view_count += view_counter.buffer.pending(listing.pk)
     
-    # Get related listings
-    related_listings = Listing.objects.filter(
-        category=listing.category, 
-        status='available'
-    ).exclude(pk=pk)[:4]
+    # Precomputed by listings.recommendations, read in rank order off the
+    # (listing, rank) index. Spare entries cover listings sold since.
+    related_listings = Listing.objects.available().with_card_data().filter(
+        recommended_with__listing=pk,
+    ).order_by('recommended_with__rank')[:4]
     
     context = {
         'listing': listing,
         'related_listings': related_listings,
     }
-    return render(request, 'listings/listing_detail.html', context)
+    response = render(request, 'listings/listing_detail.html', context)
+    response['Last-Modified'] = http_date(listing.updated_at.timestamp())
+    return response
 
 
 from django.forms import modelformset_factory
@@ -130,12 +184,7 @@ def create_listing(request):
             for instance in instances:
                 instance.listing = listing
                 instance.save()
-            
-            # Ensure only one primary image exists
-            primary_images = listing.images.filter(is_primary=True)
-            if primary_images.count() > 1:
-                first = primary_images.first()
-                listing.images.exclude(pk=first.pk).update(is_primary=False)
+            uploads.enqueue_pending(listing)
             
             messages.success(request, 'Listing created successfully!')
             return redirect('listing_detail', pk=listing.pk)
@@ -161,12 +210,7 @@ def edit_listing(request, pk):
         if form.is_valid() and formset.is_valid():
             form.save()
             formset.save()
-            
-            # Ensure only one primary image exists
-            primary_images = listing.images.filter(is_primary=True)
-            if primary_images.count() > 1:
-                first = primary_images.first()
-                listing.images.exclude(pk=first.pk).update(is_primary=False)
+            uploads.enqueue_pending(listing)
             
             messages.success(request, 'Listing updated successfully!')
             return redirect('listing_detail', pk=listing.pk)
@@ -185,99 +229,238 @@ def edit_listing(request, pk):
 
 @login_required
 def my_listings(request):
-    listings = request.user.listings.all()
-    return render(request, 'listings/my_listings.html', {'listings': listings})
+    status = request.GET.get('status', '')
+    listings = Listing.objects.filter(seller=request.user).with_card_data()
+    if status in dict(Listing.STATUS_CHOICES):
+        listings = listings.filter(status=status)
+    else:
+        status = ''
+
+    paginator = KeysetPaginator(listings.order_by(*SORT_ORDERINGS['newest']), 20)
+    listings = paginator.get_page(request.GET.get('cursor'))
+    total_count, count_is_estimate = paginator.count()
+    return render(request, 'listings/my_listings.html', {
+        'listings': listings,
+        'total_count': total_count,
+        'count_is_estimate': count_is_estimate,
+        'status': status,
+        'status_choices': Listing.STATUS_CHOICES,
+        'dashboard': dashboard.seller_dashboard(request.user),
+    })
     
+@login_required
 def set_listing_status(request, pk, new_status):
-    listing = get_object_or_404(Listing, pk=pk, seller=request.user)
-    valid_statuses = ["available", "sold", "removed"]
+    new_status = new_status.lower()
+    try:
+        moved = lifecycle.transition([pk], new_status, actor=request.user, seller=request.user, source='seller')
+    except lifecycle.InvalidTransition:
+        messages.error(request, "Invalid status selected.")
+        return redirect("my_listings")
 
-    if new_status.lower() in valid_statuses:
-        listing.status = new_status.lower()
-        listing.save(update_fields=["status"])
+    if moved:
         messages.success(request, f"Listing status updated to '{new_status}'.")
     else:
-        messages.error(request, "Invalid status selected.")
-
+        listing = get_object_or_404(Listing, pk=pk, seller=request.user)
+        if listing.status != new_status:
+            messages.error(request, f"A {listing.status} listing can't be marked {new_status}.")
     return redirect("my_listings")
 
-# AJAX Views
-def get_subcategories(request):
+
+# Listings one bulk status request may move, by ids or by age
+BULK_STATUS_MAX_IDS = 1000
+BULK_STATUS_MAX_DAYS = 3650
+
+
+@login_required
+@require_http_methods(['POST'])
+def bulk_listing_status(request):
+    """
+    Move several of the seller's listings to `status`: those in `ids`, or
+    with `older_than` a number of days, the oldest BULK_STATUS_MAX_IDS
+    listed before then (`more` says whether to repeat the request).
+    Listings that can't move there are skipped.
+    """
+    status = request.POST.get('status', '')
+    try:
+        sources = lifecycle.sources_of(status)
+    except lifecycle.InvalidTransition as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    requested, more = None, None
+    if request.POST.get('older_than'):
+        try:
+            days = int(request.POST['older_than'])
+        except ValueError:
+            days = -1
+        if not 0 <= days <= BULK_STATUS_MAX_DAYS:
+            return JsonResponse(
+                {'error': f'older_than must be a number of days from 0 to {BULK_STATUS_MAX_DAYS}.'}, status=400,
+            )
+        ids = list(
+            Listing.objects.filter(
+                seller=request.user, status__in=sources, created_at__lt=timezone.now() - timedelta(days=days),
+            ).order_by('created_at', 'id').values_list('pk', flat=True)[:BULK_STATUS_MAX_IDS + 1]
+        )
+        more = len(ids) > BULK_STATUS_MAX_IDS
+        listings = Listing.objects.filter(pk__in=ids[:BULK_STATUS_MAX_IDS])
+    else:
+        try:
+            requested = {int(pk) for value in request.POST.getlist('ids') for pk in value.split(',') if pk.strip()}
+        except ValueError:
+            return JsonResponse({'error': 'ids must be listing ids.'}, status=400)
+        if not requested:
+            return JsonResponse({'error': 'Give the listings as "ids", or "older_than" days.'}, status=400)
+        if len(requested) > BULK_STATUS_MAX_IDS:
+            return JsonResponse({'error': f'At most {BULK_STATUS_MAX_IDS} ids at a time.'}, status=400)
+        listings = Listing.objects.filter(pk__in=requested)
+
+    moved = lifecycle.transition(listings, status, actor=request.user, seller=request.user, source='seller')
+    response = {'status': status, 'updated': len(moved), 'ids': moved}
+    if requested is not None:
+        response['skipped'] = sorted(requested.difference(moved))
+    else:
+        response['more'] = more
+    return JsonResponse(response)
+
+
+@login_required
+@require_http_methods(['POST'])
+def import_listings_upload(request):
+    """
+    Bulk create the seller's listings from an uploaded CSV or JSON Lines
+    `file`. Streams one NDJSON progress line per chunk, then a summary.
+    """
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'error': 'Upload a CSV or JSON Lines file as "file".'}, status=400)
+    try:
+        format = request.POST.get('format') or imports.detect_format(upload.name)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    if format not in imports.FORMATS.values():
+        return JsonResponse({'error': f'Unknown format {format}.'}, status=400)
+
+    # Only image URLs here, local paths are for the import_listings command
+    importer = imports.ListingImporter(request.user)
+
+    def progress():
+        report = imports.ImportReport()
+        reported = 0
+        try:
+            for report in importer.run(imports.read_rows(imports.text_stream(upload.file), format), report):
+                line = {'progress': report.as_dict(), 'errors': report.errors[reported:]}
+                reported = len(report.errors)
+                yield json.dumps(line, separators=(',', ':')) + '\n'
+        except (UnicodeDecodeError, ValueError) as exc:
+            yield json.dumps({'error': str(exc)}) + '\n'
+        yield json.dumps({'done': report.as_dict()}, separators=(',', ':')) + '\n'
+
+    return StreamingHttpResponse(progress(), content_type='application/x-ndjson')
+
+
+# AJAX Views, async so that their database waits don't hold a worker thread
+async def get_subcategories(request):
     category_id = request.GET.get('category_id')
-    subcategories = SubCategory.objects.filter(category_id=category_id).values('id', 'name','icon')
-    return JsonResponse(list(subcategories), safe=False)
+    subcategories = (await aget_taxonomy()).subcategories_for(category_id)
+    return JsonResponse([
+        {'id': subcategory.id, 'name': subcategory.display_name, 'icon': subcategory.icon}
+        for subcategory in subcategories
+    ], safe=False)
 
 
-def filter_listings(request):
-    """AJAX endpoint for dynamic filtering"""
-    form = ListingSearchForm(request.GET)
-    listings = Listing.objects.filter(status='available')
+def filtered_listings(params):
+    """The filtered listings, and the cleaned filters they were built from"""
+    form = ListingSearchForm(params)
+    listings = Listing.objects.available().with_card_data()
     
     if form.is_valid():
-        search = form.cleaned_data.get('search')
-        category = form.cleaned_data.get('category')
-        subcategory = form.cleaned_data.get('subcategory')
-        condition = form.cleaned_data.get('condition')
-        location = form.cleaned_data.get('city')
-        min_price = form.cleaned_data.get('min_price')
-        max_price = form.cleaned_data.get('max_price')
-        sort_by = form.cleaned_data.get('sort_by')
-        
-        if search:
-            listings = listings.filter(
-                Q(title__icontains=search) | Q(description__icontains=search)
-            )
-        if category:
-            listings = listings.filter(category=category)
-        if subcategory:
-            listings = listings.filter(subcategory=subcategory)
-        if condition:
-            listings = listings.filter(condition=condition)
-        if location:
-            listing = listing.filter(location=location)
-        if min_price:
-            listings = listings.filter(price__gte=min_price)
-        if max_price:
-            listings = listings.filter(price__lte=max_price)
-        
-            
-        # Sorting
-        if sort_by == 'oldest':
-            listings = listings.order_by('created_at')
-        elif sort_by == 'price_low':
-            listings = listings.order_by('price')
-        elif sort_by == 'price_high':
-            listings = listings.order_by('-price')
-        else:
-            listings = listings.order_by('-created_at')
+        listings = apply_listing_filters(listings, form.cleaned_data)
+        return listings, form.cleaned_data
+    return listings.order_by(*SORT_ORDERINGS['newest']), {}
+
+
+async def filter_listings(request):
+    """AJAX endpoint for dynamic filtering"""
+    # Validation may reload the taxonomy, which is sync-only
+    listings, filters = await sync_to_async(filtered_listings)(request.GET)
     
-    # Pagination
-    page = request.GET.get('page', 1)
-    paginator = Paginator(listings, 12)
-    listings_page = paginator.get_page(page)
+    # Pagination, the page, the count and the facet counts are independent queries
+    paginator = KeysetPaginator(listings, 12)
+    listings_page, (total_count, count_is_estimate), facets = await asyncio.gather(
+        paginator.aget_page(request.GET.get('cursor')),
+        paginator.acount(),
+        afacet_counts(filters),
+    )
     
-    listings_html = render(request, 'listings/partials/listing_cards.html', {
-        'listings': listings_page
-    }).content.decode('utf-8')
+    # Context processors read the session and the user, render in a thread
+    listings_html = await sync_to_async(render_to_string)('listings/partials/listing_cards.html', {
+        'listings': listings_page,
+        'total_count': total_count,
+        'count_is_estimate': count_is_estimate,
+    }, request)
     
     return JsonResponse({
         'listings_html': listings_html,
         'has_next': listings_page.has_next(),
         'has_previous': listings_page.has_previous(),
-        'total_count': paginator.count,
+        'next_cursor': listings_page.next_cursor,
+        'previous_cursor': listings_page.previous_cursor,
+        'total_count': total_count,
+        'count_is_estimate': count_is_estimate,
+        'facets': facets,
     })
-from django.views.decorators.cache import cache_page
+
+
+def api_filtered_listings(form, fields):
+    """The API's listings matching a search form, or None when it's invalid"""
+    if not form.is_valid():
+        return None
+    return apply_listing_filters(api.listing_queryset(fields), form.cleaned_data)
+
+
+@gzip_page
+@require_http_methods(["GET", "HEAD"])
+async def api_listings(request):
+    """
+    Versioned read API returning compact listing records. Takes the browse
+    filters plus `fields`, `limit` and `cursor`, and answers a matching
+    If-None-Match with 304 before running any query.
+    """
+    try:
+        fields = api.parse_fields(request.GET.get('fields'))
+        limit = api.parse_limit(request.GET.get('limit'))
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    etag = api.result_etag(request, await aget_versions(LISTINGS_VERSION_KEY, TAXONOMY_VERSION_KEY))
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        # Validation and the filters may reload the taxonomy, which is sync-only
+        form = ListingSearchForm(request.GET)
+        listings = await sync_to_async(api_filtered_listings)(form, fields)
+        if listings is None:
+            return JsonResponse({'errors': form.errors}, status=400)
+        page = await KeysetPaginator(listings, limit).aget_page(request.GET.get('cursor'))
+        response = JsonResponse({
+            'version': api.API_VERSION,
+            'results': api.records(page, fields),
+            'next_cursor': page.next_cursor,
+            'previous_cursor': page.previous_cursor,
+        }, json_dumps_params={'separators': (',', ':')})
+    response['ETag'] = etag
+    # Clients may keep the result but must revalidate it
+    patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+    return response
 
 import json
 from django.http import JsonResponse
 from django.db.models import Q
 from django.urls import reverse
 from django.views.decorators.http import require_http_methods
-from django.views.decorators.cache import cache_page
 
 
 @require_http_methods(["GET"])
-def search_suggestions(request):
+async def search_suggestions(request):
     """
     AJAX view to provide search suggestions based on categories, subcategories, and products
     """
@@ -289,112 +472,12 @@ def search_suggestions(request):
     if len(query) < 2:
         return JsonResponse({'suggestions': []})
     
-    suggestions = []
-    
-    try:
-        # Search categories - Remove is_active filter if it doesn't exist
-        try:
-            categories = Category.objects.filter(
-                name__icontains=query
-            ).distinct()[:4]
-        except:
-            # Fallback if is_active field doesn't exist
-            categories = Category.objects.filter(
-                name__icontains=query
-            ).distinct()[:4]
-        
-        for category in categories:
-            suggestions.append({
-                'name': category.name,
-                'type': 'category',
-                'type_display': 'Category',
-                'url': f"{reverse('listings')}?category={category.id}",
-                'category_id': category.id,
-                'subcategory_id': None
-            })
-        
-        # Search subcategories - Remove is_active filters if they don't exist
-        try:
-            subcategories = SubCategory.objects.filter(
-                name__icontains=query
-            ).select_related('category').distinct()[:5]
-        except:
-            # Fallback if is_active field doesn't exist
-            subcategories = SubCategory.objects.filter(
-                name__icontains=query
-            ).select_related('category').distinct()[:5]
-        
-        for subcategory in subcategories:
-            suggestions.append({
-                'name': f"{subcategory.name}",
-                'type': 'subcategory', 
-                'type_display': f"in {subcategory.category.name}",
-                'url': f"{reverse('listings')}?category={subcategory.category.id}&subcategory={subcategory.id}",
-                'category_id': subcategory.category.id,
-                'subcategory_id': subcategory.id
-            })
-        
-        # Search product names (from listings) - if Listing model exists
-        try:
-            products = Listing.objects.filter(
-                title__icontains=query
-            ).select_related('category', 'subcategory').distinct()[:3]
-            
-            for product in products:
-                url = f"{reverse('listings')}?category={product.category.id}"
-                if hasattr(product, 'subcategory') and product.subcategory:
-                    url += f"&subcategory={product.subcategory.id}"
-                
-                suggestions.append({
-                    'name': product.title,
-                    'type': 'product',
-                    'type_display': f"Product in {product.category.name}",
-                    'url': url,
-                    'category_id': product.category.id,
-                    'subcategory_id': product.subcategory.id if hasattr(product, 'subcategory') and product.subcategory else None
-                })
-        except:
-            # If Listing model doesn't exist or has different structure, skip products
-            pass
-        
-        # Remove duplicates based on URL and limit results
-        unique_suggestions = []
-        seen_urls = set()
-        
-        for suggestion in suggestions:
-            if suggestion['url'] not in seen_urls:
-                unique_suggestions.append(suggestion)
-                seen_urls.add(suggestion['url'])
-        
-        # Limit to 8 suggestions total
-        unique_suggestions = unique_suggestions[:8]
-        
-        # Debug: Add some test data if no suggestions found
-        if not unique_suggestions and query:
-            # For debugging - you can remove this after confirming it works
-            unique_suggestions.append({
-                'name': f"Search results for '{query}'",
-                'type': 'search',
-                'type_display': 'General Search',
-                'url': f"{reverse('listings')}?search={query}",
-                'category_id': None,
-                'subcategory_id': None
-            })
-        
-        return JsonResponse({
-            'suggestions': unique_suggestions,
-            'total': len(unique_suggestions),
-            'query': query  # For debugging
-        })
-        
-    except Exception as e:
-        # Better error handling for debugging
-        return JsonResponse({
-            'suggestions': [],
-            'error': str(e),
-            'query': query
-        })
-
+    suggestions = await aget_suggestions(query)
+    return JsonResponse({
+        'suggestions': suggestions,
+        'total': len(suggestions),
+        'query': query,
+    })
 
 
 def privacy_policy(request):
@@ -160,6 +160,48 @@ document.addEventListener("DOMContentLoaded", () => {
         });
     }
 
+    // --- Facet counts ---
+    function renderFacets(facets) {
+        if (!facets) return;
+
+        const categoryCounts = {};
+        facets.categories.forEach((category) => {
+            categoryCounts[category.id] = category.count;
+        });
+        document.querySelectorAll(".category-btn").forEach((btn) => {
+            const badge = btn.querySelector("[data-facet-count]");
+            if (!badge) return;
+            const count = categoryCounts[btn.dataset.category];
+            badge.textContent = count === undefined ? "" : `(${count})`;
+        });
+
+        const conditionSelect = filterForm?.querySelector("select[name='condition']");
+        facets.conditions.forEach((condition) => {
+            const option = conditionSelect?.querySelector(`option[value='${condition.value}']`);
+            if (option) option.textContent = `${condition.label} (${condition.count})`;
+        });
+
+        const buckets = $("price-buckets");
+        if (!buckets || !filterForm) return;
+        buckets.innerHTML = "";
+        facets.price_buckets.forEach((bucket) => {
+            const chip = document.createElement("button");
+            chip.type = "button";
+            chip.className = "filter-badge";
+            chip.disabled = bucket.count === 0;
+            chip.textContent = `${bucket.label} (${bucket.count})`;
+            chip.addEventListener("click", () => {
+                // Buckets exclude their upper bound, the max price filter includes it
+                filterForm.elements.min_price.value = bucket.min ?? "";
+                filterForm.elements.max_price.value =
+                    bucket.max === null ? "" : (bucket.max - 0.01).toFixed(2);
+                updateActiveFilters();
+                applyFilters();
+            });
+            buckets.appendChild(chip);
+        });
+    }
+
     // --- Apply filters ---
     function applyFilters() {
         if (!filterForm) return;
@@ -187,6 +229,7 @@ document.addEventListener("DOMContentLoaded", () => {
             .then((data) => {
                 listingsContainer.innerHTML = data.listings_html;
                 listingsContainer.classList.remove("loading");
+                renderFacets(data.facets);
 
                 const url = new URL(window.location);
                 url.search = params.toString();
@@ -218,6 +261,8 @@ document.addEventListener("DOMContentLoaded", () => {
         });
     }
     updateActiveFilters();
+    const initialFacets = $("listing-facets");
+    if (initialFacets) renderFacets(JSON.parse(initialFacets.textContent));
 
     // --- Category scroll touch ---
     const categoriesContainer = $("categories-container");
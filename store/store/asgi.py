@@ -7,6 +7,7 @@ For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
 
+import gc
 import os
 
 from django.core.asgi import get_asgi_application
@@ -14,3 +15,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'store.settings')
 
 application = get_asgi_application()
+
+# Startup objects live forever, keep them out of full collections so they
+# don't stall requests
+gc.freeze()
@@ -28,6 +28,7 @@ INSTALLED_APPS = [
     'django.contrib.sites',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'allauth',
     'allauth.account',
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'listings.instrumentation.query_metrics_middleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -60,7 +62,7 @@ ROOT_URLCONF = 'store.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'listings.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -69,6 +71,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'listings.context_processors.taxonomy',
             ],
         },
     },
@@ -89,6 +92,75 @@ DATABASES = {
 #     }
 # }
 
+# Cache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+# Share the cache between workers and hosts when Redis is available
+REDIS_URL = config("REDIS_URL", default="")
+if REDIS_URL:
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+
+# Anonymous home, browse and detail pages are cached for this many seconds
+PAGE_CACHE_TIMEOUT = config("PAGE_CACHE_TIMEOUT", default=60, cast=int)
+
+# Typeahead results are cached per normalized query for this many seconds
+SEARCH_SUGGESTIONS_TIMEOUT = 60
+
+# Filter facet counts are cached per filter combination for this many seconds
+FACET_CACHE_TIMEOUT = 60
+# Price facet ranges, (min, max) with None for an open end
+LISTING_PRICE_BUCKETS = [(None, 1000), (1000, 5000), (5000, 20000), (20000, 100000), (100000, None)]
+
+# Related listings stored per listing (the detail page shows 4, the rest
+# stand in for ones sold before the nightly refresh_related_listings)
+RELATED_LISTINGS_COUNT = 8
+
+# Listing views are buffered per worker and written every this many seconds
+VIEW_COUNT_FLUSH_INTERVAL = config("VIEW_COUNT_FLUSH_INTERVAL", default=30, cast=int)
+# Repeat views by the same session/IP within this many seconds count once
+VIEW_COUNT_DEDUP_WINDOW = 30 * 60
+
+# Listing photos are staged here and uploaded by a background thread pool
+IMAGE_STAGING_ROOT = config("IMAGE_STAGING_ROOT", default=str(BASE_DIR / 'staging'))
+IMAGE_UPLOAD_BACKEND = 'listings.uploads.CloudinaryUploadBackend'
+IMAGE_UPLOAD_WORKERS = config("IMAGE_UPLOAD_WORKERS", default=4, cast=int)
+IMAGE_UPLOAD_MAX_ATTEMPTS = 3
+# Seconds before the first retry, doubled for each one after
+IMAGE_UPLOAD_RETRY_DELAY = 2
+# Seconds before process_image_uploads takes back an upload a worker claimed and never finished
+IMAGE_UPLOAD_CLAIM_TIMEOUT = 600
+# Deletes the hosted photos of archived listings, see expire_listings --purge-images
+IMAGE_DELETE_BACKEND = 'listings.uploads.CloudinaryDeleteBackend'
+
+# Days a listing may go unchanged in a status before expire_listings moves it on:
+# available listings are marked removed, sold and removed ones archived.
+# None keeps them. LISTING_RETENTION_CATEGORY_DAYS overrides these per category slug,
+# e.g. {'vehicles': {'sold': 180}}.
+LISTING_RETENTION_DAYS = {'available': None, 'sold': 90, 'removed': 30}
+LISTING_RETENTION_CATEGORY_DAYS = {}
+
+# Most queries a request to each URL name may run, or {'queries': n, 'sql_ms': ms}.
+# Going over fails the test suite and logs a warning in production.
+QUERY_BUDGETS = {
+    'home': 6,
+    'listings': 7,
+    'filter_listings': 7,
+    'listing_detail': 8,
+    'my_listings': 9,
+    'search_suggestions': 4,
+    'get_subcategories': 3,
+    'api_listings': 4,
+}
+QUERY_BUDGET_STRICT = config("QUERY_BUDGET_STRICT", default=False, cast=bool)
+TEST_RUNNER = 'listings.test_runner.BudgetTestRunner'
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},